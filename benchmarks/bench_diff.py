@@ -0,0 +1,61 @@
+# benchmarks/bench_diff.py
+
+"""
+Benchmark the vectorized register diff against the original row-wise implementation.
+
+Usage:
+    python -m benchmarks.bench_diff --rows 100000 200000 --churn 0.01
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_register, apply_churn
+from config.constants import ORGANIZATION_NAME
+from extraction.compare_csv import diff_registers, get_new_sponsors
+
+
+def legacy_get_new_sponsors(df_latest: pd.DataFrame, df_previous: pd.DataFrame) -> list[dict]:
+    """The set-of-tuples + DataFrame.apply implementation this benchmark compares against."""
+    latest_set = set(zip(df_latest[ORGANIZATION_NAME].astype(str), df_latest['Route'].astype(str)))
+    previous_set = set(zip(df_previous[ORGANIZATION_NAME].astype(str), df_previous['Route'].astype(str)))
+    new_entries = latest_set - previous_set
+    new_sponsors_df = df_latest[df_latest.apply(
+        lambda row: (str(row[ORGANIZATION_NAME]), str(row['Route'])) in new_entries, axis=1
+    )]
+    return new_sponsors_df.to_dict(orient='records')
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--churn", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy added (s)':>17} {'vector added (s)':>17} {'3-way diff (s)':>15} {'speed-up':>9}")
+    for rows in args.rows:
+        previous = generate_register(rows).fillna("Unknown")
+        latest = apply_churn(previous, churn=args.churn).fillna("Unknown")
+
+        assert len(legacy_get_new_sponsors(latest, previous)) == len(get_new_sponsors(latest, previous))
+
+        legacy = best_of(lambda: legacy_get_new_sponsors(latest, previous), args.repeat)
+        vector = best_of(lambda: get_new_sponsors(latest, previous), args.repeat)
+        three_way = best_of(lambda: diff_registers(latest, previous), args.repeat)
+        print(f"{rows:>10} {legacy:>17.3f} {vector:>17.3f} {three_way:>15.3f} {legacy / vector:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
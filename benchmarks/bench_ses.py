@@ -0,0 +1,84 @@
+# benchmarks/bench_ses.py
+
+"""
+Benchmark SES sending in messages/second against moto's local SES stub:
+the original path (a new boto3 client and one send_email call per message) vs the
+cached client sending each pre-encoded message, vs bulk templated sends of up to 50
+destinations per call. moto measures client and request overhead, not SES latency.
+Needs moto (pip install "moto[ses]").
+
+Usage:
+    python -m benchmarks.bench_ses --messages 500 2000
+"""
+
+import os
+import time
+import argparse
+
+import boto3
+from moto import mock_aws
+
+from outreach.renderer import OutreachRenderer
+from outreach.ses_transport import SESTransport, ses_client
+from outreach.smtp_pool import EncodedMessage
+
+SOURCE = "outreach@example.com"
+
+
+def legacy_send_email_ses(to: str, subject: str, html: str):
+    """The per-call client construction this benchmark compares against."""
+    client = boto3.client(
+        "ses",
+        region_name=os.getenv("AWS_REGION"),
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    )
+    client.send_email(
+        Source=SOURCE,
+        Destination={"ToAddresses": [to], "CcAddresses": [], "BccAddresses": []},
+        Message={"Subject": {"Data": subject, "Charset": "UTF-8"},
+                 "Body": {"Html": {"Data": html, "Charset": "UTF-8"}}},
+    )
+
+
+def rendered(count: int):
+    renderer = OutreachRenderer(SOURCE, cache_dir=None)
+    sponsors = [{"Organisation Name": f"Sponsor {i} Ltd", "Route": "Skilled Worker",
+                 "email": f"hr{i}@sponsor{i}.example", "hr_director": f"Contact {i}"} for i in range(count)]
+    return renderer, [message for batch in renderer.render_batches(sponsors) for message in batch]
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[500])
+    args = parser.parse_args()
+
+    for name, value in {"AWS_REGION": "eu-west-2", "AWS_ACCESS_KEY_ID": "testing",
+                        "AWS_SECRET_ACCESS_KEY": "testing"}.items():
+        os.environ.setdefault(name, value)
+
+    print(f"{'messages':>9} {'client/message msg/s':>21} {'cached raw msg/s':>17} {'bulk msg/s':>11} {'speed-up':>9}")
+    with mock_aws():
+        ses_client.cache_clear()
+        ses_client().verify_email_identity(EmailAddress=SOURCE)
+        for count in args.messages:
+            renderer, messages = rendered(count)
+            transport = SESTransport(SOURCE, renderer=renderer)
+            transport.templates()
+
+            legacy = timed(lambda: [legacy_send_email_ses(m["to"], m["subject"], m["html"]) for m in messages])
+            raw = timed(lambda: [transport.send(EncodedMessage(m["to"], SOURCE, m["raw"])) for m in messages])
+            bulk = timed(lambda: transport.send_bulk(messages))
+            print(f"{count:>9} {count / legacy:>21.0f} {count / raw:>17.0f} {count / bulk:>11.0f} "
+                  f"{legacy / bulk:>8.1f}x")
+    ses_client.cache_clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# benchmarks/bench_smtp.py
+
+"""
+Benchmark outreach sending in messages/second against a local aiosmtpd stand-in:
+a new connection per message (what send_email_native() does) vs the pooled sender,
+and the pooled sender draining the outreach outbox (SQLite bookkeeping included).
+Needs aiosmtpd (pip install aiosmtpd). Optional --latency adds a delay to every SMTP
+command the stand-in answers, to approximate a remote relay.
+
+Usage:
+    python -m benchmarks.bench_smtp --messages 500 --pool-size 1 4 8 --latency 0.005
+"""
+
+import time
+import socket
+import asyncio
+import smtplib
+import argparse
+import tempfile
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP
+
+from outreach.outbox import Outbox, OutboxDispatcher
+from outreach.outreach_runner import render_outreach_html
+from outreach.smtp_pool import SMTPPool, build_message
+
+
+class SlowSMTP(SMTP):
+    """aiosmtpd server that waits `latency` seconds before answering each command."""
+
+    latency = 0.0
+
+    async def push(self, status):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await super().push(status)
+
+
+class SinkHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+class SlowController(Controller):
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+
+    def factory(self):
+        server = SlowSMTP(self.handler, **self.SMTP_kwargs)
+        server.latency = self.latency
+        return server
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def personalised_messages(count: int):
+    return [
+        build_message(
+            to=f"hr{i}@sponsor{i}.example",
+            subject=f"UK Sponsor Licence Opportunity – Sponsor {i} Ltd",
+            html=render_outreach_html(f"Contact {i}", f"Sponsor {i} Ltd"),
+            from_email="outreach@example.com",
+        )
+        for i in range(count)
+    ]
+
+
+def send_unpooled(host: str, port: int, messages) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        with smtplib.SMTP(host, port) as server:
+            server.sendmail(message["From"], [message["To"]], message.as_string())
+    return time.perf_counter() - start
+
+
+def send_pooled(host: str, port: int, messages, size: int) -> float:
+    start = time.perf_counter()
+    with SMTPPool(host, port, from_email="outreach@example.com", size=size, starttls=False) as pool:
+        results = pool.send_many(messages)
+    elapsed = time.perf_counter() - start
+    assert all(result["status"] == "sent" for result in results)
+    return elapsed
+
+
+def send_via_outbox(host: str, port: int, messages, size: int) -> float:
+    rows = [{"dedupe_key": str(i), "to": m["To"], "from_email": m["From"], "subject": m["Subject"],
+             "html": m.get_payload()[0].get_payload(decode=True).decode()} for i, m in enumerate(messages)]
+    with tempfile.TemporaryDirectory() as tmp, Outbox(f"{tmp}/outbox.sqlite3") as outbox:
+        outbox.enqueue(rows)
+        start = time.perf_counter()
+        with SMTPPool(host, port, from_email="outreach@example.com", size=size, starttls=False) as pool:
+            stats = OutboxDispatcher(outbox, [pool], rates={"smtp": None}).run()
+        elapsed = time.perf_counter() - start
+    assert stats["sent"] == len(messages)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--pool-size", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every SMTP reply")
+    args = parser.parse_args()
+
+    handler = SinkHandler()
+    controller = SlowController(handler, hostname="127.0.0.1", port=free_port(), latency=args.latency)
+    controller.start()
+    try:
+        host, port = controller.hostname, controller.port
+        messages = personalised_messages(args.messages)
+
+        print(f"{'sender':>22} {'messages':>9} {'seconds':>8} {'msg/s':>8} {'speed-up':>9}")
+        unpooled = send_unpooled(host, port, messages)
+        print(f"{'connection/message':>22} {len(messages):>9} {unpooled:>8.2f} {len(messages) / unpooled:>8.0f} {'1.0x':>9}")
+        for size in args.pool_size:
+            pooled = send_pooled(host, port, messages, size)
+            print(f"{f'pool of {size}':>22} {len(messages):>9} {pooled:>8.2f} {len(messages) / pooled:>8.0f} "
+                  f"{unpooled / pooled:>8.1f}x")
+        size = max(args.pool_size)
+        drained = send_via_outbox(host, port, messages, size)
+        print(f"{f'outbox, pool of {size}':>22} {len(messages):>9} {drained:>8.2f} {len(messages) / drained:>8.0f} "
+              f"{unpooled / drained:>8.1f}x")
+        assert handler.received == len(messages) * (2 + len(args.pool_size))
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
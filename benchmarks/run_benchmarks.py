@@ -0,0 +1,188 @@
+# benchmarks/run_benchmarks.py
+
+"""
+Stage-level benchmark suite for the sponsor pipeline.
+
+Generates synthetic registers (see benchmarks.synthetic) at each requested size, then times
+and memory-profiles every stage that scales with the register or with the day's churn:
+preprocessing, diffing, enrichment, Salesforce record building and outreach rendering.
+Results are written as JSON; pass --baseline to fail when a stage regresses.
+
+Usage:
+    python -m benchmarks.run_benchmarks --rows 10000 100000 1000000 --churn 0.01
+    python -m benchmarks.run_benchmarks --rows 100000 --baseline data/logs/benchmarks/previous.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from benchmarks.synthetic import generate_register, apply_churn
+from config.constants import PREPROCESS_CHUNK_SIZE
+from crm.sync_crm import build_salesforce_records
+from enrichment.cache import EnrichmentCache
+from enrichment.enrich_batch import enrich_companies
+from enrichment.enrich_company import MockProvider
+from extraction.compare_csv import get_new_sponsors, diff_registers
+from extraction.parse_sponsors import preprocess_sponsor_data
+from outreach.outreach_runner import render_outreach_html
+from outreach.renderer import company_name, contact_name
+
+BENCHMARK_DIR = './data/logs/benchmarks'
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process so far, in MB (0 where unavailable).
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(func: Callable, rows_in: int, repeat: int = 1, memory: bool = True) -> Dict:
+    """
+    Run func() `repeat` times and report the best wall/CPU time, throughput,
+    and (on a separate traced run) peak Python-allocated memory.
+    """
+    best_wall, best_cpu, result = None, None, None
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func()
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        if best_wall is None or wall < best_wall:
+            best_wall, best_cpu = wall, cpu
+
+    stats = {
+        "rows_in": rows_in,
+        "rows_out": len(result) if hasattr(result, "__len__") else None,
+        "wall_s": round(best_wall, 4),
+        "cpu_s": round(best_cpu, 4),
+        "rows_per_s": round(rows_in / best_wall, 1) if best_wall else None,
+    }
+
+    if memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats["peak_traced_mb"] = round(peak / (1024 * 1024), 2)
+
+    stats["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return stats
+
+
+def run_size(rows: int, churn: float, repeat: int, memory: bool, workdir: str) -> Dict[str, Dict]:
+    """
+    Benchmark every stage for one register size.
+    """
+    previous_raw = generate_register(rows, seed=rows)
+    latest_raw = apply_churn(previous_raw, churn=churn, seed=rows + 1)
+    csv_path = os.path.join(workdir, f"register_{rows}.csv")
+    latest_raw.to_csv(csv_path, index=False)
+
+    previous_path = os.path.join(workdir, f"register_{rows}_previous.csv")
+    previous_raw.to_csv(previous_path, index=False)
+    df_previous = preprocess_sponsor_data(previous_path, chunksize=PREPROCESS_CHUNK_SIZE)
+    df_latest = preprocess_sponsor_data(csv_path, chunksize=PREPROCESS_CHUNK_SIZE)
+
+    new_sponsors = get_new_sponsors(df_latest, df_previous)
+    # A throwaway cache, so benchmarks never read or fill the pipeline's enrichment cache
+    cache = EnrichmentCache(os.path.join(workdir, f"enrichment_cache_{rows}.sqlite3"))
+    # Mock enrichment only: the website scraper would benchmark the internet, not the pipeline
+    providers = [MockProvider()]
+    enriched = enrich_companies(new_sponsors, providers=providers, cache=cache)
+
+    stages = {
+        "preprocess_full": (lambda: preprocess_sponsor_data(csv_path), len(latest_raw)),
+        "preprocess_chunked": (lambda: preprocess_sponsor_data(csv_path, chunksize=PREPROCESS_CHUNK_SIZE),
+                               len(latest_raw)),
+        "get_new_sponsors": (lambda: get_new_sponsors(df_latest, df_previous), len(df_latest)),
+        "diff_registers": (lambda: diff_registers(df_latest, df_previous)["added"], len(df_latest)),
+        "enrich_companies": (lambda: enrich_companies(new_sponsors, providers=providers, cache=cache),
+                             len(new_sponsors)),
+        "salesforce_records": (lambda: build_salesforce_records(enriched), len(enriched)),
+        "outreach_render": (lambda: [render_outreach_html(contact_name(s), company_name(s)) for s in enriched],
+                            len(enriched)),
+    }
+
+    results = {}
+    try:
+        for name, (func, rows_in) in stages.items():
+            results[name] = measure(func, rows_in, repeat=repeat, memory=memory)
+            print(f"  {name:<20} {results[name]['wall_s']:>9.3f}s  {results[name]['rows_per_s'] or 0:>12,.0f} rows/s"
+                  f"  {results[name].get('peak_traced_mb', 0):>8.1f} MB")
+    finally:
+        cache.close()
+    return results
+
+
+def find_regressions(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compare wall times against a baseline report; return a description of each regression.
+    """
+    regressions = []
+    for size, stages in current["results"].items():
+        for stage, stats in stages.items():
+            before = baseline.get("results", {}).get(size, {}).get(stage)
+            if before and before["wall_s"] > 0 and stats["wall_s"] > before["wall_s"] * (1 + tolerance):
+                regressions.append(f"{stage} @ {size} rows: {before['wall_s']:.3f}s -> {stats['wall_s']:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--churn", type=float, default=0.01, help="Fraction of rows added/removed/changed per day")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced-memory run of each stage")
+    parser.add_argument("--output", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "churn": args.churn,
+        "repeat": args.repeat,
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            print(f"📏 {rows:,} rows")
+            report["results"][str(rows)] = run_size(rows, args.churn, args.repeat, not args.no_memory, workdir)
+
+    output = args.output or os.path.join(BENCHMARK_DIR, f"benchmark-{datetime.now():%Y-%m-%d_%H-%M-%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Report written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"⚠️ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
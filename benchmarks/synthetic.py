@@ -0,0 +1,91 @@
+# benchmarks/synthetic.py
+
+"""
+Synthetic sponsor register generator for benchmarks.
+Produces frames with the same columns as config.constants.FILE_COLS, at any size,
+and applies configurable day-to-day churn (additions, removals, rating changes).
+"""
+
+import numpy as np
+import pandas as pd
+
+from config.constants import ORGANIZATION_NAME
+
+NAME_WORDS = [
+    "Abbey", "Albion", "Apex", "Arden", "Ash", "Atlas", "Avon", "Bay", "Beacon", "Birch", "Bridge", "Bright",
+    "Brook", "Cedar", "Central", "Chapel", "Clear", "Coast", "Crown", "Dale", "Delta", "Eagle", "East", "Elm",
+    "Empire", "Falcon", "Fern", "First", "Fox", "Global", "Golden", "Green", "Harbour", "Hart", "Heath", "Highland",
+    "Horizon", "Island", "Ivy", "Kings", "Lake", "Lion", "Maple", "Meadow", "Metro", "Mill", "North", "Oak",
+    "Orchard", "Park", "Peak", "Pine", "Prime", "Quay", "Queens", "Red", "River", "Rose", "Royal", "Silver",
+    "South", "Star", "Stone", "Summit", "Sun", "Swan", "Thames", "Tower", "Union", "Vale", "Valley", "West",
+    "Willow", "Wolf", "York",
+]
+NAME_NOUNS = [
+    "Care", "Consulting", "Construction", "Dental", "Engineering", "Foods", "Health", "Homes", "Hospitality",
+    "Logistics", "Media", "Medical", "Motors", "Nursing", "Partners", "Pharmacy", "Properties", "Recruitment",
+    "Restaurants", "Retail", "Services", "Solutions", "Systems", "Technologies", "Trading", "Travel", "Ventures",
+]
+SUFFIXES = ["Ltd", "Limited", "LLP", "PLC", "Group Ltd", "UK Ltd", "Holdings Limited"]
+TOWNS = [
+    "London", "Birmingham", "Manchester", "Leeds", "Glasgow", "Liverpool", "Bristol", "Sheffield", "Edinburgh",
+    "Cardiff", "Leicester", "Coventry", "Nottingham", "Newcastle Upon Tyne", "Belfast", "Brighton", "Reading",
+    "Milton Keynes", "Oxford", "Cambridge", "Slough", "Luton", "Bradford", "Southampton", "Aberdeen",
+]
+COUNTIES = ["Greater London", "West Midlands", "Greater Manchester", "West Yorkshire", "Kent", "Essex", "Surrey",
+            "Hampshire", "Lancashire", "Berkshire"]
+RATINGS = ["Worker (A rating)", "Worker (A (SME+))", "Worker (B rating)", "Temporary Worker (A rating)",
+           "Worker (A (Premium))"]
+RATING_WEIGHTS = [0.78, 0.1, 0.02, 0.08, 0.02]
+ROUTES = [
+    "Skilled Worker", "Global Business Mobility: Senior or Specialist Worker", "Creative Worker", "Charity Worker",
+    "Religious Worker", "Scale-up", "Seasonal Worker", "Government Authorised Exchange", "International Sportsperson",
+]
+ROUTE_WEIGHTS = [0.86, 0.06, 0.03, 0.015, 0.015, 0.01, 0.005, 0.004, 0.001]
+
+
+def generate_register(rows: int, seed: int = 0, start_id: int = 0) -> pd.DataFrame:
+    """
+    Generate a raw-looking register with `rows` entries.
+    County is mostly missing and a few towns are blank, as in the published CSV.
+    Organisation names carry a numeric discriminator so keys are unique.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(start_id, start_id + rows)
+
+    words = rng.choice(NAME_WORDS, rows)
+    nouns = rng.choice(NAME_NOUNS, rows)
+    suffixes = rng.choice(SUFFIXES, rows)
+    names = [f"{w} {n} {i} {s}" for w, n, i, s in zip(words, nouns, ids, suffixes)]
+
+    towns = rng.choice(TOWNS, rows).astype(object)
+    towns[rng.random(rows) < 0.01] = np.nan
+    counties = rng.choice(COUNTIES, rows).astype(object)
+    counties[rng.random(rows) < 0.7] = np.nan
+
+    return pd.DataFrame({
+        ORGANIZATION_NAME: names,
+        "Town/City": towns,
+        "County": counties,
+        "Type & Rating": rng.choice(RATINGS, rows, p=RATING_WEIGHTS),
+        "Route": rng.choice(ROUTES, rows, p=ROUTE_WEIGHTS),
+    })
+
+
+def apply_churn(df: pd.DataFrame, churn: float = 0.01, seed: int = 1) -> pd.DataFrame:
+    """
+    Produce "tomorrow's" register from `df`: a `churn` fraction of rows is split evenly
+    between removals, rating changes and brand-new sponsors.
+    """
+    rng = np.random.default_rng(seed)
+    per_kind = int(len(df) * churn / 3)
+
+    keep = np.ones(len(df), dtype=bool)
+    keep[rng.choice(len(df), per_kind, replace=False)] = False
+    next_day = df[keep].copy()
+
+    changed = rng.choice(len(next_day), min(per_kind, len(next_day)), replace=False)
+    rating_col = next_day.columns.get_loc("Type & Rating")
+    next_day.iloc[changed, rating_col] = "Worker (B rating)"
+
+    added = generate_register(per_kind, seed=seed + 1000, start_id=len(df) * 10)
+    return pd.concat([next_day, added], ignore_index=True)
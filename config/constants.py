@@ -2,4 +2,170 @@
 ORGANIZATION_NAME = "Organisation Name"
 FILE_COLS = {ORGANIZATION_NAME, 'Town/City', 'County', 'Type & Rating', 'Route'}
 REQUIRED_COLS = {ORGANIZATION_NAME, 'Route'}
-ARCHIVE_DIR = './data/archive'
\ No newline at end of file
+# Ordered key columns identifying a register entry, and the per-field diff column
+KEY_COLS = [ORGANIZATION_NAME, 'Route']
+CHANGES_COL = 'Changes'
+
+# Rename detection: previous name of a matched sponsor and its similarity score
+PREVIOUS_NAME_COL = 'Previous Organisation Name'
+MATCH_SCORE_COL = 'Match Score'
+ARCHIVE_DIR = './data/archive'
+RAW_DIR = './data/raw'
+
+# Columnar snapshots of the cleaned register, stored in ARCHIVE_DIR
+SNAPSHOT_EXTENSION = '.parquet'
+CATEGORICAL_COLS = ['Town/City', 'County', 'Type & Rating', 'Route']
+
+# Snapshot catalog and its default retention policy (each overridable via env var of the same name)
+SNAPSHOT_CATALOG = './data/archive/snapshot_catalog.sqlite3'
+SNAPSHOT_KEEP_LAST = 30
+SNAPSHOT_WEEKLY_AFTER_DAYS = 30
+SNAPSHOT_MAX_AGE_DAYS = 365
+
+# Rows per chunk when streaming the register through preprocessing
+PREPROCESS_CHUNK_SIZE = 50_000
+
+# Download manifest: ETag / Last-Modified / content hash per fetched URL
+DOWNLOAD_MANIFEST = './data/raw/download_manifest.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per-run JSON reports and optional stage profiles
+RUN_REPORT_DIR = './data/logs/runs'
+PROFILE_DIR = './data/logs/profiles'
+
+# Stage checkpoints for resumable runs
+CHECKPOINT_DIR = './data/temp/checkpoints'
+CHECKPOINT_KEEP_RUNS = 7
+
+# Append-only change history: one baseline snapshot plus a compressed segment per daily diff
+CHANGELOG_DIR = './data/archive/changelog'
+
+# Async enrichment engine: companies in flight, per-call timeout and retry/backoff policy
+ENRICH_CONCURRENCY = 32
+ENRICH_TIMEOUT_S = 10
+ENRICH_MAX_RETRIES = 3
+ENRICH_BACKOFF_BASE_S = 0.5
+ENRICH_BACKOFF_MAX_S = 30
+
+# Persistent enrichment cache: per-field TTLs (days) and LRU size bound (entries = org × provider)
+ENRICH_CACHE_DB = './data/enriched/enrichment_cache.sqlite3'
+ENRICH_CACHE_MAX_ENTRIES = 200_000
+ENRICH_CACHE_DEFAULT_TTL_DAYS = 30
+ENRICH_CACHE_EMPTY_TTL_DAYS = 7
+ENRICH_CACHE_FIELD_TTL_DAYS = {
+    'email': 30, 'phone': 60, 'hr_director': 60, 'owner': 90, 'website': 180, 'industry': 365,
+}
+
+# Waterfall router: fields a sponsor record needs, latency window per provider, hedging policy
+ENRICH_REQUIRED_FIELDS = ['email', 'phone', 'website', 'industry', 'owner', 'hr_director']
+ENRICH_LATENCY_WINDOW = 200
+ENRICH_HEDGE_MIN_SAMPLES = 20
+ENRICH_HEDGE_QUANTILE = 0.95
+# Seconds of median latency that weigh as much as one unit of provider cost when ranking
+ENRICH_ROUTER_LATENCY_WEIGHT = 1.0
+
+# Bulk enrichment providers: micro-batch bounds and async job polling
+ENRICH_BULK_BATCH_SIZE = 200
+ENRICH_BULK_MAX_WAIT_S = 0.5
+ENRICH_BULK_POLL_S = 1.0
+ENRICH_BULK_POLL_MAX_S = 15
+ENRICH_BULK_JOB_TIMEOUT_S = 600
+
+# Website discovery and contact scraping
+SCRAPER_USER_AGENT = 'SponsorReachBot/1.0 (+https://github.com/MdSamsuzzohaShayon/sponsor-reach)'
+SCRAPER_MAX_PAGES = 4
+SCRAPER_PER_DOMAIN_CONCURRENCY = 2
+SCRAPER_TIMEOUT_S = 30
+SCRAPER_PARSE_WORKERS = 2
+# Bytes read from a page at most; the rest of a larger body is ignored
+SCRAPER_MAX_BYTES = 2 * 1024 * 1024
+# Whether the default enrichment providers include the website scraper (env ENRICH_WEBSITE_SCRAPER=true turns it on)
+ENRICH_WEBSITE_SCRAPER = False
+
+# Date-partitioned store of enriched records; later stages read it in batches of this size
+ENRICHED_DIR = './data/enriched'
+ENRICHED_BATCH_SIZE = 200
+
+# Pooled SMTP sending: persistent sessions, recycled after this many messages each
+SMTP_POOL_SIZE = 4
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+SMTP_TIMEOUT_S = 30
+
+# Outreach outbox: SQLite queue drained at a per-provider send rate (messages/second),
+# with jittered retries until a message is dead-lettered. The campaign name is part of
+# every dedupe key; a new campaign may contact the same sponsors again.
+OUTREACH_CAMPAIGN = 'sponsor-licence'
+OUTBOX_DB = './data/outreach/outbox.sqlite3'
+OUTBOX_SEND_RATE = {'smtp': 10.0, 'ses': 14.0}
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_S = 2.0
+OUTBOX_RETRY_MAX_S = 300
+OUTBOX_CLAIM_BATCH = 500
+
+# Outreach rendering: template location, on-disk bytecode cache, render batch size, and
+# subject/body variants. The first variant whose patterns (case-insensitive regexes on the
+# template context: route, town, rating) all match a sponsor is used; the last one is the default.
+OUTREACH_TEMPLATE_DIR = './outreach/email_templates'
+OUTREACH_TEMPLATE_CACHE_DIR = './data/temp/template_cache'
+OUTREACH_RENDER_BATCH = 500
+OUTREACH_VARIANTS = [
+    {'name': 'global-business-mobility', 'match': {'route': r'global business mobility'},
+     'subject': 'Supporting {{ company_name }} on the Global Business Mobility route',
+     'template': 'outreach_global_mobility.html'},
+    {'name': 'london', 'match': {'town': r'^london$'},
+     'subject': 'UK Sponsor Licence support for {{ company_name }} in London',
+     'template': 'outreach_template.html'},
+    {'name': 'default', 'subject': 'UK Sponsor Licence Opportunity – {{ company_name }}',
+     'template': 'outreach_template.html'},
+]
+
+# Daily pipeline stages that email sponsors or write to Salesforce; off until the credentials are
+# configured (env OUTREACH_ENABLED=true / CRM_SYNC_ENABLED=true turns them on)
+OUTREACH_ENABLED = False
+CRM_SYNC_ENABLED = False
+
+# Outreach provider ('smtp' or 'ses'); SES bulk sends take at most 50 destinations per call
+OUTREACH_PROVIDER = 'smtp'
+SES_BULK_MAX_DESTINATIONS = 50
+SES_TEMPLATE_PREFIX = 'sponsor-reach'
+SES_MAX_CONCURRENCY = 10
+
+# Cross-run suppression of contacted, unsubscribed and bounced addresses and company domains.
+# Free-mail domains and shared organisational domains (one NHS mail domain for many trusts)
+# are used by unrelated senders, so they are never suppressed as a whole.
+SUPPRESSION_DB = './data/outreach/suppression.sqlite3'
+SUPPRESSION_BLOOM_ERROR_RATE = 0.001
+FREE_MAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'outlook.com', 'hotmail.com', 'hotmail.co.uk', 'live.com', 'live.co.uk',
+    'yahoo.com', 'yahoo.co.uk', 'icloud.com', 'me.com', 'aol.com', 'btinternet.com', 'sky.com',
+    'virginmedia.com', 'protonmail.com', 'proton.me', 'gmx.com', 'mail.com',
+}
+SHARED_MAIL_DOMAINS = {'nhs.net', 'nhs.scot', 'wales.nhs.uk', 'hscni.net'}
+
+# Salesforce sync: composite requests take at most 200 records each. Chunks are
+# uploaded concurrently over one keep-alive session; failed records are retried alone.
+SALESFORCE_API_VERSION = 'v63.0'
+SALESFORCE_CHUNK_SIZE = 200
+SALESFORCE_SYNC_WORKERS = 4
+SALESFORCE_MAX_ATTEMPTS = 3
+SALESFORCE_RETRY_BASE_S = 1.0
+SALESFORCE_RETRY_MAX_S = 30
+SALESFORCE_TIMEOUT_S = 60
+
+# Salesforce Bulk API 2.0: syncs above the threshold go through CSV ingest jobs instead of
+# composite/tree requests. Each job takes at most 100 MB of CSV; job status is polled with
+# exponential backoff until it finishes or the timeout passes.
+SALESFORCE_BULK_THRESHOLD = 2000
+SALESFORCE_BULK_MAX_JOB_BYTES = 100 * 1024 * 1024
+SALESFORCE_BULK_POLL_S = 1.0
+SALESFORCE_BULK_POLL_MAX_S = 30
+SALESFORCE_BULK_TIMEOUT_S = 3600
+
+# Salesforce delta sync: records are upserted on an external ID derived from organisation and
+# route, and only fields that changed since the last successful sync are sent. Removed sponsors
+# are archived by setting the archive fields; records carry the active fields while listed.
+SALESFORCE_OBJECT = 'Organization_Contracts__c'
+SALESFORCE_EXTERNAL_ID_FIELD = 'Sponsor_Key__c'
+SALESFORCE_ACTIVE_FIELDS = {'Status__c': 'Active'}
+SALESFORCE_ARCHIVE_FIELDS = {'Status__c': 'Archived'}
+SALESFORCE_SYNC_STATE_DB = './data/crm/sync_state.sqlite3'
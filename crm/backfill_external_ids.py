@@ -0,0 +1,113 @@
+# crm/backfill_external_ids.py
+
+"""
+One-off backfill of external IDs on Salesforce records created before the sync upserted on
+them (the first syncs inserted Organization_Contracts__c records without Sponsor_Key__c).
+Every such record gets the external ID the sync now derives from its organisation and
+route, and its current field values are saved in the sync state, so the next sync updates
+it in place (sending only what changed) instead of inserting a duplicate, and archiving
+finds it when its sponsor leaves the register.
+
+Run it once, before the first sync on external IDs:
+
+    python -m crm.backfill_external_ids
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from config.constants import SALESFORCE_API_VERSION, SALESFORCE_OBJECT, SALESFORCE_EXTERNAL_ID_FIELD
+from crm.salesforce_api import SalesforceSession
+from crm.sync_crm import build_salesforce_records, external_id, record_fields, update_by_id
+from crm.sync_state import SyncState
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+QUERY_PATH = f"data/{SALESFORCE_API_VERSION}/query"
+# The fields the sync writes, besides the external ID itself
+SYNCED_FIELDS = [field for field in record_fields(build_salesforce_records([{}])[0])
+                 if field != SALESFORCE_EXTERNAL_ID_FIELD]
+
+
+def unkeyed_records(session: SalesforceSession) -> List[Dict]:
+    """
+    All records without an external ID, with the fields the sync writes, following query pages.
+    """
+    soql = (f"SELECT Id, {', '.join(SYNCED_FIELDS)} FROM {SALESFORCE_OBJECT} "
+            f"WHERE {SALESFORCE_EXTERNAL_ID_FIELD} = null ORDER BY CreatedDate")
+    response = session.request("GET", QUERY_PATH, params={"q": soql})
+    records = []
+    while True:
+        response.raise_for_status()
+        page = response.json()
+        records += page["records"]
+        if page.get("done", True):
+            return records
+        # nextRecordsUrl is "/services/data/vXX.X/query/<cursor>"
+        response = session.request("GET", "data/" + page["nextRecordsUrl"].partition("/data/")[2])
+
+
+def backfill_external_ids(session: Optional[SalesforceSession] = None,
+                          state: Optional[SyncState] = None) -> Dict[str, int]:
+    """
+    Set the external ID on records that have none and save them in the sync state.
+    When several records share an organisation and route (the old sync inserted a sponsor
+    again on every run), the oldest one is keyed and the others are left for review, as is
+    a record whose external ID the sync has already given to another one.
+
+    Returns:
+        Dict[str, int]: {"backfilled", "duplicates", "failed"}.
+    """
+    owns_session = session is None
+    if owns_session:
+        session = SalesforceSession()
+    owns_state = state is None
+    if owns_state:
+        state = SyncState()
+
+    try:
+        by_key: Dict[str, Dict] = {}
+        duplicates = []
+        for record in unkeyed_records(session):
+            key = external_id({"organization": record.get("Organization__c"), "route": record.get("Route__c")})
+            if key in by_key:
+                duplicates.append(record["Id"])
+            else:
+                by_key[key] = record
+        already_synced = state.get(list(by_key))
+        duplicates += [by_key.pop(key)["Id"] for key in already_synced]
+
+        stats = {"backfilled": 0, "duplicates": len(duplicates), "failed": 0}
+        failures, saved = [], []
+        updates = [{"Id": record["Id"], SALESFORCE_EXTERNAL_ID_FIELD: key} for key, record in by_key.items()]
+        for (key, record), result in zip(by_key.items(), update_by_id(session, updates)):
+            if result.get("success"):
+                fields = {field: record.get(field) for field in SYNCED_FIELDS}
+                saved.append((key, record["Id"], {SALESFORCE_EXTERNAL_ID_FIELD: key, **fields}))
+            else:
+                failures.append({"Id": record["Id"], "errors": result.get("errors", [])})
+        stats["backfilled"] = state.save(saved)
+        stats["failed"] = len(failures)
+
+        logger.info(f"🔑 Backfilled external IDs on {stats['backfilled']} Salesforce records "
+                    f"({stats['duplicates']} duplicates left unkeyed, {stats['failed']} failed)")
+        if duplicates:
+            logger.warning(f"⚠️ Duplicate Salesforce records left without an external ID: {duplicates}")
+        if failures:
+            logger.warning(f"⚠️ {len(failures)} records could not be keyed: {failures}")
+        return stats
+    finally:
+        if owns_session:
+            session.close()
+        if owns_state:
+            state.close()
+
+
+if __name__ == "__main__":
+    from utils.logger import setup_logger
+
+    load_dotenv()
+    setup_logger()
+    backfill_external_ids()
@@ -0,0 +1,199 @@
+# crm/bulk_api.py
+
+"""
+Salesforce Bulk API 2.0 ingest for syncs too large for composite requests.
+Records are streamed as CSV into a temporary file, so memory stays flat however large the
+sync is. The file is uploaded to an ingest job and the job is closed; Salesforce then
+processes it asynchronously. The job state is polled with exponential backoff, and once
+the job finishes its successful, failed and unprocessed result sets are downloaded. A sync
+larger than one job's upload limit is split over several jobs, which Salesforce processes
+in parallel. Records may carry different fields: a field a record leaves out is written as
+an empty cell, which Bulk API updates and upserts leave untouched, while a field set to
+None is written as #N/A, which clears it.
+"""
+
+import io
+import csv
+import time
+import logging
+import tempfile
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from config.constants import (
+    SALESFORCE_API_VERSION, SALESFORCE_BULK_MAX_JOB_BYTES, SALESFORCE_BULK_POLL_S, SALESFORCE_BULK_POLL_MAX_S,
+    SALESFORCE_BULK_TIMEOUT_S
+)
+from crm.salesforce_api import SalesforceSession
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+INGEST_PATH = f"data/{SALESFORCE_API_VERSION}/jobs/ingest"
+FINAL_STATES = {"JobComplete", "Failed", "Aborted"}
+# Result set name -> path segment under the job
+RESULT_SETS = {"successful": "successfulResults", "failed": "failedResults", "unprocessed": "unprocessedrecords"}
+
+
+class BulkJobError(Exception):
+    """An ingest job could not be created, uploaded or finished."""
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return "#N/A"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def csv_files(records: Iterable[Dict], columns: List[str],
+              max_bytes: int = SALESFORCE_BULK_MAX_JOB_BYTES) -> Iterator[IO[bytes]]:
+    """
+    Write records as CSV into temporary files of at most max_bytes each, header included.
+    Each file is yielded rewound; the caller closes it.
+    """
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator="\n")
+
+    def encode(row: List[str]) -> bytes:
+        line.seek(0)
+        line.truncate()
+        writer.writerow(row)
+        return line.getvalue().encode("utf-8")
+
+    header = encode(columns)
+    file = None
+    for record in records:
+        data = encode([csv_value(record[column]) if column in record else "" for column in columns])
+        if file is not None and file.tell() + len(data) > max_bytes:
+            file.seek(0)
+            yield file
+            file = None
+        if file is None:
+            file = tempfile.TemporaryFile()
+            file.write(header)
+        file.write(data)
+    if file is not None:
+        file.seek(0)
+        yield file
+
+
+class BulkIngestJob:
+    """
+    One Bulk API 2.0 ingest job: create, upload CSV, close, wait, download results.
+    """
+
+    def __init__(self, session: SalesforceSession, object_name: str, operation: str = "insert",
+                 external_id_field: Optional[str] = None):
+        self.session = session
+        self.object_name = object_name
+        self.operation = operation
+        self.external_id_field = external_id_field
+        self.id: Optional[str] = None
+        self.info: Dict = {}
+
+    @property
+    def state(self) -> Optional[str]:
+        return self.info.get("state")
+
+    def call(self, method: str, path: str = "", **kwargs):
+        response = self.session.request(method, f"{INGEST_PATH}/{path}", **kwargs)
+        if not response.ok:
+            raise BulkJobError(f"{method} {INGEST_PATH}/{path} failed with HTTP {response.status_code}: "
+                               f"{response.text[:500]}")
+        return response
+
+    def create(self) -> Dict:
+        body = {"object": self.object_name, "operation": self.operation, "contentType": "CSV", "lineEnding": "LF"}
+        if self.external_id_field:
+            body["externalIdFieldName"] = self.external_id_field
+        self.info = self.call("POST", json=body).json()
+        self.id = self.info["id"]
+        return self.info
+
+    def upload(self, file: IO[bytes]):
+        self.call("PUT", f"{self.id}/batches", data=file, headers={"Content-Type": "text/csv"})
+
+    def close(self) -> Dict:
+        self.info = self.call("PATCH", self.id, json={"state": "UploadComplete"}).json()
+        return self.info
+
+    def abort(self):
+        try:
+            self.info = self.call("PATCH", self.id, json={"state": "Aborted"}).json()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not abort Bulk API job {self.id}: {e}")
+
+    def poll(self) -> Dict:
+        self.info = self.call("GET", self.id).json()
+        return self.info
+
+    def wait(self, timeout: float = SALESFORCE_BULK_TIMEOUT_S, interval: Optional[float] = None,
+             max_interval: Optional[float] = None) -> Dict:
+        """
+        Poll until the job is complete, failed or aborted; the interval doubles up to max_interval.
+        """
+        interval = interval or SALESFORCE_BULK_POLL_S
+        max_interval = max_interval or SALESFORCE_BULK_POLL_MAX_S
+        deadline = time.monotonic() + timeout
+        while self.poll()["state"] not in FINAL_STATES:
+            if time.monotonic() + interval > deadline:
+                raise BulkJobError(f"Bulk API job {self.id} still {self.state} after {timeout}s")
+            time.sleep(interval)
+            interval = min(max_interval, interval * 2)
+        return self.info
+
+    def results(self, name: str) -> List[Dict[str, str]]:
+        """
+        A result set ("successful", "failed" or "unprocessed") as CSV rows. Successful rows
+        carry sf__Id and sf__Created, failed rows sf__Id and sf__Error, all the uploaded fields.
+        """
+        response = self.call("GET", f"{self.id}/{RESULT_SETS[name]}/", headers={"Accept": "text/csv"})
+        response.encoding = "utf-8"
+        return list(csv.DictReader(io.StringIO(response.text)))
+
+
+def bulk_ingest(session: SalesforceSession, records: List[Dict], object_name: str = "Organization_Contracts__c",
+                operation: str = "insert", external_id_field: Optional[str] = None,
+                max_job_bytes: int = SALESFORCE_BULK_MAX_JOB_BYTES,
+                timeout: float = SALESFORCE_BULK_TIMEOUT_S) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Ingest records (sObject dicts; "attributes" is ignored) through as many jobs as their CSV
+    needs. Returns the rows of every job's result sets: {"successful", "failed", "unprocessed"}.
+    Records in a job that could not be uploaded, did not finish in time, or whose state or
+    results could not be fetched appear in none of them; the other jobs' results are kept.
+    """
+    results: Dict[str, List[Dict[str, str]]] = {name: [] for name in RESULT_SETS}
+    if not records:
+        return results
+    columns = list(dict.fromkeys(column for record in records for column in record if column != "attributes"))
+
+    jobs = []
+    for file in csv_files(records, columns, max_job_bytes):
+        with file:
+            job = BulkIngestJob(session, object_name, operation, external_id_field)
+            try:
+                job.create()
+                job.upload(file)
+                job.close()
+            except Exception as e:
+                logger.error(f"❌ Bulk API upload failed: {e}")
+                if job.id:
+                    job.abort()
+                break
+        jobs.append(job)
+        logger.info(f"📤 Uploaded Bulk API {operation} job {job.id}")
+
+    for job in jobs:
+        try:
+            info = job.wait(timeout)
+            logger.info(f"📦 Bulk API job {job.id} {info['state']}: {info.get('numberRecordsProcessed', 0)} "
+                        f"processed, {info.get('numberRecordsFailed', 0)} failed")
+            job_results = {name: job.results(name) for name in RESULT_SETS}
+        except (BulkJobError, requests.RequestException) as e:
+            logger.error(f"❌ Bulk API job {job.id}: {e}")
+            continue
+        for name in RESULT_SETS:
+            results[name] += job_results[name]
+    return results
@@ -3,6 +3,15 @@
 import requests
 import os
 import json
+import logging
+import threading
+from typing import Callable, Optional
+
+from requests.adapters import HTTPAdapter
+
+from config.constants import SALESFORCE_SYNC_WORKERS, SALESFORCE_TIMEOUT_S
+
+logger = logging.getLogger("uk_sponsor_pipeline")
 
 TOKEN_FILE = "salesforce_token.json"
 
@@ -56,3 +65,72 @@ def load_token():
         with open(TOKEN_FILE, "r") as f:
             return json.load(f)["access_token"]
     return None
+
+
+class SalesforceSession:
+    """
+    Authenticated Salesforce API client over one keep-alive requests.Session, shared by
+    the worker threads of a sync. Its connection pool holds `pool_size` connections, so
+    concurrent requests reuse warm TLS connections instead of opening one per call.
+    A request answered with 401 refreshes the token (once across all threads) and is retried.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None,
+                 refresh: Optional[Callable[[], str]] = None, pool_size: int = SALESFORCE_SYNC_WORKERS,
+                 timeout: float = SALESFORCE_TIMEOUT_S):
+        self.base_url = (base_url or os.getenv("SALESFORCE_API_URL") or "").rstrip("/")
+        if not self.base_url:
+            raise ValueError("Salesforce API URL is not properly configured.")
+        self.token = token
+        self.refresh = refresh or get_salesforce_access_token
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+
+    def access_token(self) -> str:
+        with self._lock:
+            if not self.token:
+                self.token = load_token()
+            if not self.token:
+                logger.info("🔑 No saved Salesforce token found — fetching a new one.")
+                self.token = self.refresh()
+            return self.token
+
+    def refresh_token(self, expired: str) -> str:
+        with self._lock:
+            # Threads that hit the same expiry share one refresh
+            if self.token == expired:
+                logger.info("🔄 Token expired — refreshing token and retrying...")
+                self.token = self.refresh()
+            return self.token
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request to `path` under the instance URL, e.g. "data/v63.0/composite/tree/...".
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = kwargs.pop("headers", {})
+        kwargs.setdefault("timeout", self.timeout)
+        token = self.access_token()
+        response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"},
+                                        **kwargs)
+        if response.status_code == 401:
+            token = self.refresh_token(token)
+            # A file body (bulk CSV upload) was read by the first attempt
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+            response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"},
+                                            **kwargs)
+        return response
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,84 +1,391 @@
 # crm/sync_crm.py
 
+"""
+Sync of enriched sponsors to Salesforce Organization_Contracts__c records.
+Records are upserted on an external ID derived from the register's own row key (exact
+organisation name and route), so a re-sync updates the existing record instead of creating
+a duplicate. Records created before external IDs existed are keyed once with
+crm/backfill_external_ids.py. Each outgoing record is
+compared with its last-synced state (crm/sync_state.py): unchanged records are not sent at
+all, and changed ones carry only the fields that changed. Sponsors that left the register
+are archived the same way, so API call volume follows the day's churn, not the register size.
+Sponsors the register diff reports as renamed keep their record: it is re-keyed under the
+new name's external ID.
+
+Up to 200 records go in one sObject Collections upsert, several requests at once, over one
+keep-alive session. Records Salesforce rejects are reported and not sent again; chunks that
+failed on the network or with a 5xx/429, and records that hit a lock, are retried on their
+own. Above SALESFORCE_BULK_THRESHOLD changed records, the upsert goes through Bulk API 2.0
+ingest jobs instead (see crm/bulk_api.py).
+"""
+
+import os
+import time
+import hashlib
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
 import requests
-import os
-from config.constants import ORGANIZATION_NAME
-from crm.salesforce_api import load_token, get_salesforce_access_token
+
+from config.constants import (
+    ORGANIZATION_NAME, PREVIOUS_NAME_COL, SALESFORCE_API_VERSION, SALESFORCE_CHUNK_SIZE, SALESFORCE_SYNC_WORKERS,
+    SALESFORCE_MAX_ATTEMPTS, SALESFORCE_RETRY_BASE_S, SALESFORCE_RETRY_MAX_S, SALESFORCE_BULK_THRESHOLD, SALESFORCE_OBJECT,
+    SALESFORCE_EXTERNAL_ID_FIELD, SALESFORCE_ACTIVE_FIELDS, SALESFORCE_ARCHIVE_FIELDS
+)
+from crm.bulk_api import bulk_ingest
+from crm.salesforce_api import SalesforceSession
+from crm.sync_state import SyncState, normalize_fields
+from utils.checkpoints import RecordProgress, sponsor_key
+from utils.rate_limit import backoff_delay
 
 logger = logging.getLogger("uk_sponsor_pipeline")
 
-SALESFORCE_API_URL = os.getenv("SALESFORCE_API_URL")
+UPSERT_PATH = f"data/{SALESFORCE_API_VERSION}/composite/sobjects/{SALESFORCE_OBJECT}/{SALESFORCE_EXTERNAL_ID_FIELD}"
+UPDATE_PATH = f"data/{SALESFORCE_API_VERSION}/composite/sobjects"
+# Responses worth retrying the whole chunk for
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Record-level errors worth retrying the record for
+RETRYABLE_ERRORS = {"UNABLE_TO_LOCK_ROW", "SERVER_UNAVAILABLE"}
 
 
-def sync_with_salesforce(new_sponsors: List[dict]) -> None:
+def external_id(sponsor: dict) -> str:
     """
-    Syncs new sponsor records to Salesforce API.
-
-    Args:
-        new_sponsors (List[dict]): List of enriched sponsor records.
+    Stable external ID of a sponsor's record: a hash of its exact organisation name and route,
+    for both raw register rows and enriched dicts. This is the key the register diff uses, so
+    every row the diff tells apart ("Acme Ltd" and "ACME Limited" listed side by side) has its
+    own record, and archiving a removed row never touches a row that is still listed.
     """
-    if not SALESFORCE_API_URL:
-        raise ValueError("Salesforce API URL is not properly configured.")
+    return hashlib.sha1(sponsor_key(sponsor).encode("utf-8")).hexdigest()
 
-    if not new_sponsors:
-        logger.info("✅ No new sponsors to sync with Salesforce.")
-        return
-
-    access_token = load_token()
-    if not access_token:
-        logger.info("🔑 No saved Salesforce token found — fetching a new one.")
-        access_token = get_salesforce_access_token()
-
-    # url = f"{SALESFORCE_API_URL}/data/v63.0/sobjects/Organization_Contracts__c/"
-    url = f"{SALESFORCE_API_URL}/data/v63.0/composite/tree/Organization_Contracts__c/"
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
 
+def build_salesforce_records(sponsors: List[dict]) -> List[dict]:
+    """
+    Map enriched sponsor dicts to Organization_Contracts__c records, keyed on the external ID.
+    """
     records = []
-    for index, sponsor in enumerate(new_sponsors, start=1):
+    for sponsor in sponsors:
         record = {
-            "attributes": {
-                "type": "Organization_Contracts__c",
-                "referenceId": f"ref{index}"
-            },
+            "attributes": {"type": SALESFORCE_OBJECT},
+            SALESFORCE_EXTERNAL_ID_FIELD: external_id(sponsor),
             "County__c": sponsor.get("county", "Unknown"),
             "Email__c": sponsor.get("email"),
             "Enriched__c": sponsor.get("enriched"),
             "Organization__c": sponsor.get("organization"),
             "Route__c": sponsor.get("route"),
             "Town_City__c": sponsor.get("town_city"),
-            "Type_Rating__c": sponsor.get("type_rating")
+            "Type_Rating__c": sponsor.get("type_rating"),
+            **SALESFORCE_ACTIVE_FIELDS,
         }
         records.append(record)
+    return records
+
+
+def record_fields(record: dict) -> Dict:
+    return {field: value for field, value in record.items() if field != "attributes"}
+
+
+def changed_fields(fields: Dict, previous: Optional[Dict]) -> Optional[Dict]:
+    """
+    The fields that differ from the last-synced ones (all of them for a record never synced),
+    with the external ID; None when nothing changed.
+    """
+    if previous is None:
+        return fields
+    current = normalize_fields(fields)
+    delta = {field: fields[field] for field, value in current.items() if previous.get(field) != value}
+    if not delta:
+        return None
+    return {SALESFORCE_EXTERNAL_ID_FIELD: fields[SALESFORCE_EXTERNAL_ID_FIELD], **delta}
+
+
+def chunked(records: List[dict], size: int = SALESFORCE_CHUNK_SIZE) -> Iterator[List[dict]]:
+    for start in range(0, len(records), size):
+        yield records[start:start + size]
 
-    payload = {"records": records}
 
+def upsert_chunk(session: SalesforceSession, chunk: List[dict]) -> Dict[str, Dict]:
+    """
+    Upsert one chunk of records with an sObject Collections request. Returns an outcome per
+    external ID: {"id", "created"} when written, {"errors"} when Salesforce rejected the
+    record, and {"retry": True} when it is worth sending again.
+    """
+    keys = [record[SALESFORCE_EXTERNAL_ID_FIELD] for record in chunk]
+    body = {"allOrNone": False, "records": [{"attributes": {"type": SALESFORCE_OBJECT}, **record} for record in chunk]}
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = session.request("PATCH", UPSERT_PATH, json=body)
+    except requests.RequestException as e:
+        return {key: {"error": str(e), "retry": True} for key in keys}
+    if response.status_code in RETRYABLE_STATUSES:
+        return {key: {"error": f"HTTP {response.status_code}", "retry": True} for key in keys}
+    if not response.ok:
+        return {key: {"error": f"HTTP {response.status_code}: {response.text[:200]}"} for key in keys}
 
-        if response.status_code == 401:
-            logger.info("🔄 Token expired — refreshing token and retrying...")
-            access_token = get_salesforce_access_token()
-            headers["Authorization"] = f"Bearer {access_token}"
-            response = requests.post(url, headers=headers, json=payload)
+    outcomes = {}
+    # Results come back in request order, one per record
+    for key, result in zip(keys, response.json()):
+        if result.get("success"):
+            outcomes[key] = {"id": result.get("id"), "created": result.get("created")}
+        else:
+            errors = result.get("errors", [])
+            retry = any(error.get("statusCode") in RETRYABLE_ERRORS for error in errors)
+            outcomes[key] = {"errors": errors, "retry": retry} if retry else {"errors": errors}
+    return outcomes
 
+
+def update_by_id(session: SalesforceSession, updates: List[Dict]) -> List[Dict]:
+    """
+    Update records by Salesforce ID ({"Id", field: value, ...}) with sObject Collections
+    requests of up to 200 records. Returns one result per update, in order.
+    """
+    results = []
+    for chunk in chunked(updates):
+        body = {"allOrNone": False, "records": [
+            {"attributes": {"type": SALESFORCE_OBJECT}, "id": update["Id"],
+             **{field: value for field, value in update.items() if field != "Id"}}
+            for update in chunk
+        ]}
+        response = session.request("PATCH", UPDATE_PATH, json=body)
         response.raise_for_status()
+        results += response.json()
+    return results
+
+
+def upload_records(session: SalesforceSession, records: List[dict], chunk_size: int = SALESFORCE_CHUNK_SIZE,
+                   workers: int = SALESFORCE_SYNC_WORKERS, max_attempts: int = SALESFORCE_MAX_ATTEMPTS
+                   ) -> Dict[str, Dict]:
+    """
+    Upsert records in concurrent chunks, retrying only the records that need it.
+    Returns the final outcome per external ID (see upsert_chunk).
+    """
+    outcomes: Dict[str, Dict] = {}
+    pending = records
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for attempt in range(max_attempts):
+            for chunk_outcomes in executor.map(lambda chunk: upsert_chunk(session, chunk),
+                                               chunked(pending, chunk_size)):
+                outcomes.update(chunk_outcomes)
+            pending = [record for record in pending if outcomes[record[SALESFORCE_EXTERNAL_ID_FIELD]].get("retry")]
+            if not pending or attempt == max_attempts - 1:
+                break
+            logger.info(f"🔁 Retrying {len(pending)} Salesforce records (attempt {attempt + 2}/{max_attempts})")
+            time.sleep(backoff_delay(attempt, SALESFORCE_RETRY_BASE_S, SALESFORCE_RETRY_MAX_S))
+    return outcomes
+
+
+def bulk_outcomes(results: Dict[str, List[Dict[str, str]]], records: List[dict]) -> Dict[str, Dict]:
+    """
+    Map Bulk API result rows back onto external IDs, in the shape upsert_chunk returns.
+    """
+    outcomes = {}
+    for name, rows in results.items():
+        for row in rows:
+            key = row.get(SALESFORCE_EXTERNAL_ID_FIELD)
+            if name == "successful":
+                outcomes[key] = {"id": row["sf__Id"], "created": row.get("sf__Created") == "true"}
+            elif name == "failed":
+                outcomes[key] = {"errors": row["sf__Error"]}
+    for record in records:
+        outcomes.setdefault(record[SALESFORCE_EXTERNAL_ID_FIELD], {"error": "not processed by its Bulk API job"})
+    return outcomes
+
+
+def push_changes(session: SalesforceSession, state: SyncState, targets: Dict[str, Dict],
+                 bulk_threshold: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Bring Salesforce to `targets` (external ID -> full field values), sending only records
+    and fields that differ from the last-synced state, and record what was written.
+    Returns the outcome per external ID; unchanged records get {"id", "unchanged": True}.
+    """
+    previous = state.get(list(targets))
+    changes = []
+    outcomes = {}
+    for key, fields in targets.items():
+        entry = previous.get(key)
+        delta = changed_fields(fields, entry["fields"] if entry else None)
+        if delta is None:
+            outcomes[key] = {"id": entry["salesforce_id"], "unchanged": True}
+        else:
+            changes.append(delta)
+    if not changes:
+        return outcomes
+
+    if bulk_threshold is None:
+        bulk_threshold = int(os.getenv("SALESFORCE_BULK_THRESHOLD", SALESFORCE_BULK_THRESHOLD))
+    if len(changes) > bulk_threshold:
+        logger.info(f"📦 Upserting {len(changes)} changed records through the Bulk API")
+        written = bulk_outcomes(bulk_ingest(session, changes, operation="upsert",
+                                            external_id_field=SALESFORCE_EXTERNAL_ID_FIELD), changes)
+    else:
+        written = upload_records(session, changes)
+
+    state.save((key, outcome["id"], targets[key]) for key, outcome in written.items() if outcome.get("id"))
+    outcomes.update(written)
+    return outcomes
+
+
+def sync_with_salesforce(new_sponsors: List[dict], progress: Optional[RecordProgress] = None,
+                         session: Optional[SalesforceSession] = None, bulk_threshold: Optional[int] = None,
+                         state: Optional[SyncState] = None) -> Dict[str, int]:
+    """
+    Syncs sponsor records to Salesforce API, upserting only what changed since the last sync.
+
+    Args:
+        new_sponsors (List[dict]): List of enriched sponsor records.
+        progress (RecordProgress, optional): Progress log of this run; sponsors already synced
+            are skipped and each successfully synced sponsor is recorded.
+        session (SalesforceSession, optional): Client to use; by default one is created from
+            the environment and closed afterwards.
+        bulk_threshold (int, optional): Above this many changed records the Bulk API is used
+            (default: SALESFORCE_BULK_THRESHOLD env var, then the constant).
+        state (SyncState, optional): Last-synced state; by default the one at SALESFORCE_SYNC_STATE_DB.
+
+    Returns:
+        Dict[str, int]: {"synced": records written, "unchanged": records not sent because
+        nothing changed, "failed": records that could not be written}.
+    """
+    owns_session = session is None
+    if owns_session:
+        session = SalesforceSession()
+    owns_state = state is None
+    if owns_state:
+        state = SyncState()
+
+    try:
+        if progress is not None:
+            new_sponsors = [sponsor for sponsor in new_sponsors if not progress.is_done(sponsor_key(sponsor))]
 
-        result = response.json()
-        successes = [r for r in result.get("results", []) if r.get("success")]
-        failures = [r for r in result.get("results", []) if not r.get("success")]
+        if not new_sponsors:
+            logger.info("✅ No new sponsors to sync with Salesforce.")
+            return {"synced": 0, "unchanged": 0, "failed": 0}
 
-        logger.info(f"✅ Synced {len(successes)} sponsors successfully.")
+        records = build_salesforce_records(new_sponsors)
+        targets = {record[SALESFORCE_EXTERNAL_ID_FIELD]: record_fields(record) for record in records}
+        outcomes = push_changes(session, state, targets, bulk_threshold)
+
+        stats = {"synced": 0, "unchanged": 0, "failed": 0}
+        failures = []
+        for key, outcome in outcomes.items():
+            if outcome.get("unchanged"):
+                stats["unchanged"] += 1
+            elif outcome.get("id"):
+                stats["synced"] += 1
+            else:
+                stats["failed"] += 1
+                failures.append({SALESFORCE_EXTERNAL_ID_FIELD: key, **outcome})
+        if progress is not None:
+            for sponsor, record in zip(new_sponsors, records):
+                outcome = outcomes[record[SALESFORCE_EXTERNAL_ID_FIELD]]
+                if outcome.get("id") or outcome.get("unchanged"):
+                    progress.mark_done(sponsor_key(sponsor), outcome.get("id"))
+
+        logger.info(f"✅ Synced {stats['synced']} sponsors successfully, {stats['unchanged']} unchanged.")
         if failures:
             logger.warning(f"⚠️ {len(failures)} sponsors failed to sync: {failures}")
+        return stats
 
     except requests.HTTPError as http_err:
         logger.error(f"❌ HTTP error during bulk sync: {http_err}")
     except Exception as err:
         logger.error(f"❌ Unexpected error during bulk sync: {err}")
+    finally:
+        if owns_session:
+            session.close()
+        if owns_state:
+            state.close()
+    return {"synced": 0, "unchanged": 0, "failed": len(new_sponsors)}
+
+
+def archive_removed_sponsors(removed_sponsors: List[dict], session: Optional[SalesforceSession] = None,
+                             bulk_threshold: Optional[int] = None, state: Optional[SyncState] = None
+                             ) -> Dict[str, int]:
+    """
+    Archive the Salesforce records of sponsors that left the register (raw register rows or
+    enriched dicts). Only records this sync has written are archived; records already archived
+    are not sent again.
+
+    Returns:
+        Dict[str, int]: {"archived", "unchanged", "failed"}, plus "unknown" for sponsors with no synced record.
+    """
+    owns_session = session is None
+    if owns_session:
+        session = SalesforceSession()
+    owns_state = state is None
+    if owns_state:
+        state = SyncState()
+
+    try:
+        keys = list(dict.fromkeys(external_id(sponsor) for sponsor in removed_sponsors))
+        synced = state.get(keys)
+        targets = {key: {**entry["fields"], **SALESFORCE_ARCHIVE_FIELDS} for key, entry in synced.items()}
+        outcomes = push_changes(session, state, targets, bulk_threshold)
+
+        stats = {"archived": 0, "unchanged": 0, "failed": 0, "unknown": len(keys) - len(synced)}
+        for outcome in outcomes.values():
+            if outcome.get("unchanged"):
+                stats["unchanged"] += 1
+            elif outcome.get("id"):
+                stats["archived"] += 1
+            else:
+                stats["failed"] += 1
+        logger.info(f"🗄️ Archived {stats['archived']} Salesforce records of removed sponsors "
+                    f"({stats['unchanged']} already archived, {stats['unknown']} never synced, "
+                    f"{stats['failed']} failed)")
+        return stats
+    finally:
+        if owns_session:
+            session.close()
+        if owns_state:
+            state.close()
+
+
+def rename_sponsors(renamed_sponsors: List[dict], session: Optional[SalesforceSession] = None,
+                    state: Optional[SyncState] = None) -> Dict[str, int]:
+    """
+    Move the Salesforce records of renamed sponsors (register rows with PREVIOUS_NAME_COL,
+    as in the register diff's "renamed") to their new name: the record's external ID and
+    organisation name are updated by Salesforce ID, and its sync state follows, so the old
+    record is neither left active under the old name nor duplicated under the new one.
+
+    Returns:
+        Dict[str, int]: {"renamed", "failed"}, plus "unknown" for sponsors with no synced record.
+    """
+    owns_session = session is None
+    if owns_session:
+        session = SalesforceSession()
+    owns_state = state is None
+    if owns_state:
+        state = SyncState()
+
+    try:
+        moves = {}
+        for sponsor in renamed_sponsors:
+            old_key = external_id({ORGANIZATION_NAME: sponsor[PREVIOUS_NAME_COL], "Route": sponsor["Route"]})
+            moves[old_key] = (external_id(sponsor), sponsor[ORGANIZATION_NAME])
+        synced = state.get(list(moves))
+        stats = {"renamed": 0, "failed": 0, "unknown": len(moves) - len(synced)}
+        if not synced:
+            return stats
 
+        old_keys = list(synced)
+        updates = [{"Id": synced[key]["salesforce_id"], SALESFORCE_EXTERNAL_ID_FIELD: moves[key][0],
+                    "Organization__c": moves[key][1]} for key in old_keys]
+        moved = []
+        for old_key, update, result in zip(old_keys, updates, update_by_id(session, updates)):
+            if result.get("success"):
+                fields = {**synced[old_key]["fields"], **{k: v for k, v in update.items() if k != "Id"}}
+                moved.append((old_key, (update[SALESFORCE_EXTERNAL_ID_FIELD], update["Id"], fields)))
+            else:
+                stats["failed"] += 1
+                logger.warning(f"⚠️ Could not rename Salesforce record {update['Id']}: {result.get('errors')}")
+        state.save(entry for _, entry in moved)
+        state.delete(old_key for old_key, _ in moved)
+        stats["renamed"] = len(moved)
+        logger.info(f"✏️ Renamed {stats['renamed']} Salesforce records ({stats['unknown']} never synced, "
+                    f"{stats['failed']} failed)")
+        return stats
+    finally:
+        if owns_session:
+            session.close()
+        if owns_state:
+            state.close()
@@ -0,0 +1,98 @@
+# crm/sync_state.py
+
+"""
+Last-synced state of Salesforce records.
+Keeps, per external ID, the Salesforce ID and the field values last written successfully,
+in a small SQLite database. The sync compares outgoing records against it to send only what
+changed, and archiving reads it to find what was synced for sponsors that left the register.
+"""
+
+import os
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.constants import SALESFORCE_SYNC_STATE_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS synced_records (
+    external_id    TEXT PRIMARY KEY,
+    salesforce_id  TEXT,
+    fields         TEXT NOT NULL,
+    synced_at      TEXT NOT NULL
+)
+"""
+
+
+def normalize_fields(fields: Dict) -> Dict:
+    """
+    Field values as they read back from the store (JSON types), so comparisons are like for like.
+    """
+    return json.loads(json.dumps(fields, default=str))
+
+
+class SyncState:
+    """
+    SQLite-backed map of external ID -> {"salesforce_id", "fields"} of the last successful sync.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or SALESFORCE_SYNC_STATE_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM synced_records").fetchone()[0]
+
+    def get(self, external_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Last-synced entries of the given external IDs; IDs never synced are left out.
+        """
+        entries = {}
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(external_ids), 500):
+            chunk = external_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT external_id, salesforce_id, fields FROM synced_records "
+                f"WHERE external_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            for external_id, salesforce_id, fields in rows:
+                entries[external_id] = {"salesforce_id": salesforce_id, "fields": json.loads(fields)}
+        return entries
+
+    def save(self, entries: Iterable[Tuple[str, Optional[str], Dict]]) -> int:
+        """
+        Record (external_id, salesforce_id, fields) after a successful write. `fields` is the
+        record's full state; a missing salesforce_id keeps the one already stored.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [(external_id, salesforce_id, json.dumps(normalize_fields(fields), sort_keys=True), now)
+                for external_id, salesforce_id, fields in entries]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO synced_records VALUES (?, ?, ?, ?) ON CONFLICT(external_id) DO UPDATE SET "
+                "salesforce_id = COALESCE(excluded.salesforce_id, salesforce_id), fields = excluded.fields, "
+                "synced_at = excluded.synced_at",
+                rows,
+            )
+        return len(rows)
+
+    def delete(self, external_ids: Iterable[str]) -> int:
+        """
+        Forget the given external IDs (e.g. the old key of a renamed sponsor).
+        """
+        with self.conn:
+            return self.conn.executemany("DELETE FROM synced_records WHERE external_id = ?",
+                                         [(external_id,) for external_id in external_ids]).rowcount
@@ -0,0 +1,249 @@
+# enrichment/bulk.py
+
+"""
+Bulk enrichment providers.
+Many vendors take hundreds of companies per request at a lower per-record price. A
+BulkProvider still looks like any other provider to the engine and router (one company
+per enrich() call), but behind that it gathers concurrent calls into micro-batches,
+bounded by size and by how long the first record may wait, submits each batch in one
+request, polls asynchronous bulk jobs where the vendor needs that, and hands every
+record its own result or error.
+"""
+
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+
+from config.constants import (
+    ENRICH_BULK_BATCH_SIZE, ENRICH_BULK_MAX_WAIT_S, ENRICH_BULK_POLL_S, ENRICH_BULK_POLL_MAX_S,
+    ENRICH_BULK_JOB_TIMEOUT_S, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S
+)
+from enrichment.enrich_company import EnrichmentProvider, HttpProvider, ProviderError, RateLimited
+from utils.rate_limit import backoff_delay
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+# One entry per submitted record: its answer, or the error that record failed with
+BatchResult = List[Union[Dict, Exception]]
+
+
+class BulkProvider(EnrichmentProvider):
+    """
+    Base class for bulk providers. Subclasses implement fetch_batch(); the rate limit,
+    concurrency cap and retries apply per batch rather than per record.
+
+    batch_size     records per batch (a batch is sent as soon as it is full)
+    max_wait       seconds the first record of a partial batch waits before it is sent anyway
+    poll_interval  first delay between status checks of an asynchronous bulk job
+    The timeout covers a whole batch, job polling included.
+    """
+
+    def __init__(self, batch_size: int = ENRICH_BULK_BATCH_SIZE, max_wait: float = ENRICH_BULK_MAX_WAIT_S,
+                 poll_interval: float = ENRICH_BULK_POLL_S, **kwargs):
+        kwargs.setdefault("timeout", ENRICH_BULK_JOB_TIMEOUT_S)
+        super().__init__(**kwargs)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.stats.update({"batches": 0, "records": 0, "record_errors": 0})
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batch_loop = None
+        self._tasks = set()
+
+    async def fetch_batch(self, session: aiohttp.ClientSession, companies: List[Dict]) -> BatchResult:
+        raise NotImplementedError
+
+    async def enrich(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        """
+        Queue one company into the current micro-batch and wait for its own result.
+        """
+        loop = asyncio.get_running_loop()
+        if self._batch_loop is not loop:
+            self._pending, self._timer, self._batch_loop = [], None, loop
+
+        future = loop.create_future()
+        self._pending.append((company, future))
+        if len(self._pending) >= self.batch_size:
+            self.flush(session)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self.flush, session)
+        return await future
+
+    def flush(self, session: aiohttp.ClientSession):
+        """
+        Send whatever is queued as one batch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self.run_batch(session, batch))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run_batch(self, session: aiohttp.ClientSession, batch: List[Tuple[Dict, asyncio.Future]]):
+        companies = [company for company, _ in batch]
+        try:
+            results = await self.submit_with_retries(session, companies)
+        except Exception as e:
+            results = [e] * len(batch)
+        except asyncio.CancelledError:
+            # Never leave a caller waiting on a batch that will not finish
+            for _, future in batch:
+                future.cancel()
+            raise
+
+        for (company, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                self.stats["record_errors"] += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def submit_with_retries(self, session: aiohttp.ClientSession, companies: List[Dict]) -> BatchResult:
+        """
+        Submit one batch, retrying batch-level failures with jittered backoff.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            async with self.semaphore:
+                self.stats["calls"] += 1
+                try:
+                    results = await asyncio.wait_for(self.fetch_batch(session, companies), self.timeout)
+                    if len(results) != len(companies):
+                        raise ProviderError(f"{self.name} returned {len(results)} results for {len(companies)} records",
+                                            retryable=False)
+                    self.stats["ok"] += 1
+                    self.stats["batches"] += 1
+                    self.stats["records"] += len(companies)
+                    return results
+                except RateLimited as e:
+                    self.stats["rate_limited"] += 1
+                    error, delay = e, max(e.retry_after or 0, backoff_delay(attempt, ENRICH_BACKOFF_BASE_S,
+                                                                             ENRICH_BACKOFF_MAX_S))
+                    self.bucket.pause(e.retry_after or 0)
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    error = ProviderError(f"{self.name} batch timed out after {self.timeout}s")
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+                except aiohttp.ClientError as e:
+                    error = ProviderError(f"{self.name} batch request failed: {e}")
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+                except ProviderError as e:
+                    error = e
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+
+            if not error.retryable or attempt == self.max_retries:
+                self.stats["failed"] += 1
+                raise error
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    async def poll_job(self, check: Callable[[str], Awaitable[Optional[Any]]], job_id: str) -> Any:
+        """
+        Poll check(job_id) with a growing interval until it returns a non-None result.
+        The batch timeout bounds how long this can take.
+        """
+        interval = self.poll_interval
+        while True:
+            result = await check(job_id)
+            if result is not None:
+                return result
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, ENRICH_BULK_POLL_MAX_S)
+
+
+class HttpBulkProvider(BulkProvider, HttpProvider):
+    """
+    JSON-over-HTTP bulk provider.
+
+    POST {url}/jobs with {"records": [...]} answers either with the results directly
+    ({"results": [...]}) or with {"job_id": ...}; a job is polled at GET {url}/jobs/<id>
+    until its status is "complete" (with "results") or "failed". Each result is
+    {"index": i, "data": {...}} or {"index": i, "error": "..."}; records missing from
+    the results count as "nothing known".
+    """
+
+    async def fetch_batch(self, session: aiohttp.ClientSession, companies: List[Dict]) -> BatchResult:
+        payload = {"records": [self.payload(company) for company in companies]}
+        async with session.post(f"{self.url}/jobs", json=payload, headers=self.headers) as response:
+            body = await self.read(response)
+
+        if "results" not in body:
+            body = await self.poll_job(lambda job_id: self.check_job(session, job_id), body["job_id"])
+        return self.map_results(body["results"], len(companies))
+
+    async def read(self, response: aiohttp.ClientResponse) -> Dict:
+        if response.status == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise RateLimited(f"{self.name} rate limited", float(retry_after) if retry_after else None)
+        if response.status >= 500:
+            raise ProviderError(f"{self.name} returned {response.status}")
+        if response.status >= 400:
+            raise ProviderError(f"{self.name} returned {response.status}", retryable=False)
+        return await response.json()
+
+    async def check_job(self, session: aiohttp.ClientSession, job_id: str) -> Optional[Dict]:
+        async with session.get(f"{self.url}/jobs/{job_id}", headers=self.headers) as response:
+            body = await self.read(response)
+        if body.get("status") == "failed":
+            raise ProviderError(f"{self.name} bulk job {job_id} failed: {body.get('error')}")
+        return body if body.get("status") == "complete" else None
+
+    def map_results(self, results: List[Dict], size: int) -> BatchResult:
+        mapped: BatchResult = [{} for _ in range(size)]
+        for result in results:
+            index = result["index"]
+            if "error" in result:
+                mapped[index] = ProviderError(f"{self.name}: {result['error']}", retryable=False)
+            else:
+                data = result.get("data") or {}
+                mapped[index] = {k: v for k, v in data.items() if self.fields is None or k in self.fields}
+        return mapped
+
+
+class FakeBulkProvider(BulkProvider):
+    """
+    In-process stand-in for a bulk vendor, for tests and local runs. Each batch becomes a
+    job that completes after `job_polls` status checks. Records whose name contains
+    "invalid" fail individually; the rest get a derived website and email.
+    """
+
+    name = "fake-bulk"
+    _job_ids = itertools.count(1)
+
+    def __init__(self, job_polls: int = 2, **kwargs):
+        kwargs.setdefault("fields", ["website", "email"])
+        super().__init__(**kwargs)
+        self.job_polls = job_polls
+        self.jobs: Dict[str, Dict] = {}
+        self.batch_sizes: List[int] = []
+
+    async def fetch_batch(self, session: aiohttp.ClientSession, companies: List[Dict]) -> BatchResult:
+        job_id = str(next(self._job_ids))
+        self.jobs[job_id] = {"records": companies, "polls": 0}
+        self.batch_sizes.append(len(companies))
+        return await self.poll_job(self.check_job, job_id)
+
+    async def check_job(self, job_id: str) -> Optional[BatchResult]:
+        job = self.jobs[job_id]
+        job["polls"] += 1
+        if job["polls"] < self.job_polls:
+            return None
+        results: BatchResult = []
+        for company in job["records"]:
+            name = company.get("Organisation Name", "")
+            if "invalid" in name.lower():
+                results.append(ProviderError(f"{self.name}: unknown organisation {name}", retryable=False))
+            else:
+                slug = "".join(ch for ch in name.lower().split()[0] if ch.isalnum())
+                results.append({"website": f"https://{slug}.example", "email": f"info@{slug}.example"})
+        return results
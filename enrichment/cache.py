@@ -0,0 +1,161 @@
+# enrichment/cache.py
+
+"""
+Persistent cache of enrichment lookups.
+Answers are stored per (canonical organisation name, provider) in SQLite under
+data/enriched, so a renamed or re-listed sponsor, another route of the same company, or
+a rerun doesn't pay for the same provider call twice. Each field expires on its own
+TTL (emails go stale sooner than an industry code) and the least recently used entries
+are evicted once the cache grows past its size bound.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import Dict, Optional
+
+from config.constants import (
+    ENRICH_CACHE_DB, ENRICH_CACHE_MAX_ENTRIES, ENRICH_CACHE_FIELD_TTL_DAYS, ENRICH_CACHE_DEFAULT_TTL_DAYS,
+    ENRICH_CACHE_EMPTY_TTL_DAYS
+)
+from enrichment.utils import normalize_org_name
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrichment_cache (
+    org_key     TEXT NOT NULL,
+    provider    TEXT NOT NULL,
+    fields      TEXT NOT NULL,
+    fetched_at  TEXT NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (org_key, provider)
+);
+CREATE INDEX IF NOT EXISTS idx_enrichment_cache_access ON enrichment_cache (last_access);
+"""
+
+DAY = 86400
+
+
+class EnrichmentCache:
+    """
+    SQLite-backed, TTL- and size-bounded cache of provider answers.
+
+    fetched_at holds one timestamp per field, so a refresh that only returns some fields
+    keeps the others' ages. An empty answer is cached too ("provider knows nothing"),
+    under its own shorter TTL.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None,
+                 field_ttl_days: Optional[Dict[str, float]] = None):
+        self.db_path = db_path or ENRICH_CACHE_DB
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.getenv("ENRICH_CACHE_MAX_ENTRIES", ENRICH_CACHE_MAX_ENTRIES))
+        self.field_ttl_days = field_ttl_days if field_ttl_days is not None else ENRICH_CACHE_FIELD_TTL_DAYS
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+
+    def close(self):
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ttl_seconds(self, field: Optional[str]) -> float:
+        if field is None:
+            return ENRICH_CACHE_EMPTY_TTL_DAYS * DAY
+        return self.field_ttl_days.get(field, ENRICH_CACHE_DEFAULT_TTL_DAYS) * DAY
+
+    def get(self, organisation: str, provider: str, now: Optional[float] = None) -> Optional[Dict]:
+        """
+        Return the cached answer of a provider for an organisation, or None on a miss.
+        An entry with any expired field counts as a miss, so the provider is asked again.
+        """
+        now = now if now is not None else time.time()
+        org_key = normalize_org_name(organisation)
+        row = self.conn.execute(
+            "SELECT fields, fetched_at FROM enrichment_cache WHERE org_key = ? AND provider = ?",
+            (org_key, provider),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        fields, fetched_at = json.loads(row[0]), json.loads(row[1])
+        ages = fetched_at.items() if fields else [(None, fetched_at.get("", 0))]
+        if any(now - fetched > self.ttl_seconds(field) for field, fetched in ages):
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+        self.conn.execute(
+            "UPDATE enrichment_cache SET last_access = ? WHERE org_key = ? AND provider = ?",
+            (now, org_key, provider),
+        )
+        self.stats["hits"] += 1
+        return fields
+
+    def put(self, organisation: str, provider: str, fields: Dict, now: Optional[float] = None):
+        """
+        Store a provider's answer. Fields missing from the new answer but still fresh
+        in the cache are kept.
+        """
+        now = now if now is not None else time.time()
+        org_key = normalize_org_name(organisation)
+        fields = {field: value for field, value in fields.items() if value is not None}
+
+        row = self.conn.execute(
+            "SELECT fields, fetched_at FROM enrichment_cache WHERE org_key = ? AND provider = ?",
+            (org_key, provider),
+        ).fetchone()
+        merged, fetched_at = {}, {}
+        if row is not None:
+            old_fields, old_fetched = json.loads(row[0]), json.loads(row[1])
+            for field, value in old_fields.items():
+                if now - old_fetched.get(field, 0) <= self.ttl_seconds(field):
+                    merged[field], fetched_at[field] = value, old_fetched[field]
+        merged.update(fields)
+        fetched_at.update({field: now for field in fields})
+        if not merged:
+            fetched_at = {"": now}
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO enrichment_cache VALUES (?, ?, ?, ?, ?)",
+                (org_key, provider, json.dumps(merged, default=str), json.dumps(fetched_at), now),
+            )
+        self.stats["writes"] += 1
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM enrichment_cache").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drop the least recently used entries beyond max_entries. Returns the number evicted.
+        """
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return 0
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM enrichment_cache WHERE rowid IN "
+                "(SELECT rowid FROM enrichment_cache ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+        self.stats["evictions"] += excess
+        return excess
+
+    def log_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        logger.info(f"🗄️ Enrichment cache: {self.stats} (hit rate {hit_rate:.0%}, {len(self)} entries)")
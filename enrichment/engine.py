@@ -0,0 +1,160 @@
+# enrichment/engine.py
+
+"""
+Asyncio enrichment engine.
+A fixed pool of workers takes companies off a queue and asks every configured provider
+about each one, all over one shared aiohttp connection pool. The number of companies
+in flight is bounded by `concurrency`; each provider additionally applies its own rate
+limit and concurrency cap (see enrichment/enrich_company.py). Results are yielded as
+they complete, not in input order.
+"""
+
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from config.constants import ORGANIZATION_NAME, ENRICH_CONCURRENCY, ENRICH_WEBSITE_SCRAPER
+from enrichment.cache import EnrichmentCache
+from enrichment.enrich_company import EnrichmentProvider, MockProvider, mock_enrich
+from enrichment.router import WaterfallRouter
+from enrichment.website_scraper import WebsiteScraper
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+# (input position, company, enriched record or None, error or None)
+EnrichmentResult = Tuple[int, Dict, Optional[Dict], Optional[Exception]]
+
+
+def default_providers(enrich_fn: Callable[[Dict], Dict] = mock_enrich) -> List[EnrichmentProvider]:
+    """
+    Providers used when the caller doesn't configure any: the mock register fields, plus the
+    website scraper for website, email and phone when ENRICH_WEBSITE_SCRAPER is true.
+    """
+    providers: List[EnrichmentProvider] = [MockProvider(enrich_fn=enrich_fn)]
+    if str(os.getenv("ENRICH_WEBSITE_SCRAPER", ENRICH_WEBSITE_SCRAPER)).lower() == "true":
+        providers.append(WebsiteScraper())
+    return providers
+
+
+class EnrichmentEngine:
+    """
+    Runs enrichment providers over many companies concurrently.
+    """
+
+    def __init__(self, providers: Optional[Sequence[EnrichmentProvider]] = None,
+                 concurrency: Optional[int] = None, cache: Optional[EnrichmentCache] = None,
+                 router: Optional[WaterfallRouter] = None):
+        self.router = router
+        if router is not None:
+            providers = router.providers
+        self.providers = list(providers) if providers else default_providers()
+        self.concurrency = concurrency or int(os.getenv("ENRICH_CONCURRENCY", ENRICH_CONCURRENCY))
+        # Bulk providers can only fill a batch if that many companies are in flight
+        self.concurrency = max([self.concurrency] + [getattr(p, "batch_size", 1) for p in self.providers])
+        self.cache = cache
+
+    async def lookup(self, session: aiohttp.ClientSession, provider: EnrichmentProvider, company: Dict) -> Dict:
+        """
+        One provider's answer for a company, served from the cache when it is fresh there.
+        """
+        if self.cache is None or not provider.cacheable:
+            return await provider.enrich(session, company)
+        organisation = company.get(ORGANIZATION_NAME, "")
+        cached = self.cache.get(organisation, provider.name)
+        if cached is not None:
+            return cached
+        result = await provider.enrich(session, company)
+        self.cache.put(organisation, provider.name, result)
+        return result
+
+    async def enrich_one(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        """
+        Ask every provider about one company at once and merge their answers in provider
+        order. A failing provider only loses its own fields; the company fails only when
+        every provider failed. With a router, its waterfall decides which providers to ask.
+        """
+        if self.router is not None:
+            return await self.router.enrich(session, company, self.lookup)
+        results = await asyncio.gather(
+            *(self.lookup(session, provider, company) for provider in self.providers), return_exceptions=True
+        )
+        enriched, errors = {}, []
+        for provider, result in zip(self.providers, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+                logger.warning(f"⚠️ {provider.name} failed for {company.get(ORGANIZATION_NAME, 'Unknown')}: {result}")
+                continue
+            enriched.update({field: value for field, value in result.items() if value is not None})
+        if len(errors) == len(self.providers):
+            raise errors[0]
+        return enriched
+
+    async def process(self, companies: Sequence[Dict], emit: Callable[..., None]):
+        """
+        Run the worker pool over companies, calling emit(position, company, enriched, error)
+        from the worker as soon as each company completes.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(companies):
+            queue.put_nowait(item)
+
+        async def worker(session: aiohttp.ClientSession):
+            while True:
+                try:
+                    position, company = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    enriched = await self.enrich_one(session, company)
+                except Exception as e:
+                    emit(position, company, None, e)
+                else:
+                    emit(position, company, enriched, None)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(min(self.concurrency, len(companies)))]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+
+    async def stream(self, companies: Sequence[Dict]) -> AsyncIterator[EnrichmentResult]:
+        """
+        Enrich companies and yield (position, company, enriched, error) as each one completes.
+        """
+        done: asyncio.Queue = asyncio.Queue()
+        runner = asyncio.create_task(self.process(companies, lambda *result: done.put_nowait(result)))
+        try:
+            for _ in range(len(companies)):
+                yield await done.get()
+            await runner
+        finally:
+            runner.cancel()
+
+    def run(self, companies: Sequence[Dict],
+            on_result: Optional[Callable[[int, Dict, Optional[Dict], Optional[Exception]], None]] = None
+            ) -> List[Optional[Dict]]:
+        """
+        Synchronous entry point: enrich all companies and return results in input order
+        (None where enrichment failed). `on_result` is called as each company completes,
+        so progress can be recorded before the rest of the batch finishes.
+        """
+        results: List[Optional[Dict]] = [None] * len(companies)
+
+        def emit(position: int, company: Dict, enriched: Optional[Dict], error: Optional[Exception]):
+            results[position] = enriched
+            if on_result is not None:
+                on_result(position, company, enriched, error)
+
+        if companies:
+            asyncio.run(self.process(companies, emit))
+        for provider in self.providers:
+            logger.info(f"📈 Provider {provider.name}: {provider.stats}")
+        if self.router is not None:
+            self.router.log_stats()
+        return results
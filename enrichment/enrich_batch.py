@@ -2,50 +2,84 @@
 # enrichment/enrich_batch.py
 
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence
 from config.constants import ORGANIZATION_NAME
+from enrichment.cache import EnrichmentCache
+from enrichment.enrich_company import EnrichmentProvider, mock_enrich, register_fields
+from enrichment.engine import EnrichmentEngine, default_providers
+from enrichment.router import WaterfallRouter
+from enrichment.utils import group_by_organisation
+from utils.checkpoints import RecordProgress, sponsor_key
 
 logger = logging.getLogger("uk_sponsor_pipeline")
 
-def mock_enrich(company: Dict) -> Dict:
-    """
-    Fake enrichment for demo purposes. Replace with actual enrichment logic or API calls.
-    """
-    # Simulated enrichment data
-    company_name = company.get(ORGANIZATION_NAME, "")
-    town_city = company.get("Town/City")
-    county = company.get("County")
-    type_rating = company.get("Type & Rating")
-    route = company.get("Route")
-
-    enriched = {
-        "organization": company_name,
-        "route": route,
-        "town_city": town_city,
-        "county": county,
-        "type_rating": type_rating,
-        # "email": f"info@{company_name.lower().replace(' ', '')}.co.uk",
-        "email": f"mdshayon0@gmail.com",
-        "enriched": True
-    }
-    return enriched
-
-
-def enrich_companies(companies: List[Dict]) -> List[Dict]:
+# Fields outreach and the CRM read from every enriched record
+CONTACT_FIELDS = ["website", "email"]
+
+def enrich_companies(companies: List[Dict], progress: Optional[RecordProgress] = None,
+                     providers: Optional[Sequence[EnrichmentProvider]] = None,
+                     concurrency: Optional[int] = None, cache: Optional[EnrichmentCache] = None,
+                     router: Optional[WaterfallRouter] = None) -> List[Dict]:
     """
-    Takes a list of new sponsor dictionaries and returns enriched company data.
+    Takes a list of new sponsor dictionaries and returns enriched company data, in input order.
+    Companies are enriched concurrently by the async engine (see enrichment/engine.py), and
+    every provider call is first looked up in the persistent enrichment cache.
+    Rows of the same organisation (one per route) are enriched once and the result is fanned
+    back out to every row, each keeping its own register fields (route, rating, ...).
+    With a router, providers are tried as a waterfall (see enrichment/router.py) instead of
+    all being asked about every company.
+    If a progress log is given, companies already enriched in an earlier attempt of the
+    run are taken from it, and each newly enriched company is recorded as it completes.
     """
-    enriched_data = []
+    results: List[Optional[Dict]] = [None] * len(companies)
+    pending, positions = [], []
 
     logger.info("🔍 Starting enrichment for new sponsors...")
 
-    for company in companies:
-        try:
-            enriched = mock_enrich(company)
-            enriched_data.append(enriched)
-        except Exception as e:
-            logger.error(f"Failed to enrich company: {company.get(ORGANIZATION_NAME, 'Unknown')} | Error: {str(e)}")
+    for position, company in enumerate(companies):
+        key = sponsor_key(company)
+        if progress is not None and progress.is_done(key):
+            results[position] = progress.result(key)
+        else:
+            pending.append(company)
+            positions.append(position)
+
+    resumed = len(companies) - len(pending)
+    # One lookup per organisation; its rows share the result
+    groups = list(group_by_organisation(pending).values())
+    representatives = [pending[group[0]] for group in groups]
+
+    def on_result(index: int, company: Dict, enriched: Optional[Dict], error: Optional[Exception]):
+        if error is not None:
+            logger.error(f"Failed to enrich company: {company.get(ORGANIZATION_NAME, 'Unknown')} | Error: {str(error)}")
+            return
+        for member in groups[index]:
+            row = pending[member]
+            # Contact fields are always present, so a sponsor nothing was found for reads as such
+            record = {**dict.fromkeys(CONTACT_FIELDS), **enriched, **register_fields(row)}
+            results[positions[member]] = record
+            if progress is not None:
+                progress.mark_done(sponsor_key(row), record)
+
+    # Register fields come from mock_enrich(); the website scraper finds website, email and phone
+    providers = providers or default_providers(enrich_fn=mock_enrich)
+    owns_cache = cache is None
+    if owns_cache:
+        cache = EnrichmentCache()
+    try:
+        engine = EnrichmentEngine(providers, concurrency, cache=cache, router=router)
+        engine.run(representatives, on_result=on_result)
+        cache.evict()
+        cache.log_stats()
+    finally:
+        if owns_cache:
+            cache.close()
+    enriched_data = [record for record in results if record is not None]
 
+    if resumed:
+        logger.info(f"♻️ Reused {resumed} enrichments from an earlier attempt of this run.")
+    if len(representatives) < len(pending):
+        logger.info(f"🧩 Enriched {len(representatives)} organisations for {len(pending)} sponsor rows.")
     logger.info(f"✅ Enriched {len(enriched_data)} companies successfully.")
 
     return enriched_data
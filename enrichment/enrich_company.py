@@ -1 +1,216 @@
-# Enriches a company using APIs (Clearbit, SerpAPI, etc.)
\ No newline at end of file
+# Enriches a company using APIs (Clearbit, SerpAPI, etc.)
+# enrichment/enrich_company.py
+
+"""
+Enrichment providers. Each provider looks up one company and returns the fields it knows
+(owner, HR director, emails, phone, industry, website, ...). Providers carry their own
+token-bucket rate limit, concurrency cap, timeout and retry policy, so the engine in
+enrichment/engine.py can call several of them side by side without any one of them
+being overrun.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional
+
+import aiohttp
+
+from config.constants import (
+    ORGANIZATION_NAME, ENRICH_TIMEOUT_S, ENRICH_MAX_RETRIES, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S,
+    ENRICH_LATENCY_WINDOW
+)
+from utils.rate_limit import TokenBucket, backoff_delay
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+
+class ProviderError(Exception):
+    """
+    A provider call failed. `retryable` tells the engine whether trying again can help.
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RateLimited(ProviderError):
+    """
+    The provider answered 429; `retry_after` is its Retry-After hint in seconds, if any.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, retryable=True)
+        self.retry_after = retry_after
+
+
+def register_fields(company: Dict) -> Dict:
+    """
+    The register's own columns of a sponsor row, under the enriched record's field names.
+    These belong to the row (route, rating), not the organisation.
+    """
+    return {
+        "organization": company.get(ORGANIZATION_NAME, ""),
+        "route": company.get("Route"),
+        "town_city": company.get("Town/City"),
+        "county": company.get("County"),
+        "type_rating": company.get("Type & Rating"),
+    }
+
+
+def mock_enrich(company: Dict) -> Dict:
+    """
+    Fake enrichment for demo purposes: only the register's own fields. Contact details
+    (website, email, phone) come from real providers such as the website scraper.
+    """
+    # Simulated enrichment data
+    enriched = {
+        **register_fields(company),
+        "enriched": True
+    }
+    return enriched
+
+
+class EnrichmentProvider:
+    """
+    Base class for enrichment providers. Subclasses implement fetch(); enrich() wraps it
+    with the provider's rate limit, concurrency cap, timeout and retries.
+
+    rate            requests per second (None for unlimited), with bursts of up to `burst`
+    max_concurrency requests in flight to this provider at once
+    fields          fields the provider can fill (None if unknown), used by the waterfall router
+    cost            relative price of one call, used by the waterfall router
+    """
+
+    name = "provider"
+    # Answers depend only on the organisation, so they can be shared through the enrichment cache
+    cacheable = True
+
+    def __init__(self, name: Optional[str] = None, rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_concurrency: int = 8, timeout: float = ENRICH_TIMEOUT_S, max_retries: int = ENRICH_MAX_RETRIES,
+                 fields: Optional[Iterable[str]] = None, cost: float = 1.0):
+        self.name = name or self.name
+        self.fields = set(fields) if fields else None
+        self.cost = cost
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self._semaphore, self._loop = None, None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.stats = {"calls": 0, "ok": 0, "failed": 0, "retries": 0, "rate_limited": 0, "timeouts": 0}
+        # Latencies of recent successful calls, in seconds
+        self.latencies = deque(maxlen=ENRICH_LATENCY_WINDOW)
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        """
+        q-th quantile (0-1) of recent successful call latencies, or None before any call.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Semaphores belong to one event loop; each engine run gets a fresh one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._semaphore
+
+    async def fetch(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        raise NotImplementedError
+
+    async def enrich(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        """
+        Look a company up, retrying retryable failures with jittered exponential backoff.
+        Raises the last error once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            async with self.semaphore:
+                self.stats["calls"] += 1
+                try:
+                    started = time.perf_counter()
+                    result = await asyncio.wait_for(self.fetch(session, company), self.timeout)
+                    self.latencies.append(time.perf_counter() - started)
+                    self.stats["ok"] += 1
+                    return result
+                except RateLimited as e:
+                    self.stats["rate_limited"] += 1
+                    error, delay = e, max(e.retry_after or 0, backoff_delay(attempt, ENRICH_BACKOFF_BASE_S,
+                                                                             ENRICH_BACKOFF_MAX_S))
+                    # Everyone calling this provider backs off, not just this request
+                    self.bucket.pause(e.retry_after or 0)
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    error = ProviderError(f"{self.name} timed out after {self.timeout}s")
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+                except aiohttp.ClientError as e:
+                    error = ProviderError(f"{self.name} request failed: {e}")
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+                except ProviderError as e:
+                    error = e
+                    delay = backoff_delay(attempt, ENRICH_BACKOFF_BASE_S, ENRICH_BACKOFF_MAX_S)
+
+            if not error.retryable or attempt == self.max_retries:
+                self.stats["failed"] += 1
+                raise error
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+
+class MockProvider(EnrichmentProvider):
+    """
+    Provider backed by mock_enrich(), used until real providers are configured.
+    """
+
+    name = "mock"
+    # mock_enrich echoes per-row register fields (route, rating), which must not be shared across rows
+    cacheable = False
+
+    def __init__(self, enrich_fn: Callable[[Dict], Dict] = mock_enrich, **kwargs):
+        super().__init__(**kwargs)
+        self.enrich_fn = enrich_fn
+
+    async def fetch(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        return self.enrich_fn(company)
+
+
+class HttpProvider(EnrichmentProvider):
+    """
+    Generic JSON-over-HTTP provider: POSTs the company to `url` and returns the JSON body,
+    restricted to `fields` when given. 404 means "nothing known" and returns {}.
+    """
+
+    def __init__(self, name: str, url: str, headers: Optional[Dict] = None, **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.url = url
+        self.headers = headers or {}
+
+    def payload(self, company: Dict) -> Dict:
+        return {
+            "organization": company.get(ORGANIZATION_NAME, ""),
+            "town_city": company.get("Town/City"),
+            "county": company.get("County"),
+            "route": company.get("Route"),
+        }
+
+    async def fetch(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        async with session.post(self.url, json=self.payload(company), headers=self.headers) as response:
+            if response.status == 429:
+                retry_after = response.headers.get("Retry-After")
+                raise RateLimited(f"{self.name} rate limited", float(retry_after) if retry_after else None)
+            if response.status == 404:
+                return {}
+            if response.status >= 500:
+                raise ProviderError(f"{self.name} returned {response.status}")
+            if response.status >= 400:
+                raise ProviderError(f"{self.name} returned {response.status}", retryable=False)
+            data = await response.json()
+
+        if self.fields is not None:
+            data = {k: v for k, v in data.items() if k in self.fields}
+        return data
@@ -0,0 +1,150 @@
+# enrichment/enriched_store.py
+
+"""
+Append-only, date-partitioned store of enriched sponsor records under data/enriched.
+Each enrichment run writes one gzip-compressed JSONL part into its date's partition
+(records/<YYYY-MM-DD>/part-<run>.jsonl.gz) and a SQLite index records where every
+record lives, by sponsor key, canonical organisation name and enrichment date. Later
+stages, reruns and ad-hoc reports stream records from here in bounded batches instead
+of re-enriching or holding everything in memory.
+"""
+
+import os
+import gzip
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from config.constants import ENRICHED_DIR, ENRICHED_BATCH_SIZE
+from enrichment.utils import normalize_org_name, organisation_key
+from utils.checkpoints import sponsor_key
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    path        TEXT PRIMARY KEY,
+    enrich_date TEXT NOT NULL,
+    records     INTEGER NOT NULL,
+    created_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    sponsor_key TEXT NOT NULL,
+    org_key     TEXT NOT NULL,
+    enrich_date TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    line        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_org ON records (org_key, enrich_date);
+CREATE INDEX IF NOT EXISTS idx_records_key ON records (sponsor_key, enrich_date);
+CREATE INDEX IF NOT EXISTS idx_records_date ON records (enrich_date);
+"""
+
+
+class EnrichedStore:
+    """
+    Date-partitioned JSONL parts of enriched records plus their SQLite index.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or ENRICHED_DIR
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.base_dir, "enriched_index.sqlite3"))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, records: List[Dict], enrich_date: str, run_id: Optional[str] = None) -> str:
+        """
+        Write records as one part of the date's partition and index them.
+        Writing the same run_id again replaces that part, so reruns don't duplicate records.
+        """
+        partition = os.path.join(self.base_dir, "records", enrich_date)
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{run_id or enrich_date}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+        os.replace(tmp_path, path)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE path = ?", (path,))
+            self.conn.executemany(
+                "INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                ((sponsor_key(record), organisation_key(record), enrich_date, path, line)
+                 for line, record in enumerate(records)),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?)",
+                (path, enrich_date, len(records), datetime.now().isoformat(timespec="seconds")),
+            )
+        logger.info(f"💾 Stored {len(records)} enriched records in {path}")
+        return path
+
+    @staticmethod
+    def read_part(path: str) -> Iterator[Dict]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def dates(self) -> List[str]:
+        rows = self.conn.execute("SELECT DISTINCT enrich_date FROM parts ORDER BY enrich_date").fetchall()
+        return [row[0] for row in rows]
+
+    def iter_batches(self, start: str, end: Optional[str] = None,
+                     batch_size: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Stream the records enriched between start and end (inclusive, YYYY-MM-DD) in
+        lists of at most batch_size, reading one part at a time.
+        """
+        batch_size = batch_size or ENRICHED_BATCH_SIZE
+        parts = self.conn.execute(
+            "SELECT path FROM parts WHERE enrich_date BETWEEN ? AND ? ORDER BY enrich_date, created_at, path",
+            (start, end or start),
+        ).fetchall()
+
+        batch = []
+        for part in parts:
+            for record in self.read_part(part["path"]):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def read_date(self, enrich_date: str) -> List[Dict]:
+        return [record for batch in self.iter_batches(enrich_date) for record in batch]
+
+    def lookup(self, organisation: str, latest_only: bool = True) -> List[Dict]:
+        """
+        Enriched records of an organisation (all its routes), matched on the canonical
+        name; by default only those from its most recent enrichment date.
+        """
+        rows = self.conn.execute(
+            "SELECT enrich_date, path, line FROM records WHERE org_key = ? ORDER BY enrich_date DESC, path, line",
+            (normalize_org_name(organisation),),
+        ).fetchall()
+        if latest_only and rows:
+            rows = [row for row in rows if row["enrich_date"] == rows[0]["enrich_date"]]
+
+        wanted: Dict[str, set] = {}
+        for row in rows:
+            wanted.setdefault(row["path"], set()).add(row["line"])
+        found = []
+        for path, lines in wanted.items():
+            found += [record for line, record in enumerate(self.read_part(path)) if line in lines]
+        return found
@@ -0,0 +1,145 @@
+# enrichment/router.py
+
+"""
+Waterfall routing across enrichment providers.
+Instead of asking every provider about every company, providers are tried one after
+another, best first, and the waterfall stops as soon as the required fields are filled.
+"Best" is ranked from live statistics: the share of calls that filled a missing field,
+per unit of cost and median latency. When a provider runs past its own p95 latency a
+hedged request goes to the next provider in line, and whichever answers first is used.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import aiohttp
+
+from config.constants import (
+    ORGANIZATION_NAME, ENRICH_REQUIRED_FIELDS, ENRICH_HEDGE_MIN_SAMPLES, ENRICH_HEDGE_QUANTILE,
+    ENRICH_ROUTER_LATENCY_WEIGHT
+)
+from enrichment.enrich_company import EnrichmentProvider
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+# (session, provider, company) -> answer; the engine passes its cache-aware lookup
+Lookup = Callable[[aiohttp.ClientSession, EnrichmentProvider, Dict], Awaitable[Dict]]
+
+
+class WaterfallRouter:
+    """
+    Calls providers in ranked order until `required_fields` are filled.
+    """
+
+    def __init__(self, providers: Sequence[EnrichmentProvider], required_fields: Optional[Sequence[str]] = None,
+                 hedge: bool = True):
+        self.providers = list(providers)
+        self.required_fields = list(required_fields or ENRICH_REQUIRED_FIELDS)
+        self.hedge = hedge
+        self.stats = {provider.name: {"attempts": 0, "hits": 0, "hedged": 0, "hedge_wins": 0}
+                      for provider in self.providers}
+
+    def hit_rate(self, provider: EnrichmentProvider) -> float:
+        """
+        Share of calls that filled at least one missing field, smoothed so that a
+        provider without history starts at 0.5 and still gets tried.
+        """
+        stats = self.stats[provider.name]
+        return (stats["hits"] + 1) / (stats["attempts"] + 2)
+
+    def score(self, provider: EnrichmentProvider) -> float:
+        median = provider.latency_percentile(0.5) or 0.0
+        return self.hit_rate(provider) / (provider.cost + ENRICH_ROUTER_LATENCY_WEIGHT * median)
+
+    def ranked(self, missing: Set[str], exclude: Set[str]) -> List[EnrichmentProvider]:
+        """
+        Providers that can fill at least one missing field, best score first.
+        """
+        candidates = [
+            provider for provider in self.providers
+            if provider.name not in exclude and (provider.fields is None or provider.fields & missing)
+        ]
+        return sorted(candidates, key=self.score, reverse=True)
+
+    def hedge_delay(self, provider: EnrichmentProvider) -> Optional[float]:
+        """
+        Seconds to wait on a provider before hedging, or None while it has too little history.
+        """
+        if not self.hedge or len(provider.latencies) < ENRICH_HEDGE_MIN_SAMPLES:
+            return None
+        return provider.latency_percentile(ENRICH_HEDGE_QUANTILE)
+
+    async def call(self, lookup: Lookup, session: aiohttp.ClientSession, company: Dict,
+                   primary: EnrichmentProvider, backup: Optional[EnrichmentProvider]
+                   ) -> List[Tuple[EnrichmentProvider, Optional[Dict]]]:
+        """
+        Ask the primary provider; if it is slower than its p95 and a backup exists, ask the
+        backup too and use whichever answers first. Returns (provider, answer or None) for
+        every provider that was asked.
+        """
+        delay = self.hedge_delay(primary) if backup is not None else None
+        first = asyncio.ensure_future(lookup(session, primary, company))
+        if delay is None:
+            try:
+                return [(primary, await first)]
+            except Exception as e:
+                logger.warning(f"⚠️ {primary.name} failed for {company.get(ORGANIZATION_NAME, 'Unknown')}: {e}")
+                return [(primary, None)]
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return [(primary, first.result() if not first.exception() else None)]
+
+        self.stats[backup.name]["hedged"] += 1
+        second = asyncio.ensure_future(lookup(session, backup, company))
+        tasks = {first: primary, second: backup}
+        pending = set(tasks)
+        asked = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                answer = task.result() if not task.exception() else None
+                asked.append((tasks[task], answer))
+                if answer:
+                    if tasks[task] is backup:
+                        self.stats[backup.name]["hedge_wins"] += 1
+                    for other in pending:
+                        other.cancel()
+                    return asked
+        return asked
+
+    async def enrich(self, session: aiohttp.ClientSession, company: Dict, lookup: Lookup) -> Dict:
+        """
+        Run the waterfall for one company and return the merged answer.
+        Raises LookupError when no provider produced anything.
+        """
+        enriched: Dict = {}
+        missing = set(self.required_fields)
+        asked: Set[str] = set()
+
+        while missing:
+            ranked = self.ranked(missing, exclude=asked)
+            if not ranked:
+                break
+            primary, backup = ranked[0], ranked[1] if len(ranked) > 1 else None
+            for provider, answer in await self.call(lookup, session, company, primary, backup):
+                asked.add(provider.name)
+                self.stats[provider.name]["attempts"] += 1
+                answer = {field: value for field, value in (answer or {}).items() if value is not None}
+                if set(answer) & missing:
+                    self.stats[provider.name]["hits"] += 1
+                # Earlier (better ranked) answers win over later ones
+                enriched.update({field: value for field, value in answer.items() if field not in enriched})
+                missing -= set(answer)
+
+        if not enriched:
+            raise LookupError(f"No provider could enrich {company.get(ORGANIZATION_NAME, 'Unknown')}")
+        return enriched
+
+    def log_stats(self):
+        for provider in self.providers:
+            logger.info(
+                f"🪜 Router {provider.name}: {self.stats[provider.name]} "
+                f"(hit rate {self.hit_rate(provider):.0%}, p95 {provider.latency_percentile(0.95)})"
+            )
@@ -1 +1,73 @@
-# Helper for validation, standardizing names, etc.
\ No newline at end of file
+# Helper for validation, standardizing names, etc.
+# enrichment/utils.py
+
+import re
+import unicodedata
+from typing import Dict, List
+
+# Legal-form spellings mapped to one canonical token
+LEGAL_FORMS = {
+    "limited": "ltd", "ltd": "ltd",
+    "plc": "plc", "public limited company": "plc",
+    "llp": "llp", "limited liability partnership": "llp",
+    "company": "co", "co": "co",
+    "incorporated": "inc", "inc": "inc",
+    "corporation": "corp", "corp": "corp",
+}
+
+# Tokens that carry no identity on their own and are ignored for blocking
+NOISE_TOKENS = {"the", "and", "of", "uk", "group", "holdings", "services", "t/a", *LEGAL_FORMS.values()}
+
+_PHRASE_FORMS = sorted((k for k in LEGAL_FORMS if " " in k), key=len, reverse=True)
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_org_name(name: str) -> str:
+    """
+    Canonical key for an organisation name: accents stripped, case-folded, '&' read as 'and',
+    punctuation removed, whitespace collapsed, legal forms unified ('Limited' -> 'ltd')
+    and a leading 'the' dropped. 'A.B.C. Limited' and 'ABC Ltd' share a key.
+    """
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    text = text.casefold().replace("&", " and ")
+    # Join dotted initials ("a.b.c.") before punctuation is stripped
+    text = re.sub(r"\b(?:[a-z]\.){2,}", lambda m: m.group().replace(".", ""), text)
+    text = " ".join(_NON_ALNUM.sub(" ", text).split())
+
+    for phrase in _PHRASE_FORMS:
+        text = re.sub(rf"\b{phrase}\b", LEGAL_FORMS[phrase], text)
+
+    tokens = [LEGAL_FORMS.get(token, token) for token in text.split()]
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens = tokens[1:]
+    return " ".join(tokens)
+
+
+def blocking_tokens(key: str) -> List[str]:
+    """
+    Distinctive tokens of a canonical key, used to bucket candidate matches.
+    Falls back to all tokens when a name is made only of noise words.
+    """
+    tokens = key.split()
+    distinctive = [token for token in tokens if token not in NOISE_TOKENS]
+    return distinctive or tokens
+
+
+def organisation_key(record: Dict) -> str:
+    """
+    Canonical organisation key of a raw register row or an enriched record.
+    """
+    return normalize_org_name(record.get("Organisation Name", record.get("organization", "")))
+
+
+def group_by_organisation(records: List[Dict]) -> Dict[str, List[int]]:
+    """
+    Positions of the records belonging to each organisation, in first-seen order.
+    The register lists a company once per route, so one organisation can own several rows.
+    """
+    groups: Dict[str, List[int]] = {}
+    for position, record in enumerate(records):
+        groups.setdefault(organisation_key(record), []).append(position)
+    return groups
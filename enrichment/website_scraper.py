@@ -0,0 +1,252 @@
+# enrichment/website_scraper.py
+
+"""
+Website discovery and contact extraction.
+Finds a sponsor's website (a known URL, or domains guessed from its name), then reads
+the homepage and a few contact/leadership pages it links to for email addresses, phone
+numbers and the leadership page. A guessed domain is only taken for the sponsor's site
+when its homepage mentions the sponsor's name; otherwise it may well belong to somebody
+else, whose addresses must not become outreach recipients. Page bodies are read up to
+SCRAPER_MAX_BYTES. Runs as an enrichment provider, so it shares the
+engine's keep-alive connection pool, cache and rate limits. On top of that it caps
+concurrent requests per domain, honours robots.txt, and parses HTML in a process pool
+so BeautifulSoup never blocks the event loop.
+"""
+
+import re
+import atexit
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from config.constants import (
+    ORGANIZATION_NAME, SCRAPER_USER_AGENT, SCRAPER_MAX_PAGES, SCRAPER_PER_DOMAIN_CONCURRENCY, SCRAPER_TIMEOUT_S,
+    SCRAPER_PARSE_WORKERS, SCRAPER_MAX_BYTES
+)
+from enrichment.enrich_company import EnrichmentProvider
+from enrichment.utils import normalize_org_name, LEGAL_FORMS
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+# UK numbers: +44 or 0, then 9-10 digits with optional spaces, dots or dashes
+PHONE_PATTERN = re.compile(r"(?:\+44\s?\(0\)\s?|\+44\s?|\b0)\d(?:[\s.-]?\d){8,9}\b")
+CONTACT_LINK_PATTERN = re.compile(r"contact|get-in-touch|enquir", re.I)
+LEADERSHIP_LINK_PATTERN = re.compile(r"team|leadership|management|board|people|about|directors", re.I)
+# Addresses that are never real contacts
+IGNORED_EMAIL_PATTERN = re.compile(r"\.(png|jpe?g|gif|svg|webp)$|example\.(com|org)$|sentry|wixpress", re.I)
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all scrapers in this process, created on first use.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=SCRAPER_PARSE_WORKERS)
+        atexit.register(_parse_pool.shutdown, wait=False, cancel_futures=True)
+    return _parse_pool
+
+
+def parse_page(html: str, url: str, name: Optional[str] = None) -> Dict:
+    """
+    Extract emails, phone numbers and contact/leadership links from one HTML page, and
+    whether its text mentions `name` (a normalized organisation name), when given.
+    Runs in a worker process, so it takes and returns only plain data.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    emails, phones, contact_links, leadership_links = [], [], [], []
+
+    for anchor in soup.find_all("a", href=True):
+        href = anchor["href"].strip()
+        if href.lower().startswith("mailto:"):
+            emails.append(href[7:].split("?")[0])
+        elif href.lower().startswith("tel:"):
+            phones.append(href[4:])
+        else:
+            link = urljoin(url, href)
+            label = f"{href} {anchor.get_text(' ', strip=True)}"
+            if CONTACT_LINK_PATTERN.search(label):
+                contact_links.append(link)
+            elif LEADERSHIP_LINK_PATTERN.search(label):
+                leadership_links.append(link)
+
+    for tag in soup(["script", "style"]):
+        tag.decompose()
+    text = soup.get_text(" ")
+    emails += EMAIL_PATTERN.findall(text)
+    phones += [match.group() for match in PHONE_PATTERN.finditer(text)]
+
+    return {
+        "emails": list(dict.fromkeys(e.lower() for e in emails if not IGNORED_EMAIL_PATTERN.search(e))),
+        "phones": list(dict.fromkeys(" ".join(p.split()) for p in phones)),
+        "contact_links": list(dict.fromkeys(contact_links)),
+        "leadership_links": list(dict.fromkeys(leadership_links)),
+        "mentions_name": bool(name) and f" {name} " in f" {normalize_org_name(text)} ",
+    }
+
+
+def name_tokens(company: Dict) -> List[str]:
+    """
+    A sponsor's normalized name without legal forms ("Acme Care Ltd" -> ["acme", "care"]).
+    """
+    return [t for t in normalize_org_name(company.get(ORGANIZATION_NAME, "")).split()
+            if t not in set(LEGAL_FORMS.values())]
+
+
+def guess_websites(company: Dict) -> List[str]:
+    """
+    Candidate homepages for a sponsor: its known website first, then domains guessed from
+    its name ("Acme Care Ltd" -> acmecare.co.uk, acmecare.com, acme-care.co.uk).
+    """
+    known = company.get("website")
+    candidates = [known] if known else []
+    tokens = name_tokens(company)
+    if tokens:
+        for slug in dict.fromkeys(["".join(tokens), "-".join(tokens)]):
+            candidates += [f"https://www.{slug}.co.uk", f"https://www.{slug}.com"]
+    return candidates
+
+
+class WebsiteScraper(EnrichmentProvider):
+    """
+    Provider that discovers a sponsor's website and scrapes it for contact details.
+    Returns website, email (best guess), emails, phone and leadership_url. Candidates other
+    than the sponsor's known website must mention its name on their homepage.
+    """
+
+    name = "website"
+
+    def __init__(self, resolve: Optional[Callable[[Dict], List[str]]] = None, max_pages: int = SCRAPER_MAX_PAGES,
+                 per_domain: int = SCRAPER_PER_DOMAIN_CONCURRENCY, use_process_pool: bool = True,
+                 max_bytes: int = SCRAPER_MAX_BYTES, **kwargs):
+        kwargs.setdefault("timeout", SCRAPER_TIMEOUT_S)
+        kwargs.setdefault("fields", ["website", "email", "emails", "phone", "leadership_url"])
+        super().__init__(**kwargs)
+        self.resolve = resolve or guess_websites
+        self.max_pages = max_pages
+        self.per_domain = per_domain
+        self.use_process_pool = use_process_pool
+        self.max_bytes = max_bytes
+        self.robots: Dict[str, Optional[RobotFileParser]] = {}
+        self.domain_locks: Dict[str, asyncio.Semaphore] = {}
+        self._domain_loop = None
+        self.headers = {"User-Agent": SCRAPER_USER_AGENT}
+
+    def domain_semaphore(self, domain: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._domain_loop is not loop:
+            self.domain_locks, self._domain_loop = {}, loop
+        if domain not in self.domain_locks:
+            self.domain_locks[domain] = asyncio.Semaphore(self.per_domain)
+        return self.domain_locks[domain]
+
+    async def get(self, session: aiohttp.ClientSession, url: str) -> Optional[Tuple[int, str, str]]:
+        """
+        GET a URL under the per-domain cap; returns (status, final URL, body), or None on connection
+        errors. At most max_bytes of the body are read.
+        """
+        async with self.domain_semaphore(urlparse(url).netloc):
+            try:
+                async with session.get(url, headers=self.headers, allow_redirects=True) as response:
+                    body = bytearray()
+                    while len(body) < self.max_bytes:
+                        chunk = await response.content.read(self.max_bytes - len(body))
+                        if not chunk:
+                            break
+                        body += chunk
+                    return response.status, str(response.url), body.decode(response.charset or "utf-8", "replace")
+            except (aiohttp.ClientError, LookupError, ValueError):
+                return None
+
+    async def allowed(self, session: aiohttp.ClientSession, url: str) -> bool:
+        """
+        robots.txt check, fetched once per domain. A missing robots.txt (4xx) allows
+        everything; an unreachable one (5xx) disallows, as the robots standard suggests.
+        """
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        if origin not in self.robots:
+            response = await self.get(session, f"{origin}/robots.txt")
+            parser = RobotFileParser()
+            if response is None or response[0] >= 500:
+                parser.disallow_all = True
+            elif response[0] >= 400:
+                parser.allow_all = True
+            else:
+                parser.parse(response[2].splitlines())
+            self.robots[origin] = parser
+        return self.robots[origin].can_fetch(SCRAPER_USER_AGENT, url)
+
+    async def parse(self, html: str, url: str, name: Optional[str] = None) -> Dict:
+        loop = asyncio.get_running_loop()
+        if self.use_process_pool:
+            return await loop.run_in_executor(parse_pool(), parse_page, html, url, name)
+        return parse_page(html, url, name)
+
+    async def scrape(self, session: aiohttp.ClientSession, homepage: str, name: Optional[str] = None
+                     ) -> Optional[Dict]:
+        """
+        Crawl a homepage and the contact/leadership pages it links to on the same site.
+        Returns None when the homepage can't be fetched, or doesn't mention `name` when one is
+        given (the candidate is not the site).
+        """
+        if not await self.allowed(session, homepage):
+            logger.info(f"🤖 robots.txt disallows {homepage}")
+            return None
+        response = await self.get(session, homepage)
+        if response is None or response[0] >= 400:
+            return None
+        status, final_url, html = response
+        site = urlparse(final_url).netloc
+
+        pages = [await self.parse(html, final_url, name)]
+        if name is not None and not pages[0]["mentions_name"]:
+            logger.info(f"🔎 {final_url} doesn't mention '{name}' — not taken as its website")
+            return None
+        links = [link for link in pages[0]["contact_links"] + pages[0]["leadership_links"]
+                 if urlparse(link).netloc == site]
+        follow = list(dict.fromkeys(links))[:self.max_pages - 1]
+
+        async def fetch_page(url: str) -> Optional[Dict]:
+            if not await self.allowed(session, url):
+                return None
+            page = await self.get(session, url)
+            if page is None or page[0] >= 400:
+                return None
+            return await self.parse(page[2], page[1])
+
+        pages += [page for page in await asyncio.gather(*(fetch_page(url) for url in follow)) if page]
+
+        emails = list(dict.fromkeys(email for page in pages for email in page["emails"]))
+        phones = list(dict.fromkeys(phone for page in pages for phone in page["phones"]))
+        leadership = [link for link in pages[0]["leadership_links"] if urlparse(link).netloc == site]
+        domain = site.split(":")[0].removeprefix("www.")
+        # Prefer an address on the sponsor's own domain
+        own = [email for email in emails if email.endswith(f"@{domain}")]
+
+        return {
+            "website": f"{urlparse(final_url).scheme}://{site}",
+            "email": (own or emails or [None])[0],
+            "emails": emails or None,
+            "phone": phones[0] if phones else None,
+            "leadership_url": leadership[0] if leadership else None,
+        }
+
+    async def fetch(self, session: aiohttp.ClientSession, company: Dict) -> Dict:
+        known = company.get("website")
+        name = " ".join(name_tokens(company))
+        for homepage in self.resolve(company):
+            # Only a guessed domain has to prove it belongs to the sponsor
+            result = await self.scrape(session, homepage, None if homepage == known else name)
+            if result is not None:
+                return {field: value for field, value in result.items() if value is not None}
+        return {}
@@ -0,0 +1,240 @@
+# extraction/change_log.py
+
+"""
+Append-only change history of the sponsor register.
+
+Instead of keeping every day's full register, one baseline snapshot is stored and each
+daily diff (see compare_csv.diff_registers) is appended as a small gzip-compressed JSONL
+segment. Storage grows with churn, not with register size times days. A SQLite index
+records every segment and every event by organisation, so the register can be rebuilt
+as of any date and an organisation's history looked up without scanning all segments.
+"""
+
+import os
+import gzip
+import json
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from config.constants import (
+    CHANGELOG_DIR, ORGANIZATION_NAME, CHANGES_COL, PREVIOUS_NAME_COL, MATCH_SCORE_COL, FILE_COLS
+)
+from enrichment.utils import normalize_org_name
+from extraction.snapshot_store import save_snapshot, load_snapshot
+from utils.checkpoints import sponsor_key
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS baseline (
+    snapshot_date TEXT PRIMARY KEY,
+    path          TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    segment_date TEXT PRIMARY KEY,
+    path         TEXT NOT NULL,
+    added        INTEGER NOT NULL,
+    removed      INTEGER NOT NULL,
+    changed      INTEGER NOT NULL,
+    renamed      INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS org_events (
+    org_key      TEXT NOT NULL,
+    segment_date TEXT NOT NULL,
+    event_type   TEXT NOT NULL,
+    line         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_org_events_org ON org_events (org_key, segment_date);
+CREATE INDEX IF NOT EXISTS idx_org_events_date ON org_events (segment_date);
+"""
+
+# Order in which a day's events are replayed; renames drop the old key before adds/changes land
+EVENT_TYPES = ["removed", "renamed", "added", "changed"]
+
+
+def frame_records(frame: pd.DataFrame) -> List[Dict]:
+    """
+    DataFrame rows as plain dicts with None for missing values (JSON-safe).
+    """
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+class ChangeLog:
+    """
+    Baseline snapshot plus daily change segments, indexed in SQLite.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or CHANGELOG_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def baseline(self) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM baseline ORDER BY snapshot_date LIMIT 1").fetchone()
+        return dict(row) if row else None
+
+    def set_baseline(self, df: pd.DataFrame, snapshot_date: str) -> str:
+        """
+        Store the full register once as the starting point for reconstruction.
+        """
+        path = save_snapshot(df[[col for col in df.columns if col in FILE_COLS]], snapshot_date,
+                             directory=self.directory)
+        self.conn.execute("INSERT OR REPLACE INTO baseline VALUES (?, ?)", (snapshot_date, path))
+        self.conn.commit()
+        logger.info(f"📚 Change log baseline set to {snapshot_date} ({len(df)} rows)")
+        return path
+
+    def last_date(self) -> Optional[str]:
+        """
+        Date the history currently reaches: the newest segment, else the baseline.
+        """
+        row = self.conn.execute("SELECT MAX(segment_date) FROM segments").fetchone()
+        if row[0]:
+            return row[0]
+        baseline = self.baseline()
+        return baseline["snapshot_date"] if baseline else None
+
+    def append(self, segment_date: str, register_diff: Dict[str, pd.DataFrame],
+               previous_date: Optional[str] = None) -> str:
+        """
+        Write one day's diff as a compressed segment and index its events by organisation.
+        Re-appending the same date replaces that day's segment (idempotent reruns).
+        `previous_date` is the date the diff was taken against; a mismatch with the end of
+        the recorded history means a day's changes are missing, which is logged.
+        """
+        baseline = self.baseline()
+        if baseline and segment_date <= baseline["snapshot_date"]:
+            raise ValueError(f"Segment date {segment_date} is not after the baseline {baseline['snapshot_date']}")
+        last_date = self.last_date()
+        if previous_date and last_date and last_date != segment_date and previous_date != last_date:
+            logger.warning(f"⚠️ Change log ends at {last_date} but this diff is against {previous_date}")
+
+        path = os.path.join(self.directory, f"changes-{segment_date}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+        index_rows = []
+        counts = {}
+
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            line = 0
+            for event_type in EVENT_TYPES:
+                frame = register_diff.get(event_type)
+                records = frame_records(frame) if frame is not None else []
+                counts[event_type] = len(records)
+                for record in records:
+                    changes = record.pop(CHANGES_COL, None)
+                    previous_name = record.pop(PREVIOUS_NAME_COL, None)
+                    record.pop(MATCH_SCORE_COL, None)
+                    event = {"date": segment_date, "type": event_type, "key": sponsor_key(record), "record": record}
+                    if changes:
+                        event["changes"] = changes
+                    org_keys = {normalize_org_name(record.get(ORGANIZATION_NAME))}
+                    if previous_name:
+                        event["previous_key"] = sponsor_key({ORGANIZATION_NAME: previous_name,
+                                                             "Route": record.get("Route")})
+                        # A rename is found under both the old and the new name
+                        org_keys.add(normalize_org_name(previous_name))
+                    f.write(json.dumps(event, default=str) + "\n")
+                    index_rows.extend((org_key, segment_date, event_type, line) for org_key in org_keys)
+                    line += 1
+        os.replace(tmp_path, path)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM org_events WHERE segment_date = ?", (segment_date,))
+            self.conn.executemany("INSERT INTO org_events VALUES (?, ?, ?, ?)", index_rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+                (segment_date, path, counts["added"], counts["removed"], counts["changed"], counts["renamed"]),
+            )
+
+        logger.info(f"📚 Appended change segment for {segment_date}: {counts}")
+        return path
+
+    def read_segment(self, path: str) -> List[Dict]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def segments(self, after: Optional[str] = None, until: Optional[str] = None) -> List[Dict]:
+        query, params = "SELECT * FROM segments WHERE 1=1", []
+        if after:
+            query, params = query + " AND segment_date > ?", params + [after]
+        if until:
+            query, params = query + " AND segment_date <= ?", params + [until]
+        rows = self.conn.execute(query + " ORDER BY segment_date", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def reconstruct(self, as_of: str) -> pd.DataFrame:
+        """
+        Rebuild the register as it stood on `as_of` (YYYY-MM-DD): the baseline with every
+        segment up to and including that date replayed on top of it.
+        """
+        baseline = self.baseline()
+        if not baseline or as_of < baseline["snapshot_date"]:
+            raise ValueError(f"No change history covers {as_of}")
+
+        # Only the last event per key matters, so replay into a dict and apply it once
+        final: Dict[str, Optional[Dict]] = {}
+        for segment in self.segments(after=baseline["snapshot_date"], until=as_of):
+            for event in self.read_segment(segment["path"]):
+                if event["type"] == "removed":
+                    final[event["key"]] = None
+                elif event["type"] == "renamed":
+                    final[event["previous_key"]] = None
+                    final[event["key"]] = event["record"]
+                else:
+                    final[event["key"]] = event["record"]
+
+        df = load_snapshot(baseline["path"])
+        keys = df[ORGANIZATION_NAME].astype(str) + "|" + df["Route"].astype(str)
+        df = df[~keys.isin(list(final)).to_numpy()]
+        upserts = pd.DataFrame([record for record in final.values() if record is not None], columns=df.columns)
+        result = pd.concat([df.astype(object), upserts.astype(object)], ignore_index=True)
+        return result[list(df.columns)]
+
+    def history(self, organisation: str) -> List[Dict]:
+        """
+        All events recorded for an organisation (matched on its canonical name), oldest first.
+        """
+        rows = self.conn.execute(
+            "SELECT e.segment_date, e.line, s.path FROM org_events e "
+            "JOIN segments s ON s.segment_date = e.segment_date "
+            "WHERE e.org_key = ? ORDER BY e.segment_date, e.line",
+            (normalize_org_name(organisation),),
+        ).fetchall()
+
+        events, cache = [], {}
+        for row in rows:
+            if row["path"] not in cache:
+                cache[row["path"]] = self.read_segment(row["path"])
+            events.append(cache[row["path"]][row["line"]])
+        return events
+
+    def first_seen(self, organisation: str) -> Optional[str]:
+        """
+        Date an organisation first appeared: its first 'added' event, or the baseline date
+        if it was already in the baseline register.
+        """
+        for event in self.history(organisation):
+            if event["type"] == "added":
+                return event["date"]
+        baseline = self.baseline()
+        if baseline:
+            df = load_snapshot(baseline["path"], columns=[ORGANIZATION_NAME])
+            key = normalize_org_name(organisation)
+            if df[ORGANIZATION_NAME].map(normalize_org_name).eq(key).any():
+                return baseline["snapshot_date"]
+        return None
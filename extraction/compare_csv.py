@@ -2,108 +2,202 @@
 # extraction/compare_csv.py
 
 import os
-import shutil
+import logging
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import Optional
-from config.constants import REQUIRED_COLS, ORGANIZATION_NAME, ARCHIVE_DIR
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+from config.constants import REQUIRED_COLS, KEY_COLS, CHANGES_COL, ARCHIVE_DIR, RAW_DIR, PREPROCESS_CHUNK_SIZE
+from extraction.entity_resolution import match_renames
 from extraction.parse_sponsors import preprocess_sponsor_data
+from extraction.snapshot_catalog import DATE_PATTERN, SnapshotCatalog
+from extraction.snapshot_store import is_snapshot, load_snapshot
 
+logger = logging.getLogger("uk_sponsor_pipeline")
 
-raw_dir = './data/raw'
 
-
-def find_file_with_date(dir_path: str, date_str: str) -> Optional[str]:
+def clean_raw_files(catalog: SnapshotCatalog, today: Optional[date] = None, directory: Optional[str] = None) -> List[str]:
     """
-    Look for a CSV file in a directory containing a specific date string in its filename.
-    Returns the file path if found, otherwise None.
+    Delete downloaded CSVs whose date the catalog no longer retains, so the raw directory
+    follows the same retention policy as the snapshots. Today's download is always kept.
+    Returns the deleted paths.
     """
-    files = [os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.csv')]
-    for file in files:
-        if date_str in os.path.basename(file):
-            return file
-    return None
-
-def clean_old_files(dir_path: str, keep_dates: set):
+    today = today or date.today()
+    directory = directory or RAW_DIR
+    if not os.path.isdir(directory):
+        return []
+
+    keep_dates = {entry["snapshot_date"] for entry in catalog.entries()} | {today.isoformat()}
+    removed = []
+    for name in sorted(os.listdir(directory)):
+        match = DATE_PATTERN.search(name)
+        if not match or not name.endswith(".csv") or match.group() in keep_dates:
+            continue
+        path = os.path.join(directory, name)
+        os.remove(path)
+        removed.append(path)
+    if removed:
+        logger.info(f"🧹 Raw retention deleted {len(removed)} downloaded CSVs")
+    return removed
+
+
+def get_yesterday_file(directory: str = ARCHIVE_DIR, catalog: Optional[SnapshotCatalog] = None,
+                       today: Optional[date] = None) -> str:
+    """
+    Return the path of the most recent snapshot before today, looked up in the snapshot catalog.
+    If the catalog has nothing before today, it is seeded from the files already in the
+    archive and raw directories (one-off migration from the directory layout).
+    The catalog's retention policy is applied afterwards, to the snapshots and to the raw
+    downloads; it always keeps the newest snapshots, so a missed day never drops the history
+    we compare against.
+    """
+    today = today or date.today()
+    owns_catalog = catalog is None
+    catalog = catalog or SnapshotCatalog()
+
+    try:
+        entry = catalog.latest_before(today.isoformat())
+        if entry is None:
+            imported = catalog.import_existing([directory, RAW_DIR])
+            logger.info(f"🗂️ Seeded snapshot catalog with {imported} existing files")
+            entry = catalog.latest_before(today.isoformat())
+        catalog.apply_retention(today=today)
+        clean_raw_files(catalog, today=today)
+
+        if not entry:
+            raise FileNotFoundError("No snapshot before today found in the snapshot catalog.")
+        if not os.path.exists(entry["path"]):
+            raise FileNotFoundError(f"Catalogued snapshot for {entry['snapshot_date']} is missing: {entry['path']}")
+
+        logger.info(f"📅 Comparing against snapshot from {entry['snapshot_date']}: {entry['path']}")
+        return entry["path"]
+    finally:
+        if owns_catalog:
+            catalog.close()
+
+
+def load_register(path: str, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
     """
-    Delete CSV files in a directory that don't contain any of the specified dates.
+    Load a cleaned register from either a columnar snapshot or a legacy raw CSV.
+    Snapshots are read directly (only the requested columns); CSVs go through preprocessing.
     """
-    files = [os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.csv')]
-    for file in files:
-        if not any(date in os.path.basename(file) for date in keep_dates):
-            os.remove(file)
-            print(f"Deleted old file: {file}")
+    columns = list(columns) if columns is not None else None
+    if is_snapshot(path):
+        return load_snapshot(path, columns=columns)
 
+    df = preprocess_sponsor_data(path, chunksize=PREPROCESS_CHUNK_SIZE)
+    return df[columns] if columns is not None else df
 
 
-def get_yesterday_file(directory: str) -> str:
+def hash_rows(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
     """
-    Implements:
-    1. Check if yesterday's file exists in archive.
-    2. If not, check raw directory — move it to archive if found.
-    3. Then check archive for files from the 4 days before yesterday.
-    4. Delete all archive files older than last 5 days.
+    Hash the given columns of every row into a single uint64 in one vectorized pass.
+    Columns are cast to object with every missing value as None first: pandas hashes a
+    categorical NaN, an object NaN and None differently, so without the cast an object
+    register and a categorical snapshot with an empty County would never match.
     """
-    raw_dir = './data/raw'
+    if not columns:
+        return np.zeros(len(df), dtype=np.uint64)
+    frame = {}
+    for column in columns:
+        values = df[column].astype(object)
+        frame[column] = values.where(values.notna(), None) if values.hasnans else values
+    return pd.util.hash_pandas_object(pd.DataFrame(frame, copy=False), index=False, categorize=False).to_numpy()
 
-    # Build date strings for yesterday and the last 5 days (including yesterday)
-    date_strs = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(1, 6)]
-    yesterday_str = date_strs[0]
 
-    # ✅ Logic 1: Check yesterday's file in archive
-    file_in_archive = find_file_with_date(ARCHIVE_DIR, yesterday_str)
-    if file_in_archive:
-        clean_old_files(ARCHIVE_DIR, set(date_strs))
-        return file_in_archive
+def diff_registers(df_latest: pd.DataFrame, df_previous: pd.DataFrame,
+                   compare_cols: Optional[List[str]] = None, resolve_renames: bool = True) -> Dict[str, pd.DataFrame]:
+    """
+    Three-way diff of two cleaned registers keyed on (Organisation Name, Route).
+
+    Keys and row fingerprints are hashed column-wise, so the whole comparison runs
+    without a Python call per row. Returns a dict with:
+    - "added":   rows of df_latest whose key is not in df_previous
+    - "removed": rows of df_previous whose key is not in df_latest
+    - "changed": rows of df_latest whose key exists in both but whose compared fields differ,
+                 with a CHANGES_COL column holding {field: {"old": ..., "new": ...}}
+    - "renamed": added rows matched to a removed row of the same route whose name differs
+                 only in case, punctuation, legal form, word order or noise words
+                 (see extraction.entity_resolution); these are taken out
+                 of "added" and "removed". Empty when resolve_renames is False.
+    """
+    if not REQUIRED_COLS.issubset(df_latest.columns) or not REQUIRED_COLS.issubset(df_previous.columns):
+        raise ValueError(f"Missing required columns. Needed: {REQUIRED_COLS}")
 
-    # ✅ Logic 2: Check yesterday's file in raw and move it to archive
-    file_in_raw = find_file_with_date(raw_dir, yesterday_str)
-    if file_in_raw:
-        if not os.path.exists(ARCHIVE_DIR):
-            os.makedirs(ARCHIVE_DIR)
-        file_name = os.path.basename(file_in_raw)
-        archive_path = os.path.join(ARCHIVE_DIR, file_name)
-        shutil.move(file_in_raw, archive_path)
-        print(f"Moved yesterday's file from raw to archive: {archive_path}")
-        clean_old_files(ARCHIVE_DIR, set(date_strs))
-        return archive_path
+    if compare_cols is None:
+        compare_cols = [col for col in df_latest.columns
+                        if col not in KEY_COLS and col in df_previous.columns]
 
-    # ✅ Logic 3: Check last 4 days before yesterday in archive
-    for date_str in date_strs[1:]:  # Skipping yesterday_str (already checked)
-        file_in_archive = find_file_with_date(ARCHIVE_DIR, date_str)
-        if file_in_archive:
-            clean_old_files(ARCHIVE_DIR, set(date_strs))
-            return file_in_archive
+    latest_keys = hash_rows(df_latest, KEY_COLS)
+    previous_keys = hash_rows(df_previous, KEY_COLS)
 
-    # ✅ Clean up old files anyway
-    clean_old_files(ARCHIVE_DIR, set(date_strs))
-    raise FileNotFoundError("No CSV file from the last 5 days found in either archive or raw directories.")
+    added = df_latest[~pd.Series(latest_keys).isin(previous_keys).to_numpy()]
+    removed = df_previous[~pd.Series(previous_keys).isin(latest_keys).to_numpy()]
 
+    # Match surviving keys on their first occurrence and compare row fingerprints
+    latest_index = pd.DataFrame({
+        "key": latest_keys, "fingerprint": hash_rows(df_latest, compare_cols), "position": np.arange(len(df_latest))
+    }).drop_duplicates("key")
+    previous_index = pd.DataFrame({
+        "key": previous_keys, "fingerprint": hash_rows(df_previous, compare_cols), "position": np.arange(len(df_previous))
+    }).drop_duplicates("key")
 
-def get_new_sponsors(df_latest: pd.DataFrame, df_previous: pd.DataFrame) -> list[dict]:
-    """
-    Compare today's CSV with yesterday's and return list of new sponsor rows (as dicts),
-    based on unique combination of Organisation Name and Route.
-    """
+    matched = latest_index.merge(previous_index, on="key", suffixes=("_latest", "_previous"))
+    matched = matched[matched["fingerprint_latest"] != matched["fingerprint_previous"]]
 
+    changed = df_latest.iloc[matched["position_latest"].to_numpy()].copy()
+    changed[CHANGES_COL] = field_changes(
+        changed, df_previous.iloc[matched["position_previous"].to_numpy()], compare_cols
+    )
 
-    # Ensure the necessary columns exist
-    if not REQUIRED_COLS.issubset(df_latest.columns) or not REQUIRED_COLS.issubset(df_previous.columns):
-        raise ValueError(f"Missing required columns. Needed: {REQUIRED_COLS}")
-
-    # Create sets of (Organisation Name, Route) tuples
-    latest_set = set(zip(df_latest[ORGANIZATION_NAME].astype(str), df_latest['Route'].astype(str)))
-    previous_set = set(zip(df_previous[ORGANIZATION_NAME].astype(str), df_previous['Route'].astype(str)))
+    if resolve_renames:
+        renamed, added, removed = match_renames(added, removed)
+    else:
+        renamed = added.iloc[0:0]
 
-    # Find new entries
-    new_entries = latest_set - previous_set
+    return {"added": added, "removed": removed, "changed": changed, "renamed": renamed}
 
-    # Filter the latest DataFrame to get new sponsor rows
-    new_sponsors_df = df_latest[df_latest.apply(
-        lambda row: (str(row[ORGANIZATION_NAME]), str(row['Route'])) in new_entries, axis=1
-    )]
 
-    return new_sponsors_df.to_dict(orient='records')
+def diff_dates(previous_date: str, latest_date: str, catalog: Optional[SnapshotCatalog] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Diff the catalogued snapshots of any two dates (YYYY-MM-DD).
+    """
+    owns_catalog = catalog is None
+    catalog = catalog or SnapshotCatalog()
+    try:
+        entries = {}
+        for snapshot_date in (previous_date, latest_date):
+            entries[snapshot_date] = catalog.get(snapshot_date)
+            if not entries[snapshot_date]:
+                raise FileNotFoundError(f"No snapshot catalogued for {snapshot_date}")
+    finally:
+        if owns_catalog:
+            catalog.close()
+
+    return diff_registers(load_register(entries[latest_date]["path"]), load_register(entries[previous_date]["path"]))
+
+
+def field_changes(new_rows: pd.DataFrame, old_rows: pd.DataFrame, compare_cols: List[str]) -> List[Dict]:
+    """
+    Build per-field change details for rows already known to differ.
+    new_rows and old_rows must be aligned position by position.
+    """
+    changes = [{} for _ in range(len(new_rows))]
+    for col in compare_cols:
+        new_values = new_rows[col].astype(object).to_numpy()
+        old_values = old_rows[col].astype(object).to_numpy()
+        differs = (new_values != old_values) & ~(pd.isna(new_values) & pd.isna(old_values))
+        for i in np.flatnonzero(differs):
+            changes[i][col] = {"old": old_values[i], "new": new_values[i]}
+    return changes
 
 
+def get_new_sponsors(df_latest: pd.DataFrame, df_previous: pd.DataFrame) -> list[dict]:
+    """
+    Compare today's CSV with yesterday's and return list of new sponsor rows (as dicts),
+    based on unique combination of Organisation Name and Route.
+    Sponsors that were only renamed (e.g. "Ltd" -> "Limited") are not reported as new.
+    """
+    new_sponsors_df = diff_registers(df_latest, df_previous, compare_cols=[])["added"]
 
+    return new_sponsors_df.to_dict(orient='records')
@@ -0,0 +1,113 @@
+# extraction/entity_resolution.py
+
+"""
+Matching of renamed organisation names.
+Used to tell renamed sponsors ("Acme Ltd" -> "ACME Limited", "Abc Services Ltd" -> "Abc Ltd")
+apart from genuinely new ones. The rule: an added and a removed row of the same route are
+one sponsor when their names have the same set of distinctive tokens, i.e. the name only
+changed in case, punctuation, legal form, word order or noise words ("the", "services",
+"group", ...). Any change to a distinctive word, however small ("Apex Health" / "Apex
+Wealth", "Care Homes 2" / "Care Homes 3"), names a different entity. Only the day's added
+and removed rows are indexed, by that token set, so the cost stays proportional to churn.
+"""
+
+import logging
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.constants import ORGANIZATION_NAME, PREVIOUS_NAME_COL, MATCH_SCORE_COL
+from enrichment.utils import normalize_org_name, blocking_tokens
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+
+def name_identity(name: str) -> FrozenSet[str]:
+    """
+    The distinctive tokens of a name: two names with the same set are the same organisation.
+    """
+    return frozenset(blocking_tokens(normalize_org_name(name)))
+
+
+def name_similarity(key_a: str, key_b: str) -> float:
+    """
+    Character-level similarity of two canonical keys in [0, 1]. It doesn't decide whether
+    names match (name_identity does); it picks the closest of several candidates sharing an
+    identity, and is reported as the match score.
+    """
+    if key_a == key_b:
+        return 1.0
+    return SequenceMatcher(None, key_a, key_b).ratio()
+
+
+class NameIndex:
+    """
+    Index of organisation names by route and distinctive-token set.
+    Each entry carries an opaque id (e.g. a row position) and a route it belongs to.
+    """
+
+    def __init__(self):
+        self.keys: Dict[int, str] = {}
+        self.identities: Dict[Tuple[str, FrozenSet[str]], List[int]] = defaultdict(list)
+
+    def add(self, entry_id: int, name: str, route: str):
+        self.keys[entry_id] = normalize_org_name(name)
+        self.identities[(route, name_identity(name))].append(entry_id)
+
+    def best_match(self, name: str, route: str, exclude: Optional[set] = None) -> Optional[Tuple[int, float]]:
+        """
+        Return (entry_id, score) of the closest entry with the same route and identity, or None.
+        """
+        key = normalize_org_name(name)
+        best = None
+        for entry_id in self.identities.get((route, name_identity(name)), []):
+            if exclude and entry_id in exclude:
+                continue
+            score = name_similarity(key, self.keys[entry_id])
+            if best is None or score > best[1]:
+                best = (entry_id, score)
+        return best
+
+
+def match_renames(added: pd.DataFrame, removed: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Pair added rows with removed rows of the same route whose names share their distinctive tokens.
+
+    Returns (renamed, added, removed): `renamed` holds the added rows that are renames,
+    with PREVIOUS_NAME_COL and MATCH_SCORE_COL columns, and the other two frames are
+    the inputs with the matched rows taken out. Matching is one-to-one.
+    """
+    if added.empty or removed.empty:
+        renamed = added.iloc[0:0].assign(**{PREVIOUS_NAME_COL: pd.Series(dtype=object),
+                                            MATCH_SCORE_COL: pd.Series(dtype=float)})
+        return renamed, added, removed
+
+    index = NameIndex()
+    for position, (name, route) in enumerate(zip(removed[ORGANIZATION_NAME], removed["Route"].astype(str))):
+        index.add(position, name, route)
+
+    used = set()
+    added_positions, removed_positions, scores = [], [], []
+    for position, (name, route) in enumerate(zip(added[ORGANIZATION_NAME], added["Route"].astype(str))):
+        match = index.best_match(name, route, exclude=used)
+        if match:
+            used.add(match[0])
+            added_positions.append(position)
+            removed_positions.append(match[0])
+            scores.append(round(match[1], 3))
+
+    renamed = added.iloc[added_positions].copy()
+    renamed[PREVIOUS_NAME_COL] = removed[ORGANIZATION_NAME].iloc[removed_positions].to_numpy()
+    renamed[MATCH_SCORE_COL] = scores
+
+    keep_added = np.ones(len(added), dtype=bool)
+    keep_added[added_positions] = False
+    keep_removed = np.ones(len(removed), dtype=bool)
+    keep_removed[removed_positions] = False
+
+    if added_positions:
+        logger.info(f"🔗 Matched {len(added_positions)} renamed sponsors")
+    return renamed, added[keep_added], removed[keep_removed]
@@ -1,39 +1,88 @@
 import os
+import json
+import hashlib
 import requests
-import pandas as pd
 from datetime import datetime
-from bs4 import BeautifulSoup
+from typing import Optional, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
+from config.constants import RAW_DIR, DOWNLOAD_MANIFEST, DOWNLOAD_CHUNK_SIZE
 from utils.logger import logging
 
 
+def load_manifest(manifest_path: Optional[str] = None) -> dict:
+    """
+    Load the download manifest, which keeps the ETag / Last-Modified validators and the
+    content hash of every URL we have fetched before, and the hash of the last register
+    the pipeline processed successfully ("processed_sha256").
+    Returns an empty manifest if the file doesn't exist or is unreadable.
+    """
+    manifest_path = manifest_path or DOWNLOAD_MANIFEST
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ Ignoring unreadable download manifest {manifest_path}: {e}")
+        return {}
+
+
+def save_manifest(manifest: dict, manifest_path: Optional[str] = None):
+    """
+    Atomically write the download manifest so a crash never leaves it half-written.
+    """
+    manifest_path = manifest_path or DOWNLOAD_MANIFEST
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
 
-def get_csv_download_link():
+def conditional_headers(entry: Optional[dict]) -> dict:
+    """
+    Build If-None-Match / If-Modified-Since headers from a manifest entry.
+    """
+    headers = {}
+    if not entry:
+        return headers
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def get_csv_download_link(manifest: Optional[dict] = None):
     """
     Extracts the CSV download link from the UK Government's page.
     Returns the URL to the CSV file.
+
+    The page is requested conditionally; when GOV.UK answers 304 Not Modified the
+    link resolved on the previous run is reused without parsing the page again.
     """
 
     # URL of the page with the CSV download link
     page_url = os.getenv("GOVT_PAGE_URL", None)
     logging.info(f"Scraping the page for the CSV download link: {page_url}")
 
+    manifest = manifest if manifest is not None else {}
+    entry = manifest.get(page_url) or {}
+
     try:
         # Fetch the page content
-        response = requests.get(page_url, timeout=10)
+        response = requests.get(page_url, headers=conditional_headers(entry), timeout=10)
+
+        if response.status_code == 304 and entry.get("csv_link"):
+            logging.info(f"Page not modified since last run, reusing CSV link: {entry['csv_link']}")
+            return entry["csv_link"]
 
         if response.status_code != 200:
             logging.error(f"Failed to retrieve page. Status code: {response.status_code}")
             raise Exception(f"Failed to retrieve page. HTTP Status Code: {response.status_code}")
 
-        # Parse the page with BeautifulSoup
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Find the link to the CSV file (the actual link is often in an anchor tag with a specific text)
-        # download_link = None
-        # for link in soup.find_all("a", href=True):
-        #     if "download" in link.get("href", "").lower() and "csv" in link.get_text().lower():
-        #         download_link = link["href"]
-        #         break
+        # Parse only the anchor tags — the rest of the page is never looked at
+        soup = BeautifulSoup(response.content, "html.parser", parse_only=SoupStrainer("a"))
 
         a_tag = soup.find("a", {
             'class': 'govuk-link gem-c-attachment__link',
@@ -42,20 +91,26 @@ def get_csv_download_link():
 
         download_link = a_tag["href"] if a_tag is not None else None
 
-        # ✅ Check if the link ends with .csv
-        if not download_link.lower().endswith(".csv"):
-            logging.error(f"Invalid CSV download link (does not end with .csv): {download_link}")
-            raise Exception("Invalid CSV download link: URL does not end with .csv")
-
         if not download_link:
             logging.error("CSV download link not found on the page.")
             # Report an email
             raise Exception("CSV download link not found on the page.")
 
+        # ✅ Check if the link ends with .csv
+        if not download_link.lower().endswith(".csv"):
+            logging.error(f"Invalid CSV download link (does not end with .csv): {download_link}")
+            raise Exception("Invalid CSV download link: URL does not end with .csv")
+
         # Ensure the download link is absolute
         if not download_link.startswith("http"):
             download_link = "https://www.gov.uk" + download_link
 
+        manifest[page_url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "csv_link": download_link,
+        }
+
         logging.info(f"CSV download link found: {download_link}")
         return download_link
 
@@ -63,57 +118,141 @@ def get_csv_download_link():
         logging.error(f"An error occurred while scraping the page: {str(e)}")
         raise
 
-def download_latest_csv():
+
+def stream_to_file(response: requests.Response, file_path: str) -> Tuple[str, int, int]:
+    """
+    Stream a response body to disk in chunks while hashing it.
+    Returns (sha256 hex digest, bytes written, number of data rows).
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    newlines = 0
+    last_byte = b""
+
+    with open(file_path, "wb") as file:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if not chunk:
+                continue
+            file.write(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+            newlines += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+
+    # Count a final line without a trailing newline, then drop the header row
+    lines = newlines + (1 if last_byte and last_byte != b"\n" else 0)
+    return sha256.hexdigest(), size, max(lines - 1, 0)
+
+
+def download_register() -> Tuple[str, bool]:
     """
     Downloads the latest CSV file from the UK Gov Sponsor Licence register.
-    Returns the file path to the downloaded CSV.
+
+    Returns a tuple (file_path, changed). When the register hasn't changed since the
+    previous download (304 Not Modified, or identical content hash) nothing new is
+    written and file_path points to the previously downloaded snapshot. `changed` is
+    False only when that register was also processed successfully (see
+    mark_register_processed), so a run that failed after downloading is retried.
     """
     try:
         # Set up filename with today's date (ignore time)
         today_str = datetime.now().strftime("%Y-%m-%d")
-        download_dir = './data/raw'
-        if not os.path.exists(download_dir):
-            os.makedirs(download_dir)
+        if not os.path.exists(RAW_DIR):
+            os.makedirs(RAW_DIR)
 
         # Look for an existing file for today
-        for file in os.listdir(download_dir):
+        for file in os.listdir(RAW_DIR):
             if file.startswith(f"uk_sponsor_register_{today_str}"):
-                existing_file_path = os.path.join(download_dir, file)
+                existing_file_path = os.path.join(RAW_DIR, file)
                 logging.info(f"✅ Today's CSV already exists: {existing_file_path}")
-                return existing_file_path
+                return existing_file_path, True
+
+        manifest = load_manifest()
 
         # Get the actual CSV download link
-        csv_url = get_csv_download_link()
+        csv_url = get_csv_download_link(manifest)
+        entry = manifest.get(csv_url) or {}
 
         # Set up filename with timestamp for uniqueness
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        download_dir = './data/raw'
-        if not os.path.exists(download_dir):
-            os.makedirs(download_dir)
-
         file_name = f"uk_sponsor_register_{timestamp}.csv"
-        file_path = os.path.join(download_dir, file_name)
+        file_path = os.path.join(RAW_DIR, file_name)
 
         # Download the CSV file
         logging.info(f"Downloading CSV file from {csv_url}...")
 
-        response = requests.get(csv_url, timeout=10)
+        with requests.get(csv_url, headers=conditional_headers(entry), stream=True, timeout=10) as response:
+            if response.status_code == 304 and entry.get("sha256"):
+                logging.info("🔄 Register not modified since last download (HTTP 304)")
+                save_manifest(manifest)
+                return entry.get("path"), not is_processed(entry)
 
-        if response.status_code == 200:
-            # Save the CSV to a file
-            with open(file_path, 'wb') as file:
-                file.write(response.content)
-            logging.info(f"File downloaded successfully: {file_path}")
+            if response.status_code != 200:
+                logging.error(f"Failed to download CSV. Status code: {response.status_code}")
+                raise Exception(f"Failed to download CSV. HTTP Status Code: {response.status_code}")
 
-            # Load the CSV into a pandas DataFrame to validate the contents
-            data = pd.read_csv(file_path)
-            logging.info(f"Downloaded CSV contains {len(data)} rows and {len(data.columns)} columns.")
+            # Stream to a partial file so an interrupted download is never mistaken for a snapshot
+            part_path = f"{file_path}.part"
+            try:
+                digest, size, rows = stream_to_file(response, part_path)
+            except Exception:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
 
-            return file_path
+        unchanged = digest == entry.get("sha256") and bool(entry.get("path")) and os.path.exists(entry["path"])
+        if unchanged:
+            os.remove(part_path)
+            logging.info(f"🔄 Register content unchanged (sha256 {digest[:12]}…), skipping snapshot")
+            file_path = entry.get("path")
         else:
-            logging.error(f"Failed to download CSV. Status code: {response.status_code}")
-            raise Exception(f"Failed to download CSV. HTTP Status Code: {response.status_code}")
+            os.replace(part_path, file_path)
+            logging.info(f"File downloaded successfully: {file_path}")
+            logging.info(f"Downloaded CSV contains {rows} rows ({size} bytes).")
+
+        manifest[csv_url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": digest,
+            "size": size,
+            "rows": rows,
+            "path": file_path,
+            "downloaded_at": entry.get("downloaded_at") if unchanged else datetime.now().isoformat(),
+            "processed_sha256": entry.get("processed_sha256"),
+        }
+        save_manifest(manifest)
+
+        return file_path, not is_processed(manifest[csv_url])
 
     except Exception as e:
         logging.error(f"An error occurred while downloading the CSV: {str(e)}")
         raise
+
+
+def is_processed(entry: dict) -> bool:
+    """
+    Whether the register a manifest entry was last downloaded with has been processed successfully.
+    """
+    return bool(entry.get("sha256")) and entry.get("processed_sha256") == entry["sha256"]
+
+
+def mark_register_processed(content_hash: str, manifest_path: Optional[str] = None):
+    """
+    Record that the pipeline finished successfully on the register with this sha256, so
+    later downloads of the same content end the run early. Until then, the same register
+    counts as changed and every run processes it again.
+    """
+    manifest = load_manifest(manifest_path)
+    for entry in manifest.values():
+        if entry.get("sha256") == content_hash:
+            entry["processed_sha256"] = content_hash
+    save_manifest(manifest, manifest_path)
+
+
+def download_latest_csv():
+    """
+    Downloads the latest CSV file from the UK Gov Sponsor Licence register.
+    Returns the file path to the downloaded CSV.
+    """
+    file_path, _ = download_register()
+    return file_path
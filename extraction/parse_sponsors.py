@@ -1,57 +1,134 @@
 # extraction/parse_sponsors.py
 
+import numpy as np
 import pandas as pd
 import logging
-from typing import List, Dict
-from config.constants import FILE_COLS, REQUIRED_COLS, ORGANIZATION_NAME
+from typing import Dict, Iterable, Iterator, List, Optional
+from config.constants import FILE_COLS, REQUIRED_COLS, ORGANIZATION_NAME, CATEGORICAL_COLS, PREPROCESS_CHUNK_SIZE
 
 # Set up logger
 logger = logging.getLogger("parse_sponsors")
 
-def preprocess_sponsor_data(csv_path: str) -> pd.DataFrame:
+# Explicit dtypes for the columns we keep: low-cardinality columns are parsed straight into categoricals
+SPONSOR_DTYPES = {ORGANIZATION_NAME: "object", **{col: "category" for col in CATEGORICAL_COLS}}
+
+
+def fill_unknown(series: pd.Series) -> pd.Series:
+    """
+    Fill missing values with 'Unknown', for both object and categorical columns.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) and "Unknown" not in series.cat.categories:
+        series = series.cat.add_categories("Unknown")
+    return series.fillna("Unknown")
+
+
+def clean_sponsor_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply the register cleaning rules to a frame (the whole register or a single chunk):
+    drop rows without an organisation or route, normalise the organisation name
+    (collapsed whitespace, title case) and fill missing Town/City and County values.
+    """
+    df = df.dropna(subset=list(REQUIRED_COLS)).copy()
+
+    # Normalised key: single spaces, no surrounding whitespace, title case
+    df[ORGANIZATION_NAME] = (
+        df[ORGANIZATION_NAME].astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.title()
+    )
+
+    if not isinstance(df["Route"].dtype, pd.CategoricalDtype):
+        df["Route"] = df["Route"].astype(str).replace("nan", "Unknown")
+
+    df["Town/City"] = fill_unknown(df["Town/City"])
+    df["County"] = fill_unknown(df["County"])
+    return df
+
+
+def check_columns(columns) -> None:
+    """
+    Raise a ValueError if any of the expected register columns are missing.
+    """
+    missing_cols = FILE_COLS - set(columns)
+    if missing_cols:
+        logger.error(f"❌ Missing columns in CSV: {', '.join(missing_cols)}")
+        raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+
+
+def iter_sponsor_chunks(csv_path: str, chunksize: int = PREPROCESS_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Stream the register in chunks of `chunksize` rows, reading only FILE_COLS with explicit
+    dtypes and cleaning each chunk as it arrives. Peak memory is bounded by the chunk size.
+    """
+    check_columns(pd.read_csv(csv_path, nrows=0).columns)
+
+    with pd.read_csv(csv_path, usecols=list(FILE_COLS), dtype=SPONSOR_DTYPES, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield clean_sponsor_frame(chunk)[list(SPONSOR_DTYPES)]
+
+
+def concat_sponsor_chunks(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Assemble cleaned chunks into one frame as they stream in. Each chunk is reduced to its
+    organisation names and integer category codes before the next one is read, so only one
+    chunk is ever held in full; categories are unioned on the fly so the result stays
+    compact instead of falling back to object columns.
+    """
+    names: List[np.ndarray] = []
+    codes: Dict[str, List[np.ndarray]] = {col: [] for col in CATEGORICAL_COLS}
+    categories: Dict[str, Dict] = {col: {} for col in CATEGORICAL_COLS}
+    for chunk in chunks:
+        names.append(chunk[ORGANIZATION_NAME].to_numpy(dtype=object))
+        for col in CATEGORICAL_COLS:
+            values = chunk[col].astype("category").cat
+            seen = categories[col]
+            # Chunk-local codes -> codes in the combined categories; the trailing -1 keeps missing values missing
+            remap = np.array([seen.setdefault(value, len(seen)) for value in values.categories] + [-1],
+                             dtype=np.int32)
+            codes[col].append(remap[values.codes.to_numpy()])
+
+    # dtype=object up front skips pandas' string inference, which would copy the whole column
+    columns = {ORGANIZATION_NAME: pd.Series(np.concatenate(names) if names else np.array([], dtype=object),
+                                            dtype=object, copy=False)}
+    del names
+    for col in CATEGORICAL_COLS:
+        col_codes = np.concatenate(codes[col]) if codes[col] else np.array([], dtype=np.int32)
+        columns[col] = pd.Series(pd.Categorical.from_codes(col_codes, categories=list(categories[col])))
+    return pd.DataFrame({col: columns[col] for col in SPONSOR_DTYPES})
+
+
+def preprocess_sponsor_data(csv_path: str, chunksize: Optional[int] = None) -> pd.DataFrame:
     """
     Preprocess the sponsor data CSV.
     This function will clean the data, fill missing values, and ensure it's ready for comparison and enrichment.
 
     Parameters:
     - csv_path: The file path to the CSV file to process.
+    - chunksize: If given, stream the CSV in chunks of this many rows to keep peak memory
+      bounded; otherwise load the whole file at once.
 
     Returns:
-    - A cleaned pandas DataFrame ready for further processing.
+    - A cleaned pandas DataFrame ready for further processing. Both modes return the same
+      schema: the FILE_COLS columns, organisation names as object and the rest categorical
+      (SPONSOR_DTYPES), on a fresh RangeIndex.
     """
 
     try:
         # Read CSV file
         logger.info(f"⬇️ Reading CSV data from {csv_path}")
-        df = pd.read_csv(csv_path)
+
+        if chunksize:
+            logger.info(f"🧹 Cleaning data in chunks of {chunksize} rows")
+            df_cleaned = concat_sponsor_chunks(iter_sponsor_chunks(csv_path, chunksize))
+            logger.info(f"✅ Data preprocessing complete. Processed {len(df_cleaned)} sponsor entries.")
+            return df_cleaned
 
         # Check if expected columns are present
-        missing_cols = FILE_COLS - set(df.columns)
-        if missing_cols:
-            logger.error(f"❌ Missing columns in CSV: {', '.join(missing_cols)}")
-            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
-
-        # Remove any rows with missing 'Organisation Name' or 'Route'
-        logger.info("🧹 Cleaning data by removing rows with missing 'Organisation Name' or 'Route'")
-        subset = list(REQUIRED_COLS) # Convert set to list
-        df_cleaned = df.dropna(subset=subset)
-
-        # Additional checks and cleaning
-        logger.info("🔄 Ensuring that 'Route' column is in string format")
-        df_cleaned['Route'] = df_cleaned['Route'].astype(str)
-
-        # Standardizing 'Organisation Name' to title case to ensure consistency
-        logger.info("🔄 Standardizing 'Organisation Name' to title case")
-        df_cleaned[ORGANIZATION_NAME] = df_cleaned[ORGANIZATION_NAME].str.title()
-
-        # Additional cleanup for 'Town/City' and 'County' columns if necessary
-        logger.info("🔄 Cleaning 'Town/City' and 'County' columns by filling NaN values with 'Unknown'")
-        df_cleaned['Town/City'] = df_cleaned['Town/City'].fillna('Unknown')
-        df_cleaned['County'] = df_cleaned['County'].fillna('Unknown')
-
-        # If there are any rows with missing or erroneous values in 'Route', handle them
-        logger.info("🔄 Handling missing or invalid 'Route' values")
-        df_cleaned['Route'] = df_cleaned['Route'].replace('nan', 'Unknown')
+        check_columns(pd.read_csv(csv_path, nrows=0).columns)
+        df = pd.read_csv(csv_path, usecols=list(FILE_COLS), dtype=SPONSOR_DTYPES)
+
+        # Remove rows with missing 'Organisation Name' or 'Route', normalise names and fill gaps
+        logger.info("🧹 Cleaning data: dropping rows without 'Organisation Name' or 'Route', "
+                    "standardizing names and filling missing 'Town/City' and 'County'")
+        df_cleaned = clean_sponsor_frame(df)[list(SPONSOR_DTYPES)].reset_index(drop=True)
 
         logger.info(f"✅ Data preprocessing complete. Processed {len(df_cleaned)} sponsor entries.")
         return df_cleaned
@@ -0,0 +1,199 @@
+# extraction/snapshot_catalog.py
+
+"""
+Indexed catalog of register snapshots.
+Records each snapshot's date, path, row count, content hash and format in a small
+SQLite database, so lookups such as "latest snapshot before date X" are a single
+index seek instead of a directory scan, and retention is an explicit policy rather
+than a side effect of filename matching.
+"""
+
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from config.constants import (
+    SNAPSHOT_CATALOG, SNAPSHOT_EXTENSION, SNAPSHOT_KEEP_LAST, SNAPSHOT_MAX_AGE_DAYS, SNAPSHOT_WEEKLY_AFTER_DAYS
+)
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_date TEXT PRIMARY KEY,
+    path          TEXT NOT NULL,
+    row_count     INTEGER,
+    content_hash  TEXT,
+    format        TEXT NOT NULL,
+    created_at    TEXT NOT NULL
+)
+"""
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Hash a file in chunks and return the hex digest.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class SnapshotCatalog:
+    """
+    SQLite-backed index of register snapshots, keyed by snapshot date (YYYY-MM-DD).
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or SNAPSHOT_CATALOG
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, snapshot_date: str, path: str, row_count: Optional[int] = None,
+            fmt: Optional[str] = None) -> Dict:
+        """
+        Record (or replace) the snapshot for a date. The content hash is always that of the
+        catalogued file itself, and the format is inferred from the file extension.
+        """
+        entry = {
+            "snapshot_date": snapshot_date,
+            "path": path,
+            "row_count": row_count,
+            "content_hash": file_sha256(path),
+            "format": fmt or ("parquet" if path.endswith(SNAPSHOT_EXTENSION) else "csv"),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.conn.execute(
+            "INSERT OR REPLACE INTO snapshots VALUES "
+            "(:snapshot_date, :path, :row_count, :content_hash, :format, :created_at)",
+            entry,
+        )
+        self.conn.commit()
+        logger.info(f"🗂️ Catalogued {entry['format']} snapshot for {snapshot_date}: {path}")
+        return entry
+
+    def get(self, snapshot_date: str) -> Optional[Dict]:
+        """
+        Return the snapshot recorded for an exact date, or None.
+        """
+        row = self.conn.execute(
+            "SELECT * FROM snapshots WHERE snapshot_date = ?", (snapshot_date,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def latest_before(self, snapshot_date: str) -> Optional[Dict]:
+        """
+        Return the most recent snapshot strictly before the given date, or None.
+        """
+        row = self.conn.execute(
+            "SELECT * FROM snapshots WHERE snapshot_date < ? ORDER BY snapshot_date DESC LIMIT 1",
+            (snapshot_date,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def entries(self) -> List[Dict]:
+        """
+        Return all catalogued snapshots, newest first.
+        """
+        rows = self.conn.execute("SELECT * FROM snapshots ORDER BY snapshot_date DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, snapshot_date: str, delete_file: bool = True):
+        """
+        Drop a snapshot from the catalog, deleting its file unless told otherwise.
+        """
+        entry = self.get(snapshot_date)
+        if not entry:
+            return
+        if delete_file and os.path.exists(entry["path"]):
+            os.remove(entry["path"])
+            logger.info(f"🗑️ Deleted snapshot file: {entry['path']}")
+        self.conn.execute("DELETE FROM snapshots WHERE snapshot_date = ?", (snapshot_date,))
+        self.conn.commit()
+
+    def import_existing(self, directories: Iterable[str]) -> int:
+        """
+        Catalogue register files already on disk (one-off migration from the directory layout).
+        Snapshots win over CSVs for the same date. Returns the number of snapshots added.
+        """
+        found = {}
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = DATE_PATTERN.search(name)
+                if not match or not name.endswith((SNAPSHOT_EXTENSION, ".csv")):
+                    continue
+                path = os.path.join(directory, name)
+                current = found.get(match.group())
+                if current is None or (name.endswith(SNAPSHOT_EXTENSION) and not current.endswith(SNAPSHOT_EXTENSION)):
+                    found[match.group()] = path
+
+        for snapshot_date, path in found.items():
+            if not self.get(snapshot_date):
+                self.add(snapshot_date, path)
+        return len(found)
+
+    def apply_retention(self, today: Optional[date] = None, keep_last: Optional[int] = None,
+                        max_age_days: Optional[int] = None, weekly_after_days: Optional[int] = None) -> List[str]:
+        """
+        Apply the retention/compaction policy and return the dates that were removed.
+
+        - The newest `keep_last` snapshots are always kept, however old they are, so a
+          missed day never drops the history the next comparison needs.
+        - Snapshots older than `weekly_after_days` are compacted to one per ISO week.
+        - Snapshots older than `max_age_days` are removed.
+        Defaults come from SNAPSHOT_KEEP_LAST / SNAPSHOT_MAX_AGE_DAYS / SNAPSHOT_WEEKLY_AFTER_DAYS,
+        each overridable through the environment variable of the same name.
+        """
+        today = today or date.today()
+        keep_last = keep_last if keep_last is not None else int(os.getenv("SNAPSHOT_KEEP_LAST", SNAPSHOT_KEEP_LAST))
+        max_age_days = max_age_days if max_age_days is not None else int(
+            os.getenv("SNAPSHOT_MAX_AGE_DAYS", SNAPSHOT_MAX_AGE_DAYS))
+        weekly_after_days = weekly_after_days if weekly_after_days is not None else int(
+            os.getenv("SNAPSHOT_WEEKLY_AFTER_DAYS", SNAPSHOT_WEEKLY_AFTER_DAYS))
+
+        max_age_cutoff = (today - timedelta(days=max_age_days)).isoformat()
+        weekly_cutoff = (today - timedelta(days=weekly_after_days)).isoformat()
+
+        removed = []
+        kept_weeks = set()
+        for position, entry in enumerate(self.entries()):
+            snapshot_date = entry["snapshot_date"]
+            if position < keep_last:
+                continue
+            if snapshot_date < max_age_cutoff:
+                removed.append(snapshot_date)
+            elif snapshot_date < weekly_cutoff:
+                # Entries are newest first, so the first one seen per week is the one kept
+                week = date.fromisoformat(snapshot_date).isocalendar()[:2]
+                if week in kept_weeks:
+                    removed.append(snapshot_date)
+                else:
+                    kept_weeks.add(week)
+
+        for snapshot_date in removed:
+            self.remove(snapshot_date)
+        if removed:
+            logger.info(f"🧹 Snapshot retention removed {len(removed)} snapshots: {', '.join(removed)}")
+        return removed
@@ -0,0 +1,74 @@
+# extraction/snapshot_store.py
+
+"""
+Columnar snapshot store for cleaned sponsor registers.
+Each day's preprocessed register is written once as Parquet to ARCHIVE_DIR, so the
+comparison step can load yesterday's data straight from disk instead of re-parsing
+and re-cleaning the raw CSV, reading only the columns it needs.
+"""
+
+import os
+import logging
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from config.constants import ARCHIVE_DIR, ORGANIZATION_NAME, CATEGORICAL_COLS, SNAPSHOT_EXTENSION
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+
+def snapshot_path(date_str: str, directory: str = ARCHIVE_DIR) -> str:
+    """
+    Return the archive path of the snapshot for a given date (YYYY-MM-DD).
+    """
+    return os.path.join(directory, f"uk_sponsor_register_{date_str}{SNAPSHOT_EXTENSION}")
+
+
+def to_snapshot_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a cleaned register into the compact snapshot layout:
+    categorical low-cardinality columns and a plain string organisation name.
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    if ORGANIZATION_NAME in df.columns:
+        df[ORGANIZATION_NAME] = df[ORGANIZATION_NAME].astype(str)
+    return df.reset_index(drop=True)
+
+
+def save_snapshot(df: pd.DataFrame, date_str: str, directory: str = ARCHIVE_DIR) -> str:
+    """
+    Save a cleaned register as a Parquet snapshot and return its path.
+    The file is written to a temporary name first and then moved into place.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(date_str, directory)
+    tmp_path = f"{path}.tmp"
+
+    to_snapshot_frame(df).to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+    os.replace(tmp_path, path)
+
+    logger.info(f"💾 Saved snapshot with {len(df)} rows to {path}")
+    return path
+
+
+def load_snapshot(path: str, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Load a Parquet snapshot, reading only the requested columns.
+    Categorical columns come back as pandas categoricals.
+    """
+    columns = list(columns) if columns is not None else None
+    df = pd.read_parquet(path, engine="pyarrow", columns=columns)
+    logger.info(f"📂 Loaded snapshot {path} ({len(df)} rows, columns: {', '.join(df.columns)})")
+    return df
+
+
+def is_snapshot(path: str) -> bool:
+    """
+    Check whether a path points to a columnar snapshot rather than a raw CSV.
+    """
+    return path.endswith(SNAPSHOT_EXTENSION)
+
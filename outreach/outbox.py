@@ -0,0 +1,402 @@
+# outreach/outbox.py
+
+"""
+Durable outbox for outreach emails.
+run_outreach() only enqueues messages into a SQLite outbox; an async dispatcher drains it
+at each provider's send rate, retries transient failures with jittered backoff, and
+moves messages that keep failing (or are rejected outright) to a dead-letter table.
+Every message carries a dedupe key, so enqueuing the same outreach again, e.g. on a
+rerun, never sends it twice. Delivery is at least once: a message whose send was in
+flight when the process died is sent again by the next dispatcher.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from config.constants import (
+    OUTBOX_DB, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_S, OUTBOX_RETRY_MAX_S, OUTBOX_SEND_RATE, OUTBOX_CLAIM_BATCH
+)
+from outreach.smtp_pool import EncodedMessage, build_message
+from utils.rate_limit import TokenBucket, backoff_delay
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key    TEXT NOT NULL UNIQUE,
+    provider      TEXT NOT NULL,
+    recipient     TEXT NOT NULL,
+    from_email    TEXT,
+    subject       TEXT NOT NULL,
+    html          TEXT NOT NULL,
+    raw           BLOB,
+    variant       TEXT,
+    template_data TEXT,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    next_attempt  REAL NOT NULL,
+    last_error    TEXT,
+    created_at    TEXT NOT NULL,
+    sent_at       TEXT,
+    provider_message_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (status, next_attempt);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    dedupe_key  TEXT PRIMARY KEY,
+    provider    TEXT NOT NULL,
+    recipient   TEXT NOT NULL,
+    subject     TEXT NOT NULL,
+    attempts    INTEGER NOT NULL,
+    error       TEXT,
+    failed_at   TEXT NOT NULL
+);
+"""
+ADDED_COLUMNS = {"raw": "BLOB", "variant": "TEXT", "template_data": "TEXT", "provider_message_id": "TEXT"}
+
+
+def provider_filter(providers: Optional[Sequence[str]]):
+    """
+    SQL condition (and its parameters) restricting messages to the given providers; no condition for None.
+    """
+    if providers is None:
+        return "", ()
+    providers = list(providers)
+    return f" AND provider IN ({', '.join('?' * len(providers))})", tuple(providers)
+
+
+class Outbox:
+    """
+    SQLite outbox of outreach messages: pending -> sending -> sent, or dead.
+    Safe to share between the pipeline thread and a background dispatcher.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or OUTBOX_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # One small commit per delivered message: WAL keeps those cheap
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Columns added since the first outboxes were created
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(messages)")]
+        for column, kind in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {kind}")
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def enqueue(self, messages: Sequence[Dict], provider: str = "smtp") -> List[str]:
+        """
+        Add messages ({"dedupe_key", "to", "subject", "html", "from_email"}, optionally the
+        pre-encoded "raw" message and the "variant" and "template_data" it was rendered
+        from) to the outbox in one transaction.
+        Returns the dedupe keys that were new; keys already in the outbox are left alone.
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        added = []
+        with self.lock, self.conn:
+            for message in messages:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO messages (dedupe_key, provider, recipient, from_email, subject, html, "
+                    "raw, variant, template_data, next_attempt, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (message["dedupe_key"], message.get("provider", provider), message["to"],
+                     message.get("from_email"), message["subject"], message["html"], message.get("raw"),
+                     message.get("variant"),
+                     json.dumps(message["template_data"]) if message.get("template_data") else None,
+                     time.time(), now),
+                )
+                if cursor.rowcount:
+                    added.append(message["dedupe_key"])
+        logger.info(f"📥 Outbox: {len(added)} queued, {len(messages) - len(added)} already queued or sent")
+        return added
+
+    def claim(self, limit: int, now: Optional[float] = None,
+              providers: Optional[Sequence[str]] = None) -> List[sqlite3.Row]:
+        """
+        Mark up to `limit` due messages (of the given providers, or any) as sending and return them, oldest first.
+        """
+        now = now if now is not None else time.time()
+        where, params = provider_filter(providers)
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                f"SELECT * FROM messages WHERE status = 'pending' AND next_attempt <= ?{where} "
+                "ORDER BY next_attempt, id LIMIT ?", (now, *params, limit),
+            ).fetchall()
+            self.conn.executemany("UPDATE messages SET status = 'sending' WHERE id = ?", [(row["id"],) for row in rows])
+        return rows
+
+    def next_due(self, providers: Optional[Sequence[str]] = None) -> Optional[float]:
+        """
+        When the earliest pending message (of the given providers, or any) becomes due, or None if none is pending.
+        """
+        where, params = provider_filter(providers)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT MIN(next_attempt) FROM messages WHERE status = 'pending'{where}", params
+            ).fetchone()
+        return row[0]
+
+    def pending_by_provider(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT provider, COUNT(*) FROM messages WHERE status = 'pending' GROUP BY provider"
+            ).fetchall()
+        return {provider: count for provider, count in rows}
+
+    def mark_sent(self, message_id: int, provider_message_id: Optional[str] = None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE messages SET status = 'sent', attempts = attempts + 1, last_error = NULL, sent_at = ?, "
+                "provider_message_id = ? WHERE id = ?",
+                (datetime.now().isoformat(timespec="seconds"), provider_message_id, message_id),
+            )
+
+    def retry_later(self, message_id: int, error: str, at: float):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE messages SET status = 'pending', attempts = attempts + 1, last_error = ?, next_attempt = ? "
+                "WHERE id = ?", (error, at, message_id),
+            )
+
+    def mark_dead(self, message_id: int, error: str):
+        """
+        Give up on a message: keep it (so its dedupe key still blocks resending) and copy it to dead_letters.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE messages SET status = 'dead', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (error, message_id),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dead_letters SELECT dedupe_key, provider, recipient, subject, attempts, ?, ? "
+                "FROM messages WHERE id = ?", (error, datetime.now().isoformat(timespec="seconds"), message_id),
+            )
+
+    def requeue_stale(self) -> int:
+        """
+        Return messages left 'sending' by a dispatcher that died to the queue.
+        """
+        with self.lock, self.conn:
+            return self.conn.execute("UPDATE messages SET status = 'pending' WHERE status = 'sending'").rowcount
+
+    def requeue_dead(self, dedupe_keys: Optional[Sequence[str]] = None) -> int:
+        """
+        Give dead-lettered messages (all, or the given keys) a fresh set of attempts.
+        """
+        keys = list(dedupe_keys) if dedupe_keys is not None else [
+            row[0] for row in self.conn.execute("SELECT dedupe_key FROM dead_letters")
+        ]
+        with self.lock, self.conn:
+            for key in keys:
+                self.conn.execute(
+                    "UPDATE messages SET status = 'pending', attempts = 0, next_attempt = ? "
+                    "WHERE dedupe_key = ? AND status = 'dead'", (time.time(), key),
+                )
+                self.conn.execute("DELETE FROM dead_letters WHERE dedupe_key = ?", (key,))
+        return len(keys)
+
+    def dead_letters(self) -> List[Dict]:
+        with self.lock:
+            return [dict(row) for row in self.conn.execute("SELECT * FROM dead_letters ORDER BY failed_at")]
+
+    def status(self, dedupe_key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT status FROM messages WHERE dedupe_key = ?", (dedupe_key,)).fetchone()
+        return row[0] if row else None
+
+    def delivery(self, dedupe_key: str) -> Optional[Dict]:
+        """
+        Status, attempts, last error and the provider's message id of one message.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT recipient, provider, status, attempts, last_error, sent_at, provider_message_id "
+                "FROM messages WHERE dedupe_key = ?", (dedupe_key,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class OutboxDispatcher:
+    """
+    Drains an outbox through one transport per provider.
+
+    transports   objects with a `name` (the provider) and send(message) -> {"status", "error", "permanent"},
+                 such as SMTPPool. Transports that also have send_batch(rows), batch_key(row) and a
+                 batch_size (SESTransport) get up to batch_size rows with the same key per call
+                 instead. Blocking sends run in a thread pool.
+    rates        messages/second per provider (default OUTBOX_SEND_RATE)
+    concurrency  sends in flight at once (default: the transports' pool sizes combined)
+    suppression  SuppressionIndex that sent recipients are recorded in as contacted, and recipients
+                 refused outright (hard bounces) as bounced
+    """
+
+    def __init__(self, outbox: Outbox, transports: Sequence, rates: Optional[Dict[str, float]] = None,
+                 concurrency: Optional[int] = None, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 retry_base: float = OUTBOX_RETRY_BASE_S, retry_max: float = OUTBOX_RETRY_MAX_S,
+                 suppression=None):
+        self.outbox = outbox
+        self.suppression = suppression
+        self.transports = {transport.name: transport for transport in transports}
+        rates = {**OUTBOX_SEND_RATE, **(rates or {})}
+        self.buckets = {name: TokenBucket(rates.get(name)) for name in self.transports}
+        self.concurrency = concurrency or sum(getattr(t, "size", 1) for t in self.transports.values())
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.stats = {"sent": 0, "retried": 0, "dead": 0}
+        self._thread: Optional[threading.Thread] = None
+
+    def deliver(self, row: sqlite3.Row) -> Dict:
+        transport = self.transports[row["provider"]]
+        try:
+            if row["raw"] is not None:
+                return transport.send(EncodedMessage(row["recipient"], row["from_email"], row["raw"]))
+            return transport.send(build_message(row["recipient"], row["subject"], row["html"], row["from_email"]))
+        except Exception as e:
+            return {"status": "failed", "error": str(e)}
+
+    def deliver_batch(self, rows: List[sqlite3.Row]) -> List[Dict]:
+        transport = self.transports.get(rows[0]["provider"])
+        if not hasattr(transport, "send_batch"):
+            return [self.deliver(row) for row in rows]
+        try:
+            return transport.send_batch(rows)
+        except Exception as e:
+            return [{"status": "failed", "error": str(e)}] * len(rows)
+
+    def batches(self, rows: List[sqlite3.Row]) -> Iterator[List[sqlite3.Row]]:
+        """
+        Split claimed rows into units of work: batch_size rows for batching transports, else one row.
+        """
+        by_provider: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            by_provider.setdefault(row["provider"], []).append(row)
+        for provider, group in by_provider.items():
+            transport = self.transports.get(provider)
+            if not hasattr(transport, "send_batch"):
+                yield from ([row] for row in group)
+                continue
+            # Rows the transport can send in one call (e.g. the same SES template) are batched together
+            by_key: Dict[str, List[sqlite3.Row]] = {}
+            for row in group:
+                by_key.setdefault(transport.batch_key(row), []).append(row)
+            for rows_with_key in by_key.values():
+                for start in range(0, len(rows_with_key), transport.batch_size):
+                    yield rows_with_key[start:start + transport.batch_size]
+
+    def record(self, row: sqlite3.Row, result: Dict):
+        if result["status"] == "sent":
+            self.outbox.mark_sent(row["id"], result.get("message_id"))
+            self.stats["sent"] += 1
+            if self.suppression is not None:
+                # Only a message that actually went out stops later runs contacting the address again
+                self.suppression.record_contacted([row["recipient"]], source=row["dedupe_key"].split(":")[0])
+        elif result.get("permanent") or row["attempts"] + 1 >= self.max_attempts:
+            self.outbox.mark_dead(row["id"], result.get("error"))
+            self.stats["dead"] += 1
+            logger.warning(f"☠️ Dead-lettered email to {row['recipient']}: {result.get('error')}")
+            if result.get("bounced") and self.suppression is not None:
+                self.suppression.add(row["recipient"], "bounced", source=row["provider"])
+        else:
+            delay = backoff_delay(row["attempts"], self.retry_base, self.retry_max)
+            self.outbox.retry_later(row["id"], result.get("error"), time.time() + delay)
+            self.stats["retried"] += 1
+
+    async def drain(self) -> Dict[str, int]:
+        """
+        Send until nothing is pending; waits for scheduled retries to come due.
+        """
+        stale = self.outbox.requeue_stale()
+        if stale:
+            logger.warning(f"⚠️ Outbox: re-sending {stale} messages whose send was interrupted")
+        # Messages for a provider without a transport stay pending for a dispatcher that has one
+        for provider, count in self.outbox.pending_by_provider().items():
+            if provider not in self.transports:
+                logger.warning(f"⚠️ Outbox: leaving {count} messages pending, no transport for provider {provider}")
+        providers = list(self.transports)
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker(executor: ThreadPoolExecutor):
+            while True:
+                batch = await queue.get()
+                try:
+                    if batch is None:
+                        return
+                    bucket = self.buckets.get(batch[0]["provider"])
+                    if bucket is not None:
+                        # Provider rates count recipients, so a batch takes one token per message
+                        await bucket.acquire_async(len(batch))
+                    results = await loop.run_in_executor(executor, self.deliver_batch, batch)
+                    for row, result in zip(batch, results):
+                        self.record(row, result)
+                except Exception as e:
+                    # Left 'sending'; the next dispatcher requeues them
+                    logger.error(f"❌ Outbox dispatch failed for {len(batch)} messages: {e}")
+                finally:
+                    queue.task_done()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            workers = [asyncio.ensure_future(worker(executor)) for _ in range(self.concurrency)]
+            try:
+                while True:
+                    rows = self.outbox.claim(OUTBOX_CLAIM_BATCH, providers=providers)
+                    for batch in self.batches(rows):
+                        await queue.put(batch)
+                    if rows:
+                        continue
+                    # Nothing due: let in-flight sends finish, then wait for the next scheduled retry
+                    await queue.join()
+                    next_due = self.outbox.next_due(providers)
+                    if next_due is None:
+                        break
+                    await asyncio.sleep(max(0.0, next_due - time.time()))
+            finally:
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        logger.info(f"📤 Outbox drained: {self.stats}")
+        return dict(self.stats)
+
+    def run(self) -> Dict[str, int]:
+        return asyncio.run(self.drain())
+
+    def start(self) -> "OutboxDispatcher":
+        """
+        Drain in a background thread, so the rest of the pipeline carries on meanwhile.
+        """
+        self._thread = threading.Thread(target=self.run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> Dict[str, int]:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return dict(self.stats)
@@ -3,9 +3,17 @@
 
 import logging
 import os
+from collections import Counter
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from .send_email import send_email  # Assumes you have a send_email function
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional
+from config.constants import OUTREACH_CAMPAIGN, OUTREACH_PROVIDER
+from outreach.outbox import Outbox, OutboxDispatcher
+from outreach.renderer import OutreachRenderer
+from outreach.ses_transport import SESTransport
+from outreach.suppression import SuppressionIndex, normalize_email
+from outreach.smtp_pool import SMTPPool
+from utils.checkpoints import RecordProgress, sponsor_key
+from enrichment.utils import group_by_organisation, organisation_key
 
 # Set up logger
 logger = logging.getLogger("uk_sponsor_pipeline")
@@ -16,55 +24,121 @@ env = Environment(
     autoescape=select_autoescape(["html", "xml"])
 )
 
-def run_outreach(enriched_data: List[Dict]):
+
+def render_outreach_html(contact_name: str = "Sponsor", company_name: str = "your organization") -> str:
     """
-    Loops through enriched sponsor data and sends personalized emails.
+    Render the outreach email body for one contact.
     """
     template = env.get_template("outreach_template.html")
+    return template.render(contact_name=contact_name, company_name=company_name)
 
-    # success_count = 0
-    # failure_count = 0
-    #
-    # for sponsor in enriched_data:
-    #     try:
-    #         email = sponsor.get("email")
-    #         name = sponsor.get("route", "there")
-    #         company = sponsor.get("company_name", "your organization")
-    #
-    #         if not email:
-    #             logger.warning(f"Skipping sponsor with no email: {sponsor}")
-    #             continue
-    #
-    #         # Render personalized email content
-    #         subject = f"UK Sponsor Licence Opportunity – {company}"
-    #         html_content = template.render(contact_name=name, company_name=company)
-    #
-    #         # Send the email
-    #         send_email(to=email, subject=subject, html=html_content)
-    #
-    #         logger.info(f"📨 Email sent to {email}")
-    #         success_count += 1
-    #
-    #     except Exception as e:
-    #         logger.error(f"❌ Failed to send email to {sponsor.get('email')}: {str(e)}")
-    #         failure_count += 1
-    # logger.info(f"✅ Outreach Summary: {success_count} sent, {failure_count} failed.")
-
-    emails = [sponsor.get("email") for sponsor in enriched_data if sponsor.get("email")]
-    if not emails:
-        logger.warning("No valid emails found to send.")
-        return
 
-        # Prepare subject and content (can be generic or list the sponsors)
-    subject = "UK Sponsor Licence Opportunity"
-    html_content = template.render(contact_name="Sponsor", company_name="your organization")
+def dedupe_key(sponsor: Dict) -> str:
+    """
+    Ties a message to the campaign, organisation and address, so each is sent at most once.
+    """
+    return f"{OUTREACH_CAMPAIGN}:{organisation_key(sponsor)}:{normalize_email(sponsor['email'])}"
+
+
+def outreach_messages(recipients: Iterable[Dict], from_email: Optional[str] = None,
+                      renderer: Optional[OutreachRenderer] = None) -> Iterator[List[Dict]]:
+    """
+    Personalized outbox messages, one per recipient sponsor record, in render batches.
+    """
+    renderer = renderer or OutreachRenderer(from_email)
+    return renderer.render_batches(recipients, key=dedupe_key)
+
+
+def outreach_renderer() -> OutreachRenderer:
+    """
+    Renderer sending from the address configured for OUTREACH_PROVIDER.
+    """
+    provider = os.getenv("OUTREACH_PROVIDER", OUTREACH_PROVIDER)
+    return OutreachRenderer(os.getenv("SES_FROM_EMAIL" if provider == "ses" else "SMTP_FROM_EMAIL"))
+
+
+def outreach_transports(renderer: Optional[OutreachRenderer] = None) -> List:
+    """
+    The transport for OUTREACH_PROVIDER, configured from the environment; the caller closes it.
+    """
+    provider = os.getenv("OUTREACH_PROVIDER", OUTREACH_PROVIDER)
+    return [SESTransport.from_env(renderer=renderer) if provider == "ses" else SMTPPool.from_env()]
+
+
+def run_outreach(enriched_data: List[Dict], progress: Optional[RecordProgress] = None,
+                 outbox: Optional[Outbox] = None, transports: Optional[List] = None,
+                 renderer: Optional[OutreachRenderer] = None, suppression: Optional[SuppressionIndex] = None,
+                 dispatch: bool = True) -> Dict[str, int]:
+    """
+    Queues one personalized email per recipient in the outbox and, unless dispatch is
+    False (the caller drains it, e.g. with OutboxDispatcher.start()), sends the queue
+    over a pool of persistent SMTP sessions, or through SES bulk sends when
+    OUTREACH_PROVIDER is "ses".
+    An organisation listed under several routes is contacted once, and addresses or company
+    domains in the suppression index (sent to on an earlier day, unsubscribed, bounced)
+    are skipped before anything is rendered. Recipients are recorded as contacted by the
+    dispatcher once their message is sent, so a run that stops after queueing leaves them
+    free to be contacted by the next one.
+    If a progress log is given, sponsors already queued in an earlier attempt of the run are skipped.
+    Returns {"queued": new messages, "suppressed": skipped, "success": sent, "failed": dead-lettered}.
+    """
+    if progress is not None:
+        enriched_data = [sponsor for sponsor in enriched_data if not progress.is_done(sponsor_key(sponsor))]
+
+    # At most one outreach per organisation: its first row with an email speaks for all its routes.
+    # Keyed on the normalised address, so one mailbox written in different cases gets one message
+    by_email: Dict[str, tuple] = {}
+    for group in group_by_organisation(enriched_data).values():
+        rows = [enriched_data[i] for i in group]
+        with_email = [sponsor for sponsor in rows if sponsor.get("email")]
+        if with_email:
+            sponsor, covered = by_email.setdefault(normalize_email(with_email[0]["email"]), (with_email[0], []))
+            covered.extend(rows)
+    if not by_email:
+        logger.warning("No valid emails found to send.")
+        return {"queued": 0, "suppressed": 0, "success": 0, "failed": 0}
 
+    owns_suppression = suppression is None
+    if owns_suppression:
+        suppression = SuppressionIndex()
+    owns_outbox = outbox is None
+    if owns_outbox:
+        outbox = Outbox()
+    owns_transports = transports is None
     try:
-        # Send one email to all
-        send_email(to=emails, subject=subject, html=html_content)
-        logger.info(f"📨 Email sent to {len(emails)} sponsors: {emails}")
+        skipped = suppression.suppressed(by_email)
+        if skipped:
+            reasons = Counter(skipped.values())
+            logger.info(f"🚫 Suppressed {len(skipped)} recipients: {dict(reasons)}")
+        recipients = [(sponsor, rows) for email, (sponsor, rows) in by_email.items() if email not in skipped]
 
-    except Exception as e:
-        logger.error(f"❌ Failed to send bulk email: {str(e)}")
+        queued = []
+        provider = os.getenv("OUTREACH_PROVIDER", OUTREACH_PROVIDER)
+        renderer = renderer or outreach_renderer()
+        for batch in outreach_messages([sponsor for sponsor, _ in recipients], renderer=renderer):
+            queued += outbox.enqueue(batch, provider=provider)
+        logger.info(f"🖋️ Rendered outreach variants: {renderer.counts}")
+        # Delivery (and never sending twice) is the outbox's job from here on
+        if progress is not None:
+            for sponsor, rows in by_email.values():
+                for row in rows:
+                    progress.mark_done(sponsor_key(row), dedupe_key(sponsor))
 
+        if not dispatch:
+            return {"queued": len(queued), "suppressed": len(skipped), "success": 0, "failed": 0}
+        if owns_transports:
+            transports = outreach_transports(renderer)
+        try:
+            stats = OutboxDispatcher(outbox, transports, suppression=suppression).run()
+        finally:
+            if owns_transports:
+                for transport in transports:
+                    transport.close()
+    finally:
+        if owns_outbox:
+            outbox.close()
+        if owns_suppression:
+            suppression.close()
 
+    logger.info(f"✅ Outreach Summary: {stats['sent']} sent, {stats['dead']} failed, {len(skipped)} suppressed.")
+    return {"queued": len(queued), "suppressed": len(skipped), "success": stats["sent"], "failed": stats["dead"]}
@@ -0,0 +1,223 @@
+# outreach/renderer.py
+
+"""
+Outreach rendering: one personalised subject and body per recipient.
+Templates are compiled once per process, and their compiled bytecode is cached on disk
+across runs. Each sponsor gets the first variant whose route, town or rating patterns
+match it. A variant can swap the subject, the body template, or both. The parts of a
+MIME message that are the same for every recipient are encoded once per variant: the
+envelope headers, the body part headers, and any static attachments. Only the subject,
+To:, Date:, Message-ID: and the rendered body are encoded per message. Recipients are
+rendered lazily, in batches, so memory stays flat for tens of thousands of sponsors.
+"""
+
+import os
+import re
+import uuid
+import base64
+import logging
+import socket
+import mimetypes
+from email import policy
+from email.utils import formataddr, formatdate, make_msgid, parseaddr
+from email.mime.base import MIMEBase
+from email.encoders import encode_base64
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from config.constants import (
+    ORGANIZATION_NAME, OUTREACH_TEMPLATE_DIR, OUTREACH_TEMPLATE_CACHE_DIR, OUTREACH_VARIANTS, OUTREACH_RENDER_BATCH
+)
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+CRLF = "\r\n"
+# Personal fields a message's template data carries, for providers that render templates themselves
+TEMPLATE_FIELDS = ["contact_name", "company_name", "route", "town", "rating"]
+
+
+def contact_name(sponsor: Dict) -> str:
+    return sponsor.get("hr_director") or sponsor.get("owner") or "Sponsor"
+
+
+def company_name(sponsor: Dict) -> str:
+    return sponsor.get(ORGANIZATION_NAME) or sponsor.get("organization") or "your organization"
+
+
+def encode_header(value: str) -> str:
+    """
+    A header value safe for the wire: RFC 2047 base64 encoded words when it isn't plain
+    ASCII. (email.header.Header does the same, but its line fitting is far slower.)
+    """
+    value = " ".join(value.split())
+    if value.isascii():
+        return value
+    words, chunk = [], b""
+    for char in value:
+        encoded = char.encode("utf-8")
+        # 45 bytes encode to 60 characters, keeping each encoded word within 75
+        if len(chunk) + len(encoded) > 45:
+            words.append(chunk)
+            chunk = b""
+        chunk += encoded
+    words.append(chunk)
+    return f"{CRLF} ".join(f"=?utf-8?b?{base64.b64encode(word).decode('ascii')}?=" for word in words)
+
+
+class Variant:
+    """
+    A subject/body variant; `match` maps template context fields (route, town, rating, ...)
+    to case-insensitive regexes that must all match.
+    """
+
+    def __init__(self, name: str, subject: str, template: str, match: Optional[Dict[str, str]] = None,
+                 attachments: Optional[List[str]] = None):
+        self.name = name
+        self.subject = subject
+        self.template = template
+        self.match = {field: re.compile(pattern, re.I) for field, pattern in (match or {}).items()}
+        self.attachments = attachments or []
+
+    def matches(self, context: Dict) -> bool:
+        return all(pattern.search(str(context.get(field) or "")) for field, pattern in self.match.items())
+
+
+class CompiledVariant:
+    """
+    A variant's compiled templates and the pre-encoded bytes shared by all its messages.
+    """
+
+    def __init__(self, variant: Variant, env: Environment, subject_env: Environment, template_dir: str,
+                 from_email: Optional[str]):
+        self.variant = variant
+        self.body = env.get_template(variant.template)
+        self.subject = subject_env.from_string(variant.subject)
+        # Resolved once: make_msgid() would otherwise look up the host name for every message
+        self.msgid_domain = (from_email or "").rpartition("@")[2].strip(">") or socket.getfqdn()
+
+        boundary = f"=_{uuid.uuid4().hex}"
+        kind = "mixed" if variant.attachments else "alternative"
+        self.head = (
+            # Only the display name may be encoded; the address itself must stay as it is
+            (f"From: {formataddr(parseaddr(from_email), charset='utf-8')}{CRLF}" if from_email else "")
+            + f'MIME-Version: 1.0{CRLF}Content-Type: multipart/{kind}; boundary="{boundary}"{CRLF}'
+        ).encode("ascii")
+        self.body_head = (
+            f'{CRLF}--{boundary}{CRLF}Content-Type: text/html; charset="utf-8"{CRLF}'
+            f"Content-Transfer-Encoding: base64{CRLF}{CRLF}"
+        ).encode("ascii")
+        self.tail = b"".join(
+            f"{CRLF}--{boundary}{CRLF}".encode("ascii") + self.encode_attachment(os.path.join(template_dir, name))
+            for name in variant.attachments
+        ) + f"{CRLF}--{boundary}--{CRLF}".encode("ascii")
+
+    @staticmethod
+    def encode_attachment(path: str) -> bytes:
+        maintype, subtype = (mimetypes.guess_type(path)[0] or "application/octet-stream").split("/", 1)
+        part = MIMEBase(maintype, subtype)
+        with open(path, "rb") as f:
+            part.set_payload(f.read())
+        encode_base64(part)
+        part.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
+        return part.as_bytes(policy=policy.SMTP).rstrip(b"\r\n")
+
+    def encode(self, to: str, subject: str, html: str) -> bytes:
+        body = base64.encodebytes(html.encode("utf-8")).replace(b"\n", b"\r\n")
+        headers = (
+            f"Subject: {encode_header(subject)}{CRLF}To: {to}{CRLF}"
+            f"Date: {formatdate(usegmt=True)}{CRLF}Message-ID: {make_msgid(domain=self.msgid_domain)}{CRLF}"
+        ).encode("utf-8")
+        return headers + self.head + self.body_head + body + self.tail
+
+
+class OutreachRenderer:
+    """
+    Renders outreach messages, ready to queue:
+    {"to", "from_email", "subject", "html", "raw", "variant", "template_data"}.
+    """
+
+    def __init__(self, from_email: Optional[str] = None, variants: Optional[List[Dict]] = None,
+                 template_dir: str = OUTREACH_TEMPLATE_DIR, cache_dir: Optional[str] = OUTREACH_TEMPLATE_CACHE_DIR):
+        self.from_email = from_email
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(["html", "xml"]),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+        )
+        # Subjects are plain text, so they are not HTML-escaped
+        subject_env = Environment(autoescape=False)
+        self.variants = [
+            CompiledVariant(Variant(**spec), env, subject_env, template_dir, from_email)
+            for spec in (variants if variants is not None else OUTREACH_VARIANTS)
+        ]
+        self.counts = {compiled.variant.name: 0 for compiled in self.variants}
+
+    def variant_for(self, context: Dict) -> CompiledVariant:
+        for compiled in self.variants:
+            if compiled.variant.matches(context):
+                return compiled
+        return self.variants[-1]
+
+    @staticmethod
+    def context(sponsor: Dict) -> Dict:
+        return {
+            "contact_name": contact_name(sponsor),
+            "company_name": company_name(sponsor),
+            "route": sponsor.get("Route") or sponsor.get("route"),
+            "town": sponsor.get("Town/City") or sponsor.get("town"),
+            "rating": sponsor.get("Type & Rating") or sponsor.get("rating"),
+            "sponsor": sponsor,
+        }
+
+    def placeholder_templates(self) -> Dict[str, Dict[str, str]]:
+        """
+        Each variant rendered with Handlebars placeholders ({{company_name}}, ...) in place
+        of the personal fields, for providers that merge per-recipient data themselves
+        (SES templates). Only plain substitutions of those fields carry over; the subject
+        uses triple braces so the provider does not HTML-escape plain text.
+        """
+        templates = {}
+        for compiled in self.variants:
+            body = compiled.body.render({field: f"{{{{{field}}}}}" for field in TEMPLATE_FIELDS}, sponsor={})
+            subject = compiled.subject.render({field: f"{{{{{{{field}}}}}}}" for field in TEMPLATE_FIELDS}, sponsor={})
+            templates[compiled.variant.name] = {"subject": subject, "html": body}
+        return templates
+
+    def render(self, sponsor: Dict) -> Dict:
+        context = self.context(sponsor)
+        compiled = self.variant_for(context)
+        subject = compiled.subject.render(context)
+        html = compiled.body.render(context)
+        self.counts[compiled.variant.name] += 1
+        return {
+            "to": sponsor["email"],
+            "from_email": self.from_email,
+            "subject": subject,
+            "html": html,
+            "raw": compiled.encode(sponsor["email"], subject, html),
+            "variant": compiled.variant.name,
+            "template_data": {field: str(context[field] or "") for field in TEMPLATE_FIELDS},
+        }
+
+    def render_batches(self, sponsors: Iterable[Dict], batch_size: int = OUTREACH_RENDER_BATCH,
+                       key: Optional[Callable[[Dict], str]] = None) -> Iterator[List[Dict]]:
+        """
+        Render sponsors lazily, batch_size messages at a time; `key` sets each message's dedupe_key.
+        """
+        batch = []
+        for sponsor in sponsors:
+            message = self.render(sponsor)
+            if key is not None:
+                message["dedupe_key"] = key(sponsor)
+            batch.append(message)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -1,5 +1,4 @@
 import os
-import boto3
 import smtplib
 import logging
 from email.mime.multipart import MIMEMultipart
@@ -7,6 +6,8 @@ from email.mime.text import MIMEText
 from botocore.exceptions import ClientError
 from typing import List, Optional, Union
 
+from outreach.ses_transport import ses_client
+
 # Set up logger
 logger = logging.getLogger("send_email")
 
@@ -17,13 +18,14 @@ def send_email(
     cc: Optional[List[str]] = None,
     bcc: Optional[List[str]] = None
 ):
-    """Tries sending email using SES first, then SMTP as fallback"""
+    """Tries sending email using SES first, then SMTP as fallback. Raises if sending failed."""
     try:
         # send_email_ses(to, subject, html, cc, bcc)
-        send_email_native(to, subject, html, cc, bcc)
+        return send_email_native(to, subject, html, cc, bcc)
     except Exception as e:
-        logger.error(f"Failed to send email via SES: {e}, falling back to SMTP.")
+        logger.error(f"Failed to send email: {e}")
         # send_email_native(to, subject, html, cc, bcc)
+        raise
 
 
 def send_email_ses(
@@ -34,12 +36,8 @@ def send_email_ses(
     bcc: Optional[List[str]] = None
 ):
     """Send email using Amazon SES"""
-    ses_client = boto3.client(
-        'ses',
-        region_name=os.getenv("AWS_REGION"),
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-    )
+    # One cached client per process instead of a new client (and connection) per email
+    client = ses_client()
 
     if isinstance(to, str):
         to = [to]
@@ -47,7 +45,7 @@ def send_email_ses(
     bcc = bcc or []
 
     try:
-        response = ses_client.send_email(
+        response = client.send_email(
             Source=os.getenv("SES_FROM_EMAIL"),
             Destination={
                 'ToAddresses': to,
@@ -0,0 +1,203 @@
+# outreach/ses_transport.py
+
+"""
+Amazon SES transport for outreach.
+The SES client is built once per process and region and then reused: constructing it,
+resolving credentials and opening a connection on every send is expensive. Personalised
+mail goes out through bulk templated sends. Each outreach variant becomes an SES
+template with Handlebars placeholders. Messages are grouped by variant into calls of up
+to 50 destinations (the SES limit), and each destination carries only its own template
+data. SES answers with one status per destination, which is mapped back onto each
+message (and so each sponsor) as sent, retryable or permanently failed.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from config.constants import SES_BULK_MAX_DESTINATIONS, SES_TEMPLATE_PREFIX, SES_MAX_CONCURRENCY
+from outreach.renderer import OutreachRenderer
+from outreach.smtp_pool import EncodedMessage, build_message
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+# Destination statuses (and request errors) that retrying the same message cannot fix
+PERMANENT_STATUSES = {
+    "MessageRejected", "MailFromDomainNotVerified", "InvalidParameterValue", "ConfigurationSetDoesNotExist",
+    "InvalidSendingPoolName",
+}
+
+
+@lru_cache(maxsize=None)
+def ses_client(region: Optional[str] = None):
+    """
+    The process-wide SES client for a region (AWS_REGION by default). boto3 clients are
+    thread-safe, so one client and its connection pool serve every sending thread.
+    """
+    return boto3.client(
+        "ses",
+        region_name=region or os.getenv("AWS_REGION"),
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        config=Config(max_pool_connections=SES_MAX_CONCURRENCY, retries={"mode": "standard"}),
+    )
+
+
+def failure(error: str, code: Optional[str] = None) -> Dict:
+    return {"status": "failed", "error": error, "permanent": code in PERMANENT_STATUSES}
+
+
+class SESTransport:
+    """
+    Outbox transport sending through SES: bulk templated sends for rendered outreach,
+    send_raw_email for anything else.
+    """
+
+    name = "ses"
+
+    def __init__(self, source: Optional[str] = None, client=None, renderer: Optional[OutreachRenderer] = None,
+                 batch_size: int = SES_BULK_MAX_DESTINATIONS, size: int = SES_MAX_CONCURRENCY,
+                 configuration_set: Optional[str] = None):
+        self.source = source or os.getenv("SES_FROM_EMAIL")
+        self.client = client or ses_client()
+        self.renderer = renderer
+        self.batch_size = min(batch_size, SES_BULK_MAX_DESTINATIONS)
+        self.size = size
+        self.configuration_set = configuration_set
+        self._templates: Optional[Dict[str, str]] = None
+        self._templates_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "SESTransport":
+        return cls(source=os.getenv("SES_FROM_EMAIL"), configuration_set=os.getenv("SES_CONFIGURATION_SET"), **kwargs)
+
+    def templates(self) -> Dict[str, str]:
+        """
+        SES template name per outreach variant, creating missing templates on first use.
+        Names carry a hash of the content, so an edited variant gets a new template.
+        """
+        with self._templates_lock:
+            if self._templates is None:
+                renderer = self.renderer or OutreachRenderer(self.source)
+                names = {}
+                for variant, parts in renderer.placeholder_templates().items():
+                    digest = hashlib.sha1(f"{parts['subject']}\n{parts['html']}".encode("utf-8")).hexdigest()[:10]
+                    name = f"{SES_TEMPLATE_PREFIX}-{variant}-{digest}"
+                    try:
+                        self.client.create_template(Template={
+                            "TemplateName": name, "SubjectPart": parts["subject"], "HtmlPart": parts["html"],
+                        })
+                        logger.info(f"🧩 Created SES template {name}")
+                    except ClientError as e:
+                        if e.response["Error"]["Code"] != "AlreadyExists":
+                            raise
+                    names[variant] = name
+                self._templates = names
+            return self._templates
+
+    def send(self, message) -> Dict:
+        """
+        Send one pre-built message (MIMEMultipart or EncodedMessage) as raw email.
+        """
+        try:
+            response = self.client.send_raw_email(
+                Source=message["From"] or self.source,
+                Destinations=[message["To"]],
+                RawMessage={"Data": message.as_bytes()},
+            )
+            return {"to": [message["To"]], "status": "sent", "message_id": response["MessageId"]}
+        except ClientError as e:
+            return failure(str(e), e.response["Error"]["Code"])
+        except BotoCoreError as e:
+            return failure(str(e))
+
+    def send_bulk(self, messages: Sequence[Dict]) -> List[Dict]:
+        """
+        Send rendered messages ({"to", "variant", "template_data"}) with bulk templated sends,
+        at most batch_size destinations per call. Results are in input order.
+        """
+        templates = self.templates()
+        results: List[Optional[Dict]] = [None] * len(messages)
+        by_variant: Dict[str, List[int]] = {}
+        for index, message in enumerate(messages):
+            if message.get("variant") in templates:
+                by_variant.setdefault(message["variant"], []).append(index)
+            else:
+                results[index] = failure(f"no SES template for variant {message.get('variant')}",
+                                         "InvalidParameterValue")
+
+        for variant, indexes in by_variant.items():
+            for start in range(0, len(indexes), self.batch_size):
+                chunk = indexes[start:start + self.batch_size]
+                for index, result in zip(chunk, self.send_chunk(templates[variant], [messages[i] for i in chunk])):
+                    results[index] = result
+        return results
+
+    def send_chunk(self, template: str, messages: List[Dict]) -> List[Dict]:
+        request = {
+            "Source": self.source,
+            "Template": template,
+            "DefaultTemplateData": json.dumps({}),
+            "Destinations": [
+                {"Destination": {"ToAddresses": [message["to"]]},
+                 "ReplacementTemplateData": json.dumps(message["template_data"])}
+                for message in messages
+            ],
+        }
+        if self.configuration_set:
+            request["ConfigurationSetName"] = self.configuration_set
+        try:
+            statuses = self.client.send_bulk_templated_email(**request)["Status"]
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code == "TemplateDoesNotExist":
+                # Deleted behind our back: recreate on the next attempt
+                self._templates = None
+            return [failure(str(e), code)] * len(messages)
+        except BotoCoreError as e:
+            return [failure(str(e))] * len(messages)
+
+        results = []
+        for message, status in zip(messages, statuses):
+            code = status.get("Status", "Success")
+            if code == "Success":
+                results.append({"to": [message["to"]], "status": "sent", "message_id": status.get("MessageId")})
+            else:
+                results.append(failure(f"{code}: {status.get('Error', '')}", code))
+        return results
+
+    @staticmethod
+    def batch_key(row) -> str:
+        """
+        Outbox rows of the same variant share a template, so they can share a bulk call.
+        """
+        return row["variant"] or ""
+
+    def send_batch(self, rows: Sequence) -> List[Dict]:
+        """
+        Outbox entry point: rows rendered from a variant go out in bulk, others as raw email.
+        """
+        results: List[Optional[Dict]] = [None] * len(rows)
+        bulk = [i for i, row in enumerate(rows) if row["variant"] and row["template_data"]]
+        messages = [{"to": rows[i]["recipient"], "variant": rows[i]["variant"],
+                     "template_data": json.loads(rows[i]["template_data"])} for i in bulk]
+        for index, result in zip(bulk, self.send_bulk(messages) if messages else []):
+            results[index] = result
+        for index, row in enumerate(rows):
+            if results[index] is None:
+                message = (EncodedMessage(row["recipient"], row["from_email"], row["raw"]) if row["raw"] is not None
+                           else build_message(row["recipient"], row["subject"], row["html"], row["from_email"]))
+                results[index] = self.send(message)
+        return results
+
+    def close(self):
+        # The client is shared by the process; nothing to release per transport
+        pass
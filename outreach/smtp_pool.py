@@ -0,0 +1,223 @@
+# outreach/smtp_pool.py
+
+"""
+Pooled, persistent SMTP sending.
+Keeps a small pool of authenticated SMTP sessions and reuses them for many messages,
+instead of connecting, upgrading to TLS and logging in for every email. Sessions that
+the server dropped are reopened transparently, and each one is recycled after a fixed
+number of messages, since most providers cap messages per connection.
+"""
+
+import os
+import queue
+import smtplib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+from config.constants import SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_TIMEOUT_S
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+# Errors after which the session is discarded and the message retried on a fresh one
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+# Errors about the message's recipients, after which the session is still good to reuse
+RECIPIENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    True for failures a retry cannot fix: rejected recipients and other 5xx replies.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def build_message(to: str, subject: str, html: str, from_email: str) -> MIMEMultipart:
+    """
+    One HTML email for one recipient.
+    """
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = from_email
+    message["To"] = to
+    message.attach(MIMEText(html, "html"))
+    return message
+
+
+class EncodedMessage:
+    """
+    A message already serialised to wire format (see outreach.renderer), sendable like a MIME message.
+    """
+
+    def __init__(self, to: str, from_email: Optional[str], data: bytes):
+        self.headers = {"To": to, "From": from_email}
+        self.data = data
+
+    def __getitem__(self, header: str) -> Optional[str]:
+        return self.headers.get(header)
+
+    def as_bytes(self) -> bytes:
+        return self.data
+
+
+# Either kind of message the pool can send
+Message = Union[MIMEMultipart, EncodedMessage]
+
+
+class SMTPSession:
+    """
+    One authenticated SMTP connection and the number of messages it has sent.
+    """
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+
+    def close(self):
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+
+
+class SMTPPool:
+    """
+    Thread-safe pool of up to `size` SMTP sessions.
+    """
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int = 587, username: Optional[str] = None, password: Optional[str] = None,
+                 from_email: Optional[str] = None, size: int = SMTP_POOL_SIZE, starttls: bool = True,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION, timeout: float = SMTP_TIMEOUT_S):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.from_email = from_email or username
+        self.size = size
+        self.starttls = starttls
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.idle: "queue.LifoQueue[SMTPSession]" = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.stats = {"connections": 0, "reconnects": 0, "sent": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "SMTPPool":
+        """
+        Pool configured from the SMTP_* environment variables used by send_email_native().
+        """
+        return cls(
+            host=os.getenv("SMTP_HOST"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            username=os.getenv("SMTP_USERNAME"),
+            password=os.getenv("SMTP_PASSWORD"),
+            from_email=os.getenv("SMTP_FROM_EMAIL"),
+            size=int(os.getenv("SMTP_POOL_SIZE", SMTP_POOL_SIZE)),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() != "false",
+            **kwargs,
+        )
+
+    def count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def connect(self) -> SMTPSession:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        self.count("connections")
+        return SMTPSession(server)
+
+    @contextmanager
+    def session(self, fresh: bool = False) -> Iterator[SMTPSession]:
+        """
+        Borrow a session: an idle one if available, otherwise a new one (at most `size` in use).
+        A session that raises is closed rather than returned to the pool, unless only the
+        recipients were refused.
+        """
+        self.slots.acquire()
+        try:
+            try:
+                session = self.idle.get_nowait()
+                if fresh:
+                    session.close()
+                    session = self.connect()
+            except queue.Empty:
+                session = self.connect()
+            try:
+                yield session
+            except RECIPIENT_ERRORS:
+                self.release(session)
+                raise
+            except BaseException:
+                session.close()
+                raise
+            self.release(session)
+        finally:
+            self.slots.release()
+
+    def release(self, session: SMTPSession):
+        """
+        Return a borrowed session to the pool, or close it once it has sent max_messages.
+        """
+        if session.sent >= self.max_messages:
+            session.close()
+        else:
+            self.idle.put(session)
+
+    def send(self, message: Message, recipients: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Send one message, retrying once on a new connection if the pooled one was dropped.
+        """
+        recipients = list(recipients or [message["To"]])
+        for attempt in range(2):
+            try:
+                with self.session(fresh=attempt > 0) as session:
+                    session.server.sendmail(message["From"] or self.from_email, recipients, message.as_bytes())
+                    session.sent += 1
+                self.count("sent")
+                return {"to": recipients, "status": "sent"}
+            except CONNECTION_ERRORS as e:
+                if attempt == 0:
+                    self.count("reconnects")
+                    continue
+                error = e
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+            self.count("failed")
+            logger.error(f"❌ Failed to send email to {', '.join(recipients)}: {error}")
+            return {"to": recipients, "status": "failed", "error": str(error), "permanent": is_permanent(error),
+                    "bounced": isinstance(error, smtplib.SMTPRecipientsRefused)}
+
+    def send_many(self, messages: Sequence[Message]) -> List[Dict]:
+        """
+        Send many messages over the pool's sessions in parallel; results are in input order.
+        """
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            results = list(executor.map(self.send, messages))
+        logger.info(f"📮 SMTP pool: {self.stats}")
+        return results
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
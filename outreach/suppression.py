@@ -0,0 +1,278 @@
+# outreach/suppression.py
+
+"""
+Cross-run suppression index for outreach.
+Records every address (and company domain) that has been contacted, plus unsubscribes,
+hard bounces and complaints, so a sponsor that is renamed, re-listed or reprocessed on
+a later day is not emailed again. The index lives in SQLite. A Bloom filter sits in
+front of it: most candidates were never contacted, and the filter rules them out in
+constant time without touching the database. Only the few it cannot rule out are
+looked up, in one indexed query per batch. The filter is saved next to the table on
+close and loaded on open; it is rebuilt from the table only when the table changed
+since it was saved (a crash, or another writer).
+"""
+
+import os
+import math
+import hashlib
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.constants import SUPPRESSION_DB, SUPPRESSION_BLOOM_ERROR_RATE, FREE_MAIL_DOMAINS, SHARED_MAIL_DOMAINS
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressions (
+    value       TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    reason      TEXT NOT NULL,
+    source      TEXT,
+    created_at  TEXT NOT NULL,
+    PRIMARY KEY (value, kind)
+);
+-- writes counts changes to suppressions; the saved filter is current while saved_at = writes
+CREATE TABLE IF NOT EXISTS bloom_filter (
+    id          INTEGER PRIMARY KEY CHECK (id = 1),
+    writes      INTEGER NOT NULL,
+    saved_at    INTEGER,
+    capacity    INTEGER,
+    size        INTEGER,
+    hashes      INTEGER,
+    count       INTEGER,
+    bits        BLOB
+);
+INSERT OR IGNORE INTO bloom_filter (id, writes) VALUES (1, 0);
+"""
+
+# Reasons in order of precedence: a later contact never overwrites an unsubscribe or bounce
+REASONS = ["contacted", "bounced", "complained", "unsubscribed"]
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def email_domain(email: str) -> Optional[str]:
+    """
+    The company domain of an address, or None for domains shared by many unrelated senders
+    (free-mail providers, and organisational domains such as nhs.net).
+    """
+    domain = normalize_email(email).rpartition("@")[2].removeprefix("www.")
+    return domain if domain and domain not in FREE_MAIL_DOMAINS | SHARED_MAIL_DOMAINS else None
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: no false negatives, about `error_rate` false positives at capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = SUPPRESSION_BLOOM_ERROR_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def restore(cls, capacity: int, size: int, hashes: int, count: int, bits: bytes) -> "BloomFilter":
+        """
+        A filter from its saved parameters and bit array.
+        """
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.size, bloom.hashes, bloom.count = capacity, size, hashes, count
+        bloom.bits = bytearray(bits)
+        return bloom
+
+    def positions(self, value: str) -> Iterable[int]:
+        # Two 64-bit halves of one digest give all k positions (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+
+class SuppressionIndex:
+    """
+    Persistent set of suppressed emails and domains with their reason.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, bloom: bool = True):
+        self.db_path = db_path or SUPPRESSION_DB
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # A background outbox dispatcher records sends while the pipeline thread may be checking
+        self.lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.bloom: Optional[BloomFilter] = None
+        self.use_bloom = bloom
+        # Value of bloom_filter.writes the in-memory filter reflects
+        self.version = 0
+        if bloom and not self.load_bloom():
+            self.rebuild_bloom()
+            self.save_bloom()
+        self.stats = {"checked": 0, "bloom_negative": 0, "suppressed": 0}
+
+    def close(self):
+        if self.use_bloom:
+            self.save_bloom()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM suppressions").fetchone()[0]
+
+    def load_bloom(self) -> bool:
+        """
+        Load the saved filter; False when there is none or the table changed since it was saved.
+        """
+        writes, saved_at, capacity, size, hashes, count, bits = self.conn.execute(
+            "SELECT writes, saved_at, capacity, size, hashes, count, bits FROM bloom_filter WHERE id = 1"
+        ).fetchone()
+        if bits is None or saved_at != writes:
+            return False
+        self.bloom = BloomFilter.restore(capacity, size, hashes, count, bits)
+        self.version = writes
+        return True
+
+    def save_bloom(self):
+        """
+        Save the filter, unless another writer changed the table since this one was loaded.
+        """
+        bloom = self.bloom
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE bloom_filter SET saved_at = writes, capacity = ?, size = ?, hashes = ?, count = ?, bits = ? "
+                "WHERE id = 1 AND writes = ?",
+                (bloom.capacity, bloom.size, bloom.hashes, bloom.count, bytes(bloom.bits), self.version))
+
+    def rebuild_bloom(self):
+        """
+        Size the filter for twice the current entries (room to grow within a run) and fill it.
+        """
+        self.version = self.conn.execute("SELECT writes FROM bloom_filter WHERE id = 1").fetchone()[0]
+        self.bloom = BloomFilter(max(2 * len(self), 10_000))
+        for value, kind in self.conn.execute("SELECT value, kind FROM suppressions"):
+            self.bloom.add(f"{kind}:{value}")
+
+    def add_many(self, entries: Iterable[Tuple[str, str, str]], source: Optional[str] = None) -> int:
+        """
+        Suppress (value, kind, reason) entries; kind is "email" or "domain". An existing
+        entry only changes when the new reason takes precedence (unsubscribed > complained >
+        bounced > contacted).
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [(normalize_email(value) if kind == "email" else value.strip().lower(), kind, reason)
+                for value, kind, reason in entries]
+        with self.lock, self.conn:
+            for value, kind, reason in rows:
+                existing = self.conn.execute(
+                    "SELECT reason FROM suppressions WHERE value = ? AND kind = ?", (value, kind)
+                ).fetchone()
+                if existing and REASONS.index(existing[0]) >= REASONS.index(reason):
+                    continue
+                self.conn.execute("INSERT OR REPLACE INTO suppressions VALUES (?, ?, ?, ?, ?)",
+                                  (value, kind, reason, source, now))
+            self.conn.execute("UPDATE bloom_filter SET writes = writes + 1 WHERE id = 1")
+            self.version += 1
+            if self.use_bloom:
+                for value, kind, _ in rows:
+                    self.bloom.add(f"{kind}:{value}")
+                if self.bloom.count > self.bloom.capacity:
+                    self.rebuild_bloom()
+        return len(rows)
+
+    def add(self, email: str, reason: str, source: Optional[str] = None, domain: bool = False):
+        """
+        Suppress one address, and with domain=True its company domain as well.
+        """
+        entries = [(email, "email", reason)]
+        if domain and email_domain(email):
+            entries.append((email_domain(email), "domain", reason))
+        self.add_many(entries, source)
+
+    def record_contacted(self, emails: Iterable[str], source: Optional[str] = None) -> int:
+        """
+        Remember addresses outreach was sent to, together with their company domains.
+        """
+        entries = []
+        for email in emails:
+            entries.append((email, "email", "contacted"))
+            if email_domain(email):
+                entries.append((email_domain(email), "domain", "contacted"))
+        return self.add_many(entries, source)
+
+    def record_events(self, events: Iterable[Dict]) -> int:
+        """
+        Suppress recipients of SES-style bounce/complaint notifications. Only permanent
+        (hard) bounces count; transient ones are left to the outbox retries.
+        """
+        entries = []
+        for event in events:
+            kind = event.get("notificationType") or event.get("eventType")
+            if kind == "Bounce" and event["bounce"].get("bounceType") == "Permanent":
+                entries += [(r["emailAddress"], "email", "bounced") for r in event["bounce"]["bouncedRecipients"]]
+            elif kind == "Complaint":
+                entries += [(r["emailAddress"], "email", "complained")
+                            for r in event["complaint"]["complainedRecipients"]]
+        return self.add_many(entries, source="notification")
+
+    def keys(self, email: str) -> List[Tuple[str, str]]:
+        keys = [(normalize_email(email), "email")]
+        if email_domain(email):
+            keys.append((email_domain(email), "domain"))
+        return keys
+
+    def suppressed(self, emails: Iterable[str]) -> Dict[str, str]:
+        """
+        The given addresses that are suppressed (by address or by domain), with the reason.
+        """
+        emails = list(emails)
+        candidates = []
+        for email in emails:
+            self.stats["checked"] += 1
+            keys = self.keys(email)
+            if self.use_bloom and not any(f"{kind}:{value}" in self.bloom for value, kind in keys):
+                self.stats["bloom_negative"] += 1
+                continue
+            candidates.append((email, keys))
+        if not candidates:
+            return {}
+
+        found: Dict[Tuple[str, str], str] = {}
+        wanted = list({key for _, keys in candidates for key in keys})
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(wanted), 400):
+            chunk = wanted[start:start + 400]
+            clause = " OR ".join(["(value = ? AND kind = ?)"] * len(chunk))
+            params = [part for key in chunk for part in key]
+            with self.lock:
+                rows = self.conn.execute(f"SELECT value, kind, reason FROM suppressions WHERE {clause}", params)
+                found.update(((value, kind), reason) for value, kind, reason in rows.fetchall())
+
+        result = {}
+        for email, keys in candidates:
+            reasons = [found[key] for key in keys if key in found]
+            if reasons:
+                result[email] = max(reasons, key=REASONS.index)
+        self.stats["suppressed"] += len(result)
+        return result
+
+    def is_suppressed(self, email: str) -> bool:
+        return email in self.suppressed([email])
@@ -7,23 +7,42 @@ Executes in order:
 2. Compare with previous data to detect new sponsors
 3. Enrich new sponsors using third-party APIs
 4. Send outreach emails to new sponsors
-5. Sync enriched data to Salesforce CRM
+5. Sync enriched data to Salesforce CRM, archiving the records of sponsors that left the register
 """
 
+import os
 import logging
 import csv
+from contextlib import ExitStack
 from datetime import datetime, date
 from pathlib import Path
 
 from utils.logger import setup_logger
 from utils.monitor import send_alert
-from extraction.fetch_csv import download_latest_csv
-from extraction.compare_csv import get_new_sponsors, get_yesterday_file
+from utils.tracing import RunTracer
+from utils.checkpoints import CheckpointStore, hash_records
+from extraction.fetch_csv import download_register, mark_register_processed
+from extraction.compare_csv import diff_registers, get_yesterday_file, load_register
 from extraction.parse_sponsors import preprocess_sponsor_data
+from extraction.snapshot_store import save_snapshot
+from extraction.snapshot_catalog import SnapshotCatalog, file_sha256
+from extraction.change_log import ChangeLog
 from enrichment.enrich_batch import enrich_companies
-from config.constants import ARCHIVE_DIR
-from outreach.outreach_runner import run_outreach
-from crm.sync_crm import sync_with_salesforce
+from enrichment.enriched_store import EnrichedStore
+from config.constants import ARCHIVE_DIR, FILE_COLS, PREPROCESS_CHUNK_SIZE, OUTREACH_ENABLED, CRM_SYNC_ENABLED
+from outreach.outreach_runner import run_outreach, outreach_renderer, outreach_transports
+from outreach.outbox import Outbox, OutboxDispatcher
+from outreach.suppression import SuppressionIndex
+from crm.salesforce_api import SalesforceSession
+from crm.sync_state import SyncState
+from crm.sync_crm import sync_with_salesforce, archive_removed_sponsors, rename_sponsors
+
+
+def stage_enabled(name: str, default: bool) -> bool:
+    """
+    Whether an outward-facing stage runs, from the environment variable of the same name.
+    """
+    return str(os.getenv(name, default)).lower() == "true"
 
 
 def daily_pipeline() -> bool:
@@ -33,54 +52,164 @@ def daily_pipeline() -> bool:
 
     logger.info("🚀 Starting UK Sponsor Reach daily pipeline")
     start_time = datetime.now()
+    tracer = RunTracer()
+    status = "failed"
 
     try:
         # 1. Download latest sponsor data
         logger.info("⬇️ Downloading latest sponsor CSV")
-        raw_csv_path = download_latest_csv()
+        with tracer.stage("download"):
+            raw_csv_path, register_changed = download_register()
+        if not register_changed:
+            logger.info("🔄 Register unchanged since last snapshot — ending pipeline")
+            status = "unchanged"
+            return True
+
         if not raw_csv_path or not Path(raw_csv_path).exists():
             raise FileNotFoundError("❌ Sponsor CSV not downloaded or missing")
 
-        # 2. Preprocess and Load latest and previous CSVs
-        logger.info("🔍 Preprocessing and comparing with previous data")
-        df_sponsors = preprocess_sponsor_data(raw_csv_path)
-        previous_csv_path = get_yesterday_file(ARCHIVE_DIR)
-        df_previous = preprocess_sponsor_data(previous_csv_path)
-        # Compare latest data with previous data
-        new_sponsors = get_new_sponsors(df_sponsors, df_previous)
+        # Checkpoints belong to the register being processed, not the calendar day, so a run
+        # restarted after midnight on the same register resumes; each stage output is keyed by its input hash
+        register_hash = file_sha256(raw_csv_path)
+        checkpoints = CheckpointStore(run_id=f"register-{register_hash[:16]}")
+
+        register_diff = checkpoints.load_frames("diff", register_hash)
+        if register_diff is None:
+            # 2. Preprocess and Load latest and previous CSVs
+            logger.info("🔍 Preprocessing and comparing with previous data")
+            with SnapshotCatalog() as catalog:
+                with tracer.stage("preprocess-today") as stage:
+                    df_sponsors = preprocess_sponsor_data(raw_csv_path, chunksize=PREPROCESS_CHUNK_SIZE)
+                    stage.rows_out = len(df_sponsors)
+                    # Today's cleaned register is stored once as a snapshot, so tomorrow never re-parses the CSV
+                    snapshot_path = save_snapshot(df_sponsors, date.today().isoformat())
+                    catalog.add(date.today().isoformat(), snapshot_path, row_count=len(df_sponsors))
+
+                with tracer.stage("preprocess-previous") as stage:
+                    previous_path = get_yesterday_file(ARCHIVE_DIR, catalog=catalog)
+                    previous_date = catalog.latest_before(date.today().isoformat())["snapshot_date"]
+                    df_previous = load_register(previous_path, columns=sorted(FILE_COLS))
+                    stage.rows_out = len(df_previous)
+
+            # Compare latest data with previous data
+            with tracer.stage("diff", rows_in=len(df_sponsors) + len(df_previous)) as stage:
+                register_diff = diff_registers(df_sponsors, df_previous)
+                stage.rows_out = sum(len(frame) for frame in register_diff.values())
+
+            # Record the day's changes before checkpointing the diff, so a rerun never skips them
+            with tracer.stage("changelog", rows_in=sum(len(frame) for frame in register_diff.values())):
+                with ChangeLog() as change_log:
+                    if change_log.baseline() is None:
+                        change_log.set_baseline(df_previous, previous_date)
+                    change_log.append(date.today().isoformat(), register_diff, previous_date=previous_date)
+            checkpoints.save_frames("diff", register_hash, register_diff)
+
+        new_sponsors = register_diff["added"].to_dict(orient="records")
+        logger.info(
+            f"📊 Register diff: {len(register_diff['added'])} added, "
+            f"{len(register_diff['removed'])} removed, {len(register_diff['changed'])} changed, "
+            f"{len(register_diff['renamed'])} renamed"
+        )
+
+        # Move the CRM records of renamed sponsors to their new name and archive those of sponsors
+        # that left the register, also on days nobody was added. Both are no-ops on a rerun.
+        renamed_sponsors = register_diff["renamed"].to_dict(orient="records")
+        removed_sponsors = register_diff["removed"].to_dict(orient="records")
+        if (renamed_sponsors or removed_sponsors) and stage_enabled("CRM_SYNC_ENABLED", CRM_SYNC_ENABLED):
+            with SalesforceSession() as session, SyncState() as sync_state:
+                if renamed_sponsors:
+                    with tracer.stage("rename", rows_in=len(renamed_sponsors)) as stage:
+                        logger.info("✏️ Renaming renamed sponsors' records in Salesforce")
+                        stage.rows_out = rename_sponsors(renamed_sponsors, session=session,
+                                                         state=sync_state)["renamed"]
+                if removed_sponsors:
+                    with tracer.stage("archive", rows_in=len(removed_sponsors)) as stage:
+                        logger.info("🗄️ Archiving removed sponsors in Salesforce")
+                        stage.rows_out = archive_removed_sponsors(removed_sponsors, session=session,
+                                                                  state=sync_state)["archived"]
 
         if len(new_sponsors) == 0:
             logger.info("🔄 No new sponsors found — ending pipeline")
+            status = "no-new-sponsors"
+            mark_register_processed(register_hash)
             return True
 
         # Temporary file create
-        with open(f"data/temp/{date.today()}-new_sponsors.csv", "w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=new_sponsors[0].keys())
-            w.writeheader()
-            w.writerows(new_sponsors)
+        with tracer.stage("temp-csv", rows_in=len(new_sponsors)) as stage:
+            with open(f"data/temp/{date.today()}-new_sponsors.csv", "w", newline="", encoding="utf-8") as f:
+                w = csv.DictWriter(f, fieldnames=new_sponsors[0].keys())
+                w.writeheader()
+                w.writerows(new_sponsors)
+            stage.rows_out = len(new_sponsors)
 
         logger.info(f"🎯 Found {len(new_sponsors)} new sponsors")
 
         # 3. Enrich new sponsors
         logger.info("✨ Enriching new sponsor data")
-        enriched_sponsors = enrich_companies(new_sponsors)
+        enrich_hash = hash_records(new_sponsors)
+        enriched_sponsors = checkpoints.load("enrich", enrich_hash)
+        if enriched_sponsors is None:
+            with tracer.stage("enrich", rows_in=len(new_sponsors)) as stage:
+                enriched_sponsors = enrich_companies(new_sponsors, progress=checkpoints.progress("enrich"))
+                stage.rows_out = len(enriched_sponsors)
+            checkpoints.save("enrich", enrich_hash, enriched_sponsors)
 
         if len(enriched_sponsors) == 0:
             logger.warning("⚠️ No enrichment data received, proceeding without outreach and CRM sync")
             return False
 
-        # 4. Send outreach emails
-        logger.info("📧 Sending outreach emails")
-        # email_stats = run_outreach(enriched_sponsors)
-        # logger.info(f"✉️ Email results: {email_stats.get('success', 0)} sent, {email_stats.get('failed', 0)} failed")
-
-        # 5. Sync with Salesforce
-        logger.info("🔄 Syncing with Salesforce")
-        # sync_with_salesforce(enriched_sponsors)
+        # Keep the day's enriched records; later stages and reports read them from the store
+        with EnrichedStore() as enriched_store:
+            with tracer.stage("store-enriched", rows_in=len(enriched_sponsors)):
+                enriched_store.append(enriched_sponsors, date.today().isoformat(), run_id=checkpoints.run_id)
+
+            # Outbox, suppression index and transports stay open until the dispatcher has drained
+            with ExitStack() as outreach:
+                # 4. Queue outreach emails; the outbox is drained in the background while CRM sync runs
+                dispatcher = None
+                if stage_enabled("OUTREACH_ENABLED", OUTREACH_ENABLED):
+                    with tracer.stage("outreach", rows_in=len(enriched_sponsors)) as stage:
+                        logger.info("📧 Queueing outreach emails")
+                        outbox = outreach.enter_context(Outbox())
+                        suppression = outreach.enter_context(SuppressionIndex())
+                        renderer = outreach_renderer()
+                        queued = run_outreach(enriched_store.read_date(date.today().isoformat()),
+                                              progress=checkpoints.progress("outreach"), outbox=outbox,
+                                              renderer=renderer, suppression=suppression, dispatch=False)
+                        stage.rows_out = queued["queued"]
+                        transports = outreach_transports(renderer)
+                        for transport in transports:
+                            outreach.callback(transport.close)
+                        dispatcher = OutboxDispatcher(outbox, transports, suppression=suppression).start()
+                        outreach.callback(dispatcher.join)
+                else:
+                    logger.info("📭 Outreach disabled (OUTREACH_ENABLED is not true) — no emails sent")
+
+                # 5. Sync with Salesforce
+                if stage_enabled("CRM_SYNC_ENABLED", CRM_SYNC_ENABLED):
+                    with tracer.stage("sync", rows_in=len(enriched_sponsors)) as stage:
+                        logger.info("🔄 Syncing with Salesforce")
+                        with SalesforceSession() as session, SyncState() as sync_state:
+                            synced = 0
+                            for batch in enriched_store.iter_batches(date.today().isoformat()):
+                                synced += sync_with_salesforce(batch, progress=checkpoints.progress("sync"),
+                                                               session=session, state=sync_state)["synced"]
+                        stage.rows_out = synced
+                else:
+                    logger.info("📴 CRM sync disabled (CRM_SYNC_ENABLED is not true) — Salesforce not updated")
+
+                if dispatcher is not None:
+                    email_stats = dispatcher.join()
+                    logger.info(f"✉️ Email results: {email_stats.get('sent', 0)} sent, "
+                                f"{email_stats.get('dead', 0)} failed")
 
         duration = (datetime.now() - start_time).total_seconds() / 60
         logger.info(f"🏁 Pipeline completed in {duration:.2f} minutes")
 
+        checkpoints.prune()
+        status = "ok"
+        # Only now is this register done with; a run that failed before here processes it again
+        mark_register_processed(register_hash)
         return True
 
     except FileNotFoundError as fnf_error:
@@ -96,3 +225,9 @@ def daily_pipeline() -> bool:
             priority="high"
         )
         return False
+
+    finally:
+        try:
+            tracer.write_report(status)
+        except OSError as e:
+            logger.error(f"❌ Failed to write run report: {e}")
@@ -1 +1,250 @@
-# Unit tests for CSV difference detection
\ No newline at end of file
+# Unit tests for CSV difference detection
+
+
+def register_frame():
+    import pandas as pd
+    return pd.DataFrame({
+        "Organisation Name": ["Acme Ltd", "Beta Limited", "Acme Ltd"],
+        "Town/City": ["London", "Leeds", "London"],
+        "County": ["Unknown", "West Yorkshire", "Unknown"],
+        "Type & Rating": ["Worker (A rating)"] * 3,
+        "Route": ["Skilled Worker", "Skilled Worker", "Global Business Mobility"],
+    })
+
+
+def test_snapshot_round_trip_reads_only_requested_columns(tmp_path):
+    import pandas as pd
+    from extraction.snapshot_store import save_snapshot, load_snapshot
+
+    path = save_snapshot(register_frame(), "2025-04-25", directory=str(tmp_path))
+    full = load_snapshot(path)
+    keys = load_snapshot(path, columns=["Organisation Name", "Route"])
+
+    assert list(keys.columns) == ["Organisation Name", "Route"]
+    assert isinstance(full["Route"].dtype, pd.CategoricalDtype)
+    assert full["Organisation Name"].tolist() == register_frame()["Organisation Name"].tolist()
+
+
+def test_catalog_latest_before_survives_gaps_and_retention(tmp_path):
+    from datetime import date
+    from extraction.snapshot_catalog import SnapshotCatalog, file_sha256
+
+    with SnapshotCatalog(str(tmp_path / "catalog.sqlite3")) as catalog:
+        for day in ["2025-01-06", "2025-01-07", "2025-01-08", "2025-03-01", "2025-04-20"]:
+            path = tmp_path / f"uk_sponsor_register_{day}.parquet"
+            path.write_text(day)
+            catalog.add(day, str(path), row_count=1)
+
+        # Nothing in the ten days before the run: the last snapshot is still found and kept
+        removed = catalog.apply_retention(
+            today=date(2025, 5, 1), keep_last=2, weekly_after_days=30, max_age_days=365
+        )
+
+        assert removed == ["2025-01-07", "2025-01-06"]
+        assert catalog.latest_before("2025-05-01")["snapshot_date"] == "2025-04-20"
+        assert catalog.latest_before("2025-03-01")["snapshot_date"] == "2025-01-08"
+        assert not (tmp_path / "uk_sponsor_register_2025-01-06.parquet").exists()
+        assert catalog.get("2025-04-20")["content_hash"] == file_sha256(str(tmp_path / "uk_sponsor_register_2025-04-20.parquet"))
+
+
+def test_get_yesterday_file_seeds_catalog_preferring_snapshots(tmp_path, monkeypatch):
+    from datetime import date
+    from extraction import compare_csv
+    from extraction.compare_csv import get_yesterday_file
+    from extraction.snapshot_catalog import SnapshotCatalog
+
+    monkeypatch.setattr(compare_csv, "RAW_DIR", str(tmp_path / "raw"))
+
+    (tmp_path / "uk_sponsor_register_2025-04-25_08-00-00.csv").write_text("x")
+    (tmp_path / "uk_sponsor_register_2025-04-25.parquet").write_text("x")
+
+    with SnapshotCatalog(str(tmp_path / "catalog.sqlite3")) as catalog:
+        path = get_yesterday_file(str(tmp_path), catalog=catalog, today=date(2025, 4, 26))
+
+    assert path.endswith("uk_sponsor_register_2025-04-25.parquet")
+
+
+def test_raw_downloads_follow_catalog_retention(tmp_path, monkeypatch):
+    from datetime import date
+    from extraction import compare_csv
+    from extraction.snapshot_catalog import SnapshotCatalog
+
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    monkeypatch.setattr(compare_csv, "RAW_DIR", str(raw_dir))
+    monkeypatch.setenv("SNAPSHOT_KEEP_LAST", "1")
+    monkeypatch.setenv("SNAPSHOT_MAX_AGE_DAYS", "60")
+    for day in ["2025-01-06", "2025-04-20", "2025-04-25", "2025-05-01"]:
+        (raw_dir / f"uk_sponsor_register_{day}_08-00-00.csv").write_text(day)
+    (raw_dir / "download_manifest.json").write_text("{}")
+
+    with SnapshotCatalog(str(tmp_path / "catalog.sqlite3")) as catalog:
+        for day in ["2025-01-06", "2025-04-25"]:
+            path = tmp_path / f"uk_sponsor_register_{day}.parquet"
+            path.write_text(day)
+            catalog.add(day, str(path), row_count=1)
+
+        path = compare_csv.get_yesterday_file(str(tmp_path), catalog=catalog, today=date(2025, 5, 1))
+
+    # 2025-01-06 aged out of the catalog and 2025-04-20 was never catalogued; today's download stays
+    assert path.endswith("uk_sponsor_register_2025-04-25.parquet")
+    assert sorted(p.name for p in raw_dir.iterdir()) == [
+        "download_manifest.json", "uk_sponsor_register_2025-04-25_08-00-00.csv",
+        "uk_sponsor_register_2025-05-01_08-00-00.csv",
+    ]
+
+
+def test_diff_registers_reports_added_removed_and_changed():
+    from extraction.compare_csv import diff_registers
+
+    previous = register_frame()
+    latest = register_frame().iloc[[0, 1]].copy()
+    latest.loc[1, "Type & Rating"] = "Worker (B rating)"
+    latest.loc[2] = ["Gamma Ltd", "York", "Unknown", "Worker (A rating)", "Skilled Worker"]
+
+    diff = diff_registers(latest, previous.astype({"Route": "category"}))
+
+    assert diff["added"]["Organisation Name"].tolist() == ["Gamma Ltd"]
+    assert diff["removed"]["Route"].tolist() == ["Global Business Mobility"]
+    assert diff["changed"]["Changes"].tolist() == [
+        {"Type & Rating": {"old": "Worker (A rating)", "new": "Worker (B rating)"}}
+    ]
+
+
+def test_diff_registers_matches_object_and_categorical_frames_with_missing_values():
+    import numpy as np
+    from extraction.compare_csv import diff_registers
+
+    previous = register_frame()
+    previous.loc[0, "County"] = np.nan
+    previous.loc[1, "Type & Rating"] = None
+    latest = previous.copy()
+    latest.loc[0, "County"] = None
+
+    for old, new in [(previous.astype("category"), latest), (previous, latest.astype("category"))]:
+        diff = diff_registers(new, old)
+        assert all(frame.empty for frame in diff.values())
+
+
+def test_get_new_sponsors_matches_diff_additions():
+    from extraction.compare_csv import get_new_sponsors
+
+    previous = register_frame().iloc[[0]]
+    new = get_new_sponsors(register_frame(), previous)
+
+    assert [(r["Organisation Name"], r["Route"]) for r in new] == [
+        ("Beta Limited", "Skilled Worker"), ("Acme Ltd", "Global Business Mobility")
+    ]
+
+
+def test_chunked_preprocessing_matches_full_load(tmp_path):
+    import pandas as pd
+    from extraction.parse_sponsors import preprocess_sponsor_data
+
+    raw = pd.DataFrame({
+        "Organisation Name": ["acme  ltd", None, " beta limited", "gamma llp"],
+        "Town/City": ["London", "Leeds", None, "York"],
+        "County": [None, None, "Kent", None],
+        "Type & Rating": ["Worker (A rating)"] * 4,
+        "Route": ["Skilled Worker", "Skilled Worker", "Creative Worker", None],
+        "Extra": [1, 2, 3, 4],
+    })
+    path = tmp_path / "register.csv"
+    raw.to_csv(path, index=False)
+
+    full = preprocess_sponsor_data(str(path))
+    chunked = preprocess_sponsor_data(str(path), chunksize=1)
+
+    assert chunked["Organisation Name"].tolist() == ["Acme Ltd", "Beta Limited"]
+    assert chunked["Town/City"].tolist() == ["London", "Unknown"]
+    assert "Extra" not in chunked.columns
+    assert isinstance(chunked["Route"].dtype, pd.CategoricalDtype)
+    # Same schema either way, so a diff of one against the other finds nothing
+    assert list(full.columns) == list(chunked.columns) and full.dtypes.tolist() == chunked.dtypes.tolist()
+    assert full.values.tolist() == chunked.values.tolist() and full.index.equals(chunked.index)
+
+
+def test_normalize_org_name_unifies_punctuation_case_and_legal_form():
+    from enrichment.utils import normalize_org_name
+
+    assert normalize_org_name("A.B.C. Limited") == normalize_org_name("ABC LTD") == "abc ltd"
+    assert normalize_org_name("The Smith & Sons Co.") == normalize_org_name("Smith And Sons Company")
+
+
+def test_diff_registers_separates_renames_from_new_sponsors():
+    import pandas as pd
+    from extraction.compare_csv import diff_registers
+
+    previous = pd.DataFrame({
+        "Organisation Name": ["Acme Care Ltd", "Care Homes 2 Ltd", "Zeta Ltd", "Abc Services Ltd"],
+        "Route": ["Skilled Worker"] * 4,
+    })
+    latest = pd.DataFrame({
+        "Organisation Name": ["Acme Care Limited", "Care Homes 3 Ltd", "Zeta Ltd", "Abc Ltd"],
+        "Route": ["Skilled Worker"] * 4,
+    })
+
+    diff = diff_registers(latest, previous)
+
+    # Legal-form and noise-word changes are renames, whatever the character-level score
+    assert diff["renamed"][["Organisation Name", "Previous Organisation Name"]].values.tolist() == [
+        ["Acme Care Limited", "Acme Care Ltd"], ["Abc Ltd", "Abc Services Ltd"]
+    ]
+    assert diff["added"]["Organisation Name"].tolist() == ["Care Homes 3 Ltd"]
+    assert diff["removed"]["Organisation Name"].tolist() == ["Care Homes 2 Ltd"]
+
+
+def test_diff_registers_keeps_near_homonyms_apart():
+    import pandas as pd
+    from extraction.compare_csv import diff_registers
+
+    previous = pd.DataFrame({
+        "Organisation Name": ["Apex Health Ltd", "Smith Dental Care", "Northern Care Ltd"],
+        "Route": ["Skilled Worker"] * 3,
+    })
+    latest = pd.DataFrame({
+        "Organisation Name": ["Apex Wealth Ltd", "Smith Dental Cars", "The Northern Care Limited"],
+        "Route": ["Skilled Worker"] * 3,
+    })
+
+    diff = diff_registers(latest, previous)
+
+    assert diff["renamed"]["Organisation Name"].tolist() == ["The Northern Care Limited"]
+    assert diff["added"]["Organisation Name"].tolist() == ["Apex Wealth Ltd", "Smith Dental Cars"]
+    assert diff["removed"]["Organisation Name"].tolist() == ["Apex Health Ltd", "Smith Dental Care"]
+
+
+def test_change_log_reconstructs_register_and_indexes_history(tmp_path):
+    import pandas as pd
+    from extraction.compare_csv import diff_registers
+    from extraction.change_log import ChangeLog
+
+    def register(rows):
+        return pd.DataFrame(rows, columns=["Organisation Name", "Town/City", "County", "Type & Rating", "Route"])
+
+    day1 = register([
+        ["Acme Care Ltd", "Leeds", "Unknown", "Worker (A rating)", "Skilled Worker"],
+        ["Beta Ltd", "London", "Unknown", "Worker (A rating)", "Skilled Worker"],
+    ])
+    day2 = register([
+        ["Acme Care Limited", "Leeds", "Unknown", "Worker (A rating)", "Skilled Worker"],
+        ["Beta Ltd", "London", "Unknown", "Worker (B rating)", "Skilled Worker"],
+        ["Gamma Ltd", "York", "Unknown", "Worker (A rating)", "Skilled Worker"],
+    ])
+    day3 = day2[day2["Organisation Name"] != "Gamma Ltd"]
+
+    with ChangeLog(str(tmp_path / "changelog")) as log:
+        log.set_baseline(day1, "2025-01-01")
+        log.append("2025-01-02", diff_registers(day2, day1), previous_date="2025-01-01")
+        log.append("2025-01-03", diff_registers(day3, day2), previous_date="2025-01-02")
+
+        for as_of, expected in [("2025-01-01", day1), ("2025-01-02", day2), ("2025-01-03", day3)]:
+            rebuilt = log.reconstruct(as_of).sort_values("Organisation Name")
+            assert rebuilt[expected.columns].values.tolist() == expected.sort_values("Organisation Name").values.tolist()
+
+        assert [e["type"] for e in log.history("GAMMA LIMITED")] == ["added", "removed"]
+        assert log.first_seen("Gamma Ltd") == "2025-01-02"
+        assert log.first_seen("Beta Ltd") == "2025-01-01"
+        beta = log.history("Beta Ltd")
+        assert beta[0]["changes"]["Type & Rating"] == {"old": "Worker (A rating)", "new": "Worker (B rating)"}
+        assert [e["type"] for e in log.history("Acme Care Ltd")] == ["renamed"]
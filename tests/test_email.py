@@ -1 +1,363 @@
-# Tests email formatting and send simulation
\ No newline at end of file
+# Tests email formatting and send simulation
+
+import json
+import email
+import email.policy
+import socket
+
+import pytest
+
+from outreach import outreach_runner
+from outreach.outbox import Outbox, OutboxDispatcher
+from outreach.renderer import OutreachRenderer
+from outreach.ses_transport import SESTransport, ses_client
+from outreach.smtp_pool import SMTPPool, build_message
+from outreach.suppression import SuppressionIndex
+
+
+def enriched(organization, route="Skilled Worker", email="hr@example.com", **fields):
+    return {"organization": organization, "route": route, "email": email, **fields}
+
+
+class FakeTransport:
+    name = "smtp"
+    size = 4
+
+    def __init__(self, fail=None):
+        self.sent = []
+        # recipient -> results to return for its successive attempts
+        self.fail = {to: list(results) for to, results in (fail or {}).items()}
+
+    def send(self, message):
+        planned = self.fail.get(message["To"])
+        if planned:
+            return planned.pop(0)
+        self.sent.append(message)
+        return {"to": [message["To"]], "status": "sent"}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    with Outbox(str(tmp_path / "outbox.sqlite3")) as outbox:
+        yield outbox
+
+
+@pytest.fixture
+def suppression(tmp_path):
+    with SuppressionIndex(str(tmp_path / "suppression.sqlite3")) as suppression:
+        yield suppression
+
+
+def test_run_outreach_contacts_each_organisation_once(outbox, suppression):
+    transport = FakeTransport()
+
+    stats = outreach_runner.run_outreach([
+        enriched("Acme Ltd", email="hr@acme.example", hr_director="Jane Doe"),
+        enriched("Acme Limited", route="Global Business Mobility", email="jobs@acme.example"),
+        enriched("Beta Ltd", email=None),
+        enriched("Beta Ltd", route="Scale-up", email="hr@beta.example"),
+    ], outbox=outbox, transports=[transport], renderer=OutreachRenderer(cache_dir=None), suppression=suppression)
+
+    assert sorted(m["To"] for m in transport.sent) == ["hr@acme.example", "hr@beta.example"]
+    assert stats == {"queued": 2, "suppressed": 0, "success": 2, "failed": 0}
+    # One personalised message per recipient
+    acme = email.message_from_bytes(next(m for m in transport.sent if m["To"] == "hr@acme.example").as_bytes(),
+                                    policy=email.policy.default)
+    assert "Hi Jane Doe" in acme.get_body().get_content() and "Acme Ltd" in acme["Subject"]
+
+
+
+def test_run_outreach_sends_once_to_an_address_written_in_different_cases(outbox, suppression):
+    transport = FakeTransport()
+
+    stats = outreach_runner.run_outreach([
+        enriched("Delta Care Ltd", email="HR@Shared.example"),
+        enriched("Epsilon Homes Ltd", email="hr@shared.example"),
+    ], outbox=outbox, transports=[transport], renderer=OutreachRenderer(cache_dir=None), suppression=suppression)
+
+    assert [m["To"] for m in transport.sent] == ["HR@Shared.example"]
+    assert stats == {"queued": 1, "suppressed": 0, "success": 1, "failed": 0}
+
+def test_suppression_skips_contacted_domains_unsubscribes_and_bounces(outbox, suppression):
+    renderer = OutreachRenderer(cache_dir=None)
+    suppression.add("Leaver@Gamma.example", "unsubscribed")
+    run = [enriched("Acme Ltd", email="hr@acme.example"), enriched("Solo Trader", email="solo@gmail.com"),
+           enriched("North Hospital Trust", email="recruitment@nhs.net")]
+    outreach_runner.run_outreach(run, outbox=outbox, transports=[FakeTransport()], renderer=renderer,
+                                 suppression=suppression)
+
+    # Next day: renamed/re-listed sponsors at an already contacted address or company domain are skipped,
+    # while another sender on the same free-mail provider or shared NHS domain is not
+    transport = FakeTransport(fail={"gone@delta.example": [
+        {"status": "failed", "error": "550 no such user", "permanent": True, "bounced": True}]})
+    stats = outreach_runner.run_outreach([
+        enriched("Acme Group", email="HR@acme.example"),
+        enriched("Acme Trading", email="sales@acme.example"),
+        enriched("Gamma Ltd", email="leaver@gamma.example"),
+        enriched("Other Trader", email="other@gmail.com"),
+        enriched("South Hospital Trust", email="jobs@nhs.net"),
+        enriched("Delta Ltd", email="gone@delta.example"),
+    ], outbox=outbox, transports=[transport], renderer=renderer, suppression=suppression)
+
+    assert sorted(m["To"] for m in transport.sent) == ["jobs@nhs.net", "other@gmail.com"]
+    assert stats == {"queued": 3, "suppressed": 3, "success": 2, "failed": 1}
+    assert suppression.suppressed(["hr@acme.example", "leaver@gamma.example", "gone@delta.example",
+                                   "new@elsewhere.example"]) == {
+        "hr@acme.example": "contacted", "leaver@gamma.example": "unsubscribed", "gone@delta.example": "bounced"}
+    assert suppression.stats["bloom_negative"] >= 1
+
+    # Only hard bounces and complaints from provider notifications suppress
+    suppression.record_events([
+        {"notificationType": "Bounce", "bounce": {"bounceType": "Transient",
+                                                  "bouncedRecipients": [{"emailAddress": "full@eps.example"}]}},
+        {"notificationType": "Complaint", "complaint": {"complainedRecipients": [{"emailAddress": "x@eps.example"}]}},
+    ])
+    assert suppression.suppressed(["full@eps.example", "x@eps.example"]) == {"x@eps.example": "complained"}
+    # A restart loads the same index from disk
+    with SuppressionIndex(suppression.db_path) as reopened:
+        assert reopened.is_suppressed("anyone@acme.example") and not reopened.is_suppressed("a@new.example")
+
+
+def test_suppression_bloom_filter_is_saved_and_rebuilt_only_when_stale(tmp_path, monkeypatch):
+    path = str(tmp_path / "suppression.sqlite3")
+    with SuppressionIndex(path) as index:
+        index.record_contacted(["hr@acme.example"])
+
+    # Opening again loads the saved filter instead of scanning the table
+    rebuilds = []
+    rebuild = SuppressionIndex.rebuild_bloom
+    monkeypatch.setattr(SuppressionIndex, "rebuild_bloom", lambda self: rebuilds.append(1) or rebuild(self))
+    with SuppressionIndex(path) as index:
+        assert index.is_suppressed("anyone@acme.example") and not index.is_suppressed("a@new.example")
+    assert rebuilds == []
+
+    # A write the saved filter never saw (here from an index without one) forces a rebuild
+    with SuppressionIndex(path, bloom=False) as writer:
+        writer.add("leaver@gamma.example", "unsubscribed")
+    with SuppressionIndex(path) as index:
+        assert index.is_suppressed("leaver@gamma.example")
+    assert rebuilds == [1]
+
+
+def test_contacts_are_recorded_when_sent_not_when_queued(outbox, suppression):
+    outreach_runner.run_outreach([enriched("Acme Ltd", email="hr@acme.example")], outbox=outbox,
+                                 renderer=OutreachRenderer(cache_dir=None), suppression=suppression, dispatch=False)
+
+    # Queued but not yet sent: a crash now must not leave the sponsor suppressed forever
+    assert suppression.suppressed(["hr@acme.example"]) == {}
+
+    OutboxDispatcher(outbox, [FakeTransport()], rates={"smtp": 200}, suppression=suppression).run()
+
+    assert suppression.suppressed(["hr@acme.example", "sales@acme.example"]) == {
+        "hr@acme.example": "contacted", "sales@acme.example": "contacted"}
+
+
+def test_renderer_picks_variants_and_encodes_valid_mime(tmp_path):
+    renderer = OutreachRenderer("outreach@example.com", cache_dir=str(tmp_path / "cache"))
+    sponsors = [
+        enriched("Café Ünï Ltd", route="Global Business Mobility", email="hr@cafe.example",
+                 **{"Town/City": "Leeds"}),
+        enriched("Smith & Co", email="hr@smith.example", owner="<Ann>", **{"Town/City": "London"}),
+        enriched("Other Ltd", email="hr@other.example", **{"Town/City": "Londonderry"}),
+    ]
+
+    batches = list(renderer.render_batches(sponsors, batch_size=2, key=outreach_runner.dedupe_key))
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    messages = [message for batch in batches for message in batch]
+    assert [m["variant"] for m in messages] == ["global-business-mobility", "london", "default"]
+    parsed = [email.message_from_bytes(m["raw"], policy=email.policy.default) for m in messages]
+    assert parsed[0]["Subject"] == "Supporting Café Ünï Ltd on the Global Business Mobility route"
+    assert "Global Business Mobility route" in parsed[0].get_body().get_content()
+    # Subjects are plain text; bodies are HTML-escaped
+    assert parsed[1]["Subject"] == "UK Sponsor Licence support for Smith & Co in London"
+    assert "Hi &lt;Ann&gt;" in parsed[1].get_body().get_content()
+    assert all(p["From"] == "outreach@example.com" and not p.defects for p in parsed)
+    assert parsed[2]["To"] == "hr@other.example"
+    # Every message is dated and has its own Message-ID on the sender's domain
+    assert all(p["Date"].datetime is not None for p in parsed)
+    assert len({p["Message-ID"] for p in parsed}) == 3
+    assert all(p["Message-ID"].endswith("@example.com>") for p in parsed)
+    # Compiled templates are cached on disk for the next run
+    assert any((tmp_path / "cache").iterdir())
+
+
+def test_renderer_encodes_a_non_ascii_sender_name_only():
+    renderer = OutreachRenderer("Zoë Müller <outreach@example.com>", cache_dir=None)
+    [[message]] = renderer.render_batches([enriched("Acme Ltd")], batch_size=1, key=outreach_runner.dedupe_key)
+
+    parsed = email.message_from_bytes(message["raw"], policy=email.policy.default)
+    assert not parsed.defects
+    assert parsed["From"].addresses[0].display_name == "Zoë Müller"
+    assert parsed["From"].addresses[0].addr_spec == "outreach@example.com"
+
+def test_outbox_retries_dead_letters_and_never_sends_twice(outbox):
+    transient = {"status": "failed", "error": "421 try again later"}
+    rejected = {"status": "failed", "error": "550 no such user", "permanent": True}
+    transport = FakeTransport(fail={"hr@flaky.example": [transient, transient],
+                                    "hr@gone.example": [rejected],
+                                    "hr@down.example": [transient] * 10})
+    sponsors = [enriched("Flaky Ltd", email="hr@flaky.example"), enriched("Gone Ltd", email="hr@gone.example"),
+                enriched("Down Ltd", email="hr@down.example"), enriched("Fine Ltd", email="hr@fine.example")]
+    renderer = OutreachRenderer("outreach@example.com", cache_dir=None)
+    messages = [m for batch in outreach_runner.outreach_messages(sponsors, renderer=renderer) for m in batch]
+    outbox.enqueue(messages)
+
+    stats = OutboxDispatcher(outbox, [transport], rates={"smtp": 200}, max_attempts=3,
+                             retry_base=0.01, retry_max=0.05).run()
+
+    assert sorted(m["To"] for m in transport.sent) == ["hr@fine.example", "hr@flaky.example"]
+    assert stats == {"sent": 2, "retried": 4, "dead": 2}
+    dead = {letter["recipient"]: letter for letter in outbox.dead_letters()}
+    assert set(dead) == {"hr@gone.example", "hr@down.example"}
+    assert dead["hr@gone.example"]["attempts"] == 1 and dead["hr@down.example"]["attempts"] == 3
+
+    # A rerun queues nothing new, so nothing is sent twice
+    assert outbox.enqueue(messages) == []
+    assert OutboxDispatcher(outbox, [transport]).run() == {"sent": 0, "retried": 0, "dead": 0}
+    assert len(transport.sent) == 2
+
+
+
+def test_outbox_leaves_messages_without_a_transport_pending(outbox):
+    renderer = OutreachRenderer("outreach@example.com", cache_dir=None)
+    sponsors = [enriched("Acme Ltd", email="hr@acme.example"), enriched("Beta Ltd", email="hr@beta.example")]
+    smtp, ses = [m for batch in outreach_runner.outreach_messages(sponsors, renderer=renderer) for m in batch]
+    outbox.enqueue([smtp])
+    outbox.enqueue([ses], provider="ses")
+
+    stats = OutboxDispatcher(outbox, [FakeTransport()], rates={"smtp": 200}).run()
+
+    # Not a failure of the message: a dispatcher with an SES transport sends it later
+    assert stats == {"sent": 1, "retried": 0, "dead": 0}
+    assert outbox.status(ses["dedupe_key"]) == "pending" and outbox.dead_letters() == []
+
+
+@pytest.fixture
+def smtp_server():
+    aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+            self.sessions = set()
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address.startswith("refused@"):
+                return "550 No such user"
+            envelope.rcpt_tos.append(address)
+            return "250 OK"
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            self.sessions.add(id(session))
+            return "250 OK"
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = Handler()
+    controller = aiosmtpd.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def test_smtp_pool_reuses_sessions_and_reconnects(smtp_server):
+    controller, handler = smtp_server
+    pool = SMTPPool(controller.hostname, controller.port, from_email="outreach@example.com", size=2,
+                    starttls=False, max_messages=10)
+    messages = [build_message(f"user{i}@example.com", "Hi", "<p>Hi</p>", pool.from_email) for i in range(30)]
+
+    results = pool.send_many(messages)
+
+    assert all(result["status"] == "sent" for result in results)
+    assert sorted(e.rcpt_tos[0] for e in handler.messages) == sorted(m["To"] for m in messages)
+    # 30 messages over at most 2 concurrent sessions, each recycled after 10 messages
+    assert 3 <= pool.stats["connections"] <= 6
+
+    # A session dropped by the server is replaced transparently
+    with pool.session() as session:
+        session.server.close()
+    connections = pool.stats["connections"]
+    assert pool.send(build_message("late@example.com", "Hi", "<p>Hi</p>", pool.from_email))["status"] == "sent"
+    assert pool.stats["reconnects"] == 1 and pool.stats["connections"] == connections + 1
+    pool.close()
+
+
+def test_smtp_pool_keeps_the_session_when_a_recipient_is_refused(smtp_server):
+    controller, handler = smtp_server
+    pool = SMTPPool(controller.hostname, controller.port, from_email="outreach@example.com", size=1,
+                    starttls=False)
+
+    refused = pool.send(build_message("refused@example.com", "Hi", "<p>Hi</p>", pool.from_email))
+    sent = pool.send(build_message("hr@example.com", "Hi", "<p>Hi</p>", pool.from_email))
+
+    assert refused["status"] == "failed" and refused["permanent"] and refused["bounced"]
+    assert sent["status"] == "sent"
+    # The refusal was about the recipient, so the same session sent the next message
+    assert pool.stats["connections"] == 1 and pool.stats["reconnects"] == 0
+    pool.close()
+
+
+@pytest.fixture
+def ses(monkeypatch):
+    moto = pytest.importorskip("moto")
+    from moto.core import DEFAULT_ACCOUNT_ID
+    from moto.ses.models import ses_backends
+
+    for name, value in {"AWS_REGION": "eu-west-2", "AWS_ACCESS_KEY_ID": "testing",
+                        "AWS_SECRET_ACCESS_KEY": "testing", "SES_FROM_EMAIL": "outreach@example.com"}.items():
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        ses_client.cache_clear()
+        ses_client().verify_email_identity(EmailAddress="outreach@example.com")
+        yield ses_backends[DEFAULT_ACCOUNT_ID]["eu-west-2"]
+    ses_client.cache_clear()
+
+
+def test_ses_bulk_sends_map_status_back_to_each_sponsor(ses, outbox):
+    sponsors = [enriched(f"Sponsor {i} Ltd", email=f"hr{i}@sponsor{i}.example",
+                         route="Global Business Mobility" if i % 3 == 0 else "Skilled Worker") for i in range(120)]
+    renderer = OutreachRenderer("outreach@example.com", cache_dir=None)
+    for batch in outreach_runner.outreach_messages(sponsors, renderer=renderer):
+        outbox.enqueue(batch, provider="ses")
+    transport = SESTransport(renderer=renderer)
+    assert transport.client is ses_client()
+
+    stats = OutboxDispatcher(outbox, [transport], rates={"ses": None}).run()
+
+    assert stats == {"sent": 120, "retried": 0, "dead": 0}
+    # Bulk calls of at most 50 destinations, one template per variant
+    calls = [(len(call.destinations), call.template) for call in ses.sent_messages]
+    assert sorted(size for size, _ in calls) == [30, 40, 50]
+    templates = transport.templates()
+    assert {template for _, template in calls} == {templates["global-business-mobility"], templates["default"]}
+    message_ids = {outbox.delivery(outreach_runner.dedupe_key(s))["provider_message_id"] for s in sponsors}
+    assert len(message_ids) == 120 and None not in message_ids
+    data = json.loads(ses.sent_messages[0].destinations[0]["ReplacementTemplateData"])
+    assert data["company_name"].startswith("Sponsor ")
+
+
+def test_ses_destination_statuses_are_mapped_to_retryable_or_permanent():
+    class StubClient:
+        def create_template(self, Template):
+            pass
+
+        def send_bulk_templated_email(self, **request):
+            return {"Status": [{"Status": "Success", "MessageId": "m-1"},
+                               {"Status": "MessageRejected", "Error": "Email address is not verified"},
+                               {"Status": "AccountThrottled", "Error": "Maximum sending rate exceeded"}]}
+
+    transport = SESTransport("outreach@example.com", client=StubClient(),
+                             renderer=OutreachRenderer("outreach@example.com", cache_dir=None))
+    messages = [{"to": f"hr{i}@example.com", "variant": "default", "template_data": {}} for i in range(3)]
+
+    sent, rejected, throttled = transport.send_bulk(messages)
+
+    assert sent == {"to": ["hr0@example.com"], "status": "sent", "message_id": "m-1"}
+    assert rejected["status"] == "failed" and rejected["permanent"]
+    assert throttled["status"] == "failed" and not throttled["permanent"]
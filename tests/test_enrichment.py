@@ -1 +1,467 @@
-# Tests for mock API enrichment
\ No newline at end of file
+# Tests for mock API enrichment
+
+import pytest
+
+from enrichment import enrich_batch
+from utils.checkpoints import CheckpointStore, RecordProgress
+
+
+@pytest.fixture(autouse=True)
+def isolated_enrichment_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("enrichment.cache.ENRICH_CACHE_DB", str(tmp_path / "enrichment_cache.sqlite3"))
+    # Default providers would otherwise scrape guessed domains on the internet
+    monkeypatch.setenv("ENRICH_WEBSITE_SCRAPER", "false")
+
+
+def sponsor(name, route="Skilled Worker"):
+    return {"Organisation Name": name, "Town/City": "London", "County": "Unknown",
+            "Type & Rating": "Worker (A rating)", "Route": route}
+
+
+def test_mock_enrich_maps_register_columns():
+    enriched = enrich_batch.mock_enrich(sponsor("Acme Ltd"))
+
+    assert enriched["organization"] == "Acme Ltd"
+    assert enriched["route"] == "Skilled Worker"
+    assert enriched["town_city"] == "London"
+    assert enriched["enriched"] is True
+
+
+def test_enrich_companies_resumes_from_progress(tmp_path, monkeypatch):
+    companies = [sponsor(f"Company {i} Ltd") for i in range(5)]
+    progress_path = str(tmp_path / "enrich.progress.jsonl")
+    calls = []
+
+    class CrashingProgress(RecordProgress):
+        """Dies while recording the fourth company, as a killed run would."""
+
+        def mark_done(self, key, result=None):
+            if len(self) == 3:
+                raise RuntimeError("simulated crash")
+            super().mark_done(key, result)
+
+    def enrich(company):
+        calls.append(company["Organisation Name"])
+        return {"organization": company["Organisation Name"], "route": company["Route"]}
+
+    monkeypatch.setattr(enrich_batch, "mock_enrich", enrich)
+    with pytest.raises(RuntimeError, match="simulated crash"):
+        enrich_batch.enrich_companies(companies, progress=CrashingProgress(progress_path), concurrency=1)
+
+    def record_call(company):
+        calls.append(company["Organisation Name"])
+        return {"organization": company["Organisation Name"]}
+
+    calls.clear()
+    monkeypatch.setattr(enrich_batch, "mock_enrich", record_call)
+    enriched = enrich_batch.enrich_companies(companies, progress=RecordProgress(progress_path), concurrency=1)
+
+    assert calls == ["Company 3 Ltd", "Company 4 Ltd"]
+    assert [e["organization"] for e in enriched] == [c["Organisation Name"] for c in companies]
+
+
+def test_checkpoint_is_ignored_when_input_hash_changes(tmp_path):
+    store = CheckpointStore("2025-04-26", base_dir=str(tmp_path))
+    store.save("enrich", "hash-a", [{"organization": "Acme Ltd"}])
+
+    reopened = CheckpointStore("2025-04-26", base_dir=str(tmp_path))
+    assert reopened.load("enrich", "hash-a") == [{"organization": "Acme Ltd"}]
+    assert reopened.load("enrich", "hash-b") is None
+
+
+def test_checkpoint_prune_keeps_the_most_recently_written_runs(tmp_path):
+    import os
+
+    for age, run_id in enumerate(["register-ffff", "register-0000", "register-aaaa"]):
+        CheckpointStore(run_id, base_dir=str(tmp_path)).save("diff", "hash", {})
+        os.utime(tmp_path / run_id, (1_000_000 + age, 1_000_000 + age))
+
+    assert CheckpointStore("register-aaaa", base_dir=str(tmp_path)).prune(keep=2) == ["register-ffff"]
+
+
+@pytest.fixture
+def stub_provider_server():
+    """
+    Local enrichment API stub: answers after a short delay and rate-limits every third request.
+    """
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "lock": threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with state["lock"]:
+                state["requests"] += 1
+                throttle = state["requests"] % 3 == 0
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            time.sleep(0.05)
+            with state["lock"]:
+                state["in_flight"] -= 1
+            if throttle:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            payload = json.dumps({"website": f"https://{body['organization'].split()[0].lower()}.example",
+                                  "phone": None}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 64
+
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/enrich", state
+    server.shutdown()
+
+
+def test_enrich_companies_runs_providers_concurrently_with_retries(stub_provider_server, monkeypatch):
+    from enrichment.enrich_company import HttpProvider, MockProvider
+
+    monkeypatch.setattr("enrichment.enrich_company.ENRICH_BACKOFF_BASE_S", 0.01)
+    url, state = stub_provider_server
+    companies = [sponsor(f"Company{i} Ltd") for i in range(20)]
+    web = HttpProvider("web", url, rate=200, max_concurrency=10, max_retries=5)
+
+    enriched = enrich_batch.enrich_companies(companies, providers=[MockProvider(), web], concurrency=10)
+
+    assert [e["organization"] for e in enriched] == [c["Organisation Name"] for c in companies]
+    assert enriched[3]["website"] == "https://company3.example"
+    assert "phone" not in enriched[3]
+    assert web.stats["rate_limited"] > 0 and web.stats["failed"] == 0
+    # Requests overlapped, but never beyond the provider's concurrency cap
+    assert 1 < state["max_in_flight"] <= 10
+
+
+def test_token_bucket_spaces_out_requests():
+    from utils.rate_limit import TokenBucket
+
+    bucket = TokenBucket(rate=10, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_enrichment_cache_expires_fields_and_evicts_least_recently_used(tmp_path):
+    from enrichment.cache import EnrichmentCache
+
+    day = 86400
+    with EnrichmentCache(str(tmp_path / "cache.sqlite3"), max_entries=2,
+                         field_ttl_days={"email": 1, "industry": 30}) as cache:
+        cache.put("Acme Limited", "web", {"email": "hr@acme.example", "industry": "Care"}, now=0)
+        assert cache.get("ACME LTD", "web", now=day / 2) == {"email": "hr@acme.example", "industry": "Care"}
+        # The email has expired, so the entry is refreshed from the provider
+        assert cache.get("Acme Ltd", "web", now=2 * day) is None
+        cache.put("Acme Ltd", "web", {"email": "jobs@acme.example"}, now=2 * day)
+        assert cache.get("Acme Ltd", "web", now=2 * day) == {"email": "jobs@acme.example", "industry": "Care"}
+
+        cache.put("Beta Ltd", "web", {}, now=2.2 * day)
+        assert cache.get("Beta Ltd", "web", now=2.2 * day) == {}
+        cache.get("Acme Ltd", "web", now=2.5 * day)
+        cache.put("Gamma Ltd", "web", {"industry": "Retail"}, now=2.8 * day)
+
+        assert cache.evict() == 1
+        assert cache.get("Beta Ltd", "web", now=2.8 * day) is None
+        assert cache.stats["evictions"] == 1 and cache.stats["expired"] == 1
+
+
+def test_enrich_companies_serves_repeat_lookups_from_cache(stub_provider_server, tmp_path):
+    from enrichment.cache import EnrichmentCache
+    from enrichment.enrich_company import HttpProvider
+
+    url, state = stub_provider_server
+    companies = [sponsor("Acme Ltd"), sponsor("Beta Ltd")]
+    cache_path = str(tmp_path / "cache.sqlite3")
+
+    with EnrichmentCache(cache_path) as cache:
+        enrich_batch.enrich_companies(companies, providers=[HttpProvider("web", url)], cache=cache)
+    requests_made = state["requests"]
+
+    # A later run sees the same organisations renamed / on another route
+    repeat = [sponsor("ACME LIMITED", route="Global Business Mobility"), sponsor("Beta Limited")]
+    with EnrichmentCache(cache_path) as cache:
+        enriched = enrich_batch.enrich_companies(repeat, providers=[HttpProvider("web", url)], cache=cache)
+        assert cache.stats["hits"] == 2
+
+    assert state["requests"] == requests_made
+    assert enriched[0]["website"] == "https://acme.example"
+
+
+def test_enrich_companies_enriches_each_organisation_once_and_fans_out(monkeypatch):
+    from enrichment.enrich_company import mock_enrich
+    calls = []
+
+    def record_call(company):
+        calls.append(company["Route"])
+        return {**mock_enrich(company), "website": "https://acme.example"}
+
+    monkeypatch.setattr(enrich_batch, "mock_enrich", record_call)
+    companies = [sponsor("Acme Ltd"), sponsor("Beta Ltd"), sponsor("ACME LIMITED", route="Global Business Mobility")]
+
+    enriched = enrich_batch.enrich_companies(companies)
+
+    assert len(calls) == 2
+    assert [(e["organization"], e["route"]) for e in enriched] == [
+        ("Acme Ltd", "Skilled Worker"), ("Beta Ltd", "Skilled Worker"), ("ACME LIMITED", "Global Business Mobility")
+    ]
+    assert enriched[2]["website"] == "https://acme.example"
+
+
+def fake_provider(name, answer, latency=0.0, fields=None, cost=1.0):
+    """
+    In-process provider that answers after `latency` seconds and counts its calls.
+    """
+    import asyncio
+    from enrichment.enrich_company import EnrichmentProvider
+
+    class Provider(EnrichmentProvider):
+        calls = 0
+
+        async def fetch(self, session, company):
+            Provider.calls += 1
+            await asyncio.sleep(self.latency)
+            return dict(answer)
+
+    provider = Provider(name=name, fields=fields or answer.keys(), cost=cost)
+    provider.latency = latency
+    return provider
+
+
+def test_waterfall_router_stops_once_required_fields_are_filled():
+    from enrichment.router import WaterfallRouter
+
+    email = fake_provider("email", {"email": "hr@acme.example"})
+    website = fake_provider("website", {"website": "https://acme.example"})
+    full = fake_provider("full", {"email": "info@acme.example", "website": "https://x.example"}, cost=5)
+    router = WaterfallRouter([full, email, website], required_fields=["email", "website"], hedge=False)
+
+    enriched = enrich_batch.enrich_companies([sponsor(f"Company{i} Ltd") for i in range(10)], router=router)
+
+    assert all(e["email"] == "hr@acme.example" and e["website"] == "https://acme.example" for e in enriched)
+    # The expensive all-rounder is never needed once the cheap specialists cover the fields
+    assert type(full).calls == 0
+
+
+def test_waterfall_router_ranks_by_live_hit_rate():
+    from enrichment.router import WaterfallRouter
+
+    empty = fake_provider("empty", {}, fields=["email"])
+    good = fake_provider("good", {"email": "hr@acme.example"})
+    router = WaterfallRouter([empty, good], required_fields=["email"], hedge=False)
+
+    enrich_batch.enrich_companies([sponsor(f"Company{i} Ltd") for i in range(30)], router=router, concurrency=1)
+
+    assert router.ranked({"email"}, exclude=set())[0] is good
+    assert router.stats["empty"]["attempts"] < 5
+
+
+def test_waterfall_router_hedges_slow_requests():
+    import time
+    from enrichment.router import WaterfallRouter
+
+    primary = fake_provider("primary", {"email": "hr@acme.example"}, latency=0.005)
+    backup = fake_provider("backup", {"email": "jobs@acme.example"}, latency=0.005, cost=2)
+    router = WaterfallRouter([primary, backup], required_fields=["email"])
+    enrich_batch.enrich_companies([sponsor(f"Company{i} Ltd") for i in range(25)], router=router, concurrency=1)
+
+    primary.latency = 1.0
+    started = time.perf_counter()
+    enriched = enrich_batch.enrich_companies([sponsor("Slow Ltd")], router=router)
+
+    assert time.perf_counter() - started < 0.5
+    assert enriched[0]["email"] == "jobs@acme.example"
+    assert router.stats["backup"]["hedge_wins"] == 1
+
+
+def test_bulk_provider_micro_batches_and_maps_record_errors():
+    from enrichment.bulk import FakeBulkProvider
+
+    bulk = FakeBulkProvider(batch_size=200, max_wait=0.05, poll_interval=0.01)
+    companies = [sponsor(f"Company{i} Ltd") for i in range(449)] + [sponsor("Invalid Holdings Ltd")]
+
+    enriched = enrich_batch.enrich_companies(companies, providers=[bulk])
+
+    assert sorted(bulk.batch_sizes) == [50, 200, 200]
+    assert len(enriched) == 449
+    assert enriched[7]["website"] == "https://company7.example"
+    assert enriched[7]["route"] == "Skilled Worker"
+    assert bulk.stats["record_errors"] == 1
+
+
+def test_http_bulk_provider_polls_jobs(tmp_path):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from enrichment.bulk import HttpBulkProvider
+
+    jobs = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, body):
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            records = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["records"]
+            job_id = str(len(jobs) + 1)
+            jobs[job_id] = {"records": records, "polls": 0}
+            self.reply({"job_id": job_id})
+
+        def do_GET(self):
+            job = jobs[self.path.rsplit("/", 1)[1]]
+            job["polls"] += 1
+            if job["polls"] < 3:
+                return self.reply({"status": "running"})
+            results = [{"index": i, "error": "not found"} if r["organization"].startswith("Ghost")
+                       else {"index": i, "data": {"industry": "Care", "ceo": "hidden"}}
+                       for i, r in enumerate(job["records"])]
+            self.reply({"status": "complete", "results": results})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        bulk = HttpBulkProvider(name="vendor", url=f"http://127.0.0.1:{server.server_port}", fields=["industry"],
+                                batch_size=10, max_wait=0.05, poll_interval=0.01)
+        companies = [sponsor("Acme Ltd"), sponsor("Ghost Ltd"), sponsor("Beta Ltd")]
+        enriched = enrich_batch.enrich_companies(companies, providers=[bulk])
+    finally:
+        server.shutdown()
+
+    assert len(jobs) == 1
+    assert [(e["organization"], e["industry"]) for e in enriched] == [("Acme Ltd", "Care"), ("Beta Ltd", "Care")]
+    assert "ceo" not in enriched[0]
+
+
+@pytest.fixture
+def static_site(tmp_path):
+    """
+    Local static website: homepage, contact and team pages, and a robots.txt.
+    """
+    import functools
+    import threading
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    site = tmp_path / "site"
+    (site / "private").mkdir(parents=True)
+    (site / "index.html").write_text(
+        '<html><body><h1>Acme Care</h1><a href="/contact.html">Contact us</a>'
+        '<a href="/team.html">Our leadership team</a><a href="/private/staff.html">Staff contact</a>'
+        '<script>var e = "tracking@sentry.io";</script></body></html>'
+    )
+    (site / "contact.html").write_text(
+        '<html><body><p>Call 020 7946 0958 or write to <a href="mailto:HR@acme.test">HR</a>.</p>'
+        '<p>General: info@gmail.com</p></body></html>'
+    )
+    (site / "team.html").write_text("<html><body><p>Jane Doe, Managing Director</p></body></html>")
+    (site / "private" / "staff.html").write_text("<p>secret@acme.test</p>")
+    (site / "robots.txt").write_text("User-agent: *\nDisallow: /private/\n")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(site)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_website_scraper_extracts_contacts_and_respects_robots(static_site):
+    from enrichment.website_scraper import WebsiteScraper
+
+    scraper = WebsiteScraper(resolve=lambda company: [f"{static_site}/nope.html", static_site])
+    enriched = enrich_batch.enrich_companies([sponsor("Acme Care Ltd")], providers=[scraper])
+
+    assert enriched[0]["website"] == static_site
+    assert enriched[0]["email"] == "hr@acme.test"
+    assert enriched[0]["emails"] == ["hr@acme.test", "info@gmail.com"]
+    assert enriched[0]["phone"] == "020 7946 0958"
+    assert enriched[0]["leadership_url"] == f"{static_site}/team.html"
+    assert "secret@acme.test" not in enriched[0]["emails"]
+
+
+def test_website_scraper_only_takes_guessed_sites_that_name_the_sponsor(static_site):
+    from enrichment.website_scraper import WebsiteScraper
+
+    # The guessed domain answers, but the homepage is about somebody else
+    scraper = WebsiteScraper(resolve=lambda company: [static_site], use_process_pool=False)
+    unrelated = enrich_batch.enrich_companies([sponsor("Beta Homes Ltd")], providers=[scraper])
+    assert unrelated[0]["website"] is None and unrelated[0]["email"] is None
+
+    # A website the sponsor is known to have needs no such proof
+    known = sponsor("Gamma Homes Ltd")
+    known["website"] = static_site
+    assert enrich_batch.enrich_companies([known], providers=[scraper])[0]["email"] == "hr@acme.test"
+
+
+def test_website_scraper_reads_at_most_max_bytes(static_site, tmp_path):
+    import asyncio
+    import aiohttp
+    from enrichment.website_scraper import WebsiteScraper
+
+    (tmp_path / "site" / "big.html").write_text("<p>" + "x" * 100_000 + "</p>")
+
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            return await WebsiteScraper(max_bytes=1000).get(session, f"{static_site}/big.html")
+
+    status, _, body = asyncio.run(fetch())
+    assert status == 200 and len(body) == 1000
+
+
+def test_default_enrichment_scrapes_sponsor_websites(static_site, monkeypatch):
+    monkeypatch.setenv("ENRICH_WEBSITE_SCRAPER", "true")
+    monkeypatch.setattr("enrichment.website_scraper.guess_websites",
+                        lambda company: [static_site] if company["Organisation Name"].startswith("Acme") else [])
+
+    enriched = enrich_batch.enrich_companies([sponsor("Acme Care Ltd"), sponsor("Nowhere Ltd")])
+
+    assert enriched[0]["organization"] == "Acme Care Ltd"
+    assert enriched[0]["route"] == "Skilled Worker"
+    assert enriched[0]["enriched"] is True
+    assert enriched[0]["website"] == static_site
+    assert enriched[0]["email"] == "hr@acme.test"
+    assert enriched[1]["website"] is None and enriched[1]["email"] is None
+
+
+def test_enriched_store_partitions_indexes_and_streams_batches(tmp_path):
+    from enrichment.enriched_store import EnrichedStore
+
+    day1 = [{"organization": "Acme Ltd", "route": "Skilled Worker", "email": "old@acme.example"},
+            {"organization": "Beta Ltd", "route": "Skilled Worker", "email": "hr@beta.example"}]
+    day2 = [{"organization": "ACME LIMITED", "route": r, "email": "hr@acme.example"}
+            for r in ("Skilled Worker", "Global Business Mobility")]
+
+    with EnrichedStore(str(tmp_path)) as store:
+        store.append(day1, "2025-01-01")
+        store.append(day2, "2025-01-02")
+        # A rerun of the same day replaces its part instead of duplicating it
+        store.append(day2, "2025-01-02")
+
+        assert store.dates() == ["2025-01-01", "2025-01-02"]
+        assert [len(b) for b in store.iter_batches("2025-01-01", "2025-01-02", batch_size=3)] == [3, 1]
+        assert [r["email"] for r in store.lookup("Acme Ltd")] == ["hr@acme.example"] * 2
+        assert len(store.lookup("acme ltd", latest_only=False)) == 3
+        assert store.read_date("2025-01-01") == day1
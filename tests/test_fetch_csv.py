@@ -0,0 +1,101 @@
+# Tests for the conditional, streamed register download
+
+import os
+import json
+
+import pytest
+
+from extraction import fetch_csv
+
+
+CSV_BODY = b"Organisation Name,Town/City,County,Type & Rating,Route\nAcme Ltd,London,,Worker (A rating),Skilled Worker\n"
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), 7):
+            yield self.content[i:i + 7]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def download_env(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    monkeypatch.setattr(fetch_csv, "RAW_DIR", str(raw_dir))
+    monkeypatch.setattr(fetch_csv, "DOWNLOAD_MANIFEST", str(raw_dir / "manifest.json"))
+    monkeypatch.setattr(fetch_csv, "get_csv_download_link", lambda manifest=None: "https://example/register.csv")
+    return raw_dir
+
+
+def test_stream_to_file_hashes_and_counts_rows(tmp_path):
+    path = tmp_path / "out.csv"
+    digest, size, rows = fetch_csv.stream_to_file(FakeResponse(body=CSV_BODY), str(path))
+
+    assert path.read_bytes() == CSV_BODY
+    assert size == len(CSV_BODY)
+    assert rows == 1
+    assert len(digest) == 64
+
+
+def test_download_register_short_circuits_on_same_hash(download_env, monkeypatch):
+    responses = [FakeResponse(body=CSV_BODY, headers={"ETag": "v1"}), FakeResponse(body=CSV_BODY)]
+    sent_headers = []
+
+    def fake_get(url, headers=None, **kwargs):
+        sent_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(fetch_csv.requests, "get", fake_get)
+
+    first_path, first_changed = fetch_csv.download_register()
+    assert first_changed
+    assert os.path.exists(first_path)
+    fetch_csv.mark_register_processed(fetch_csv.load_manifest()["https://example/register.csv"]["sha256"])
+
+    # Pretend the first snapshot was from yesterday so today's-file reuse doesn't kick in
+    os.rename(first_path, os.path.join(download_env, "uk_sponsor_register_2000-01-01.csv"))
+
+    second_path, second_changed = fetch_csv.download_register()
+    assert not second_changed
+    assert sent_headers[1] == {"If-None-Match": "v1"}
+    assert not any(f.endswith(".part") for f in os.listdir(download_env))
+
+
+def test_download_register_short_circuits_on_304(download_env, monkeypatch):
+    download_env.mkdir(parents=True)
+    (download_env / "manifest.json").write_text(json.dumps({
+        "https://example/register.csv": {"etag": "v1", "sha256": "abc", "path": "old.csv", "processed_sha256": "abc"}
+    }))
+    monkeypatch.setattr(fetch_csv.requests, "get", lambda *a, **k: FakeResponse(status_code=304))
+
+    assert fetch_csv.download_register() == ("old.csv", False)
+
+
+def test_register_counts_as_changed_until_a_run_processes_it(download_env, monkeypatch):
+    monkeypatch.setattr(fetch_csv.requests, "get", lambda *a, **k: FakeResponse(body=CSV_BODY, headers={"ETag": "v1"}))
+
+    first_path, _ = fetch_csv.download_register()
+    os.rename(first_path, os.path.join(download_env, "uk_sponsor_register_2000-01-01.csv"))
+    manifest = fetch_csv.load_manifest()
+    manifest["https://example/register.csv"]["path"] = os.path.join(download_env, "uk_sponsor_register_2000-01-01.csv")
+    fetch_csv.save_manifest(manifest)
+
+    # The run that downloaded it crashed: the same register is handed out again, as changed
+    path, changed = fetch_csv.download_register()
+    assert changed and path.endswith("uk_sponsor_register_2000-01-01.csv")
+
+    fetch_csv.mark_register_processed(manifest["https://example/register.csv"]["sha256"])
+    assert fetch_csv.download_register() == (path, False)
+    # ... and a 304 for it ends the run early too
+    monkeypatch.setattr(fetch_csv.requests, "get", lambda *a, **k: FakeResponse(status_code=304))
+    assert fetch_csv.download_register() == (path, False)
@@ -1 +1,374 @@
-# Tests for CRM integration
\ No newline at end of file
+# Tests for CRM integration
+
+import io
+import csv
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crm import sync_crm
+from crm.salesforce_api import SalesforceSession
+from crm.sync_state import SyncState
+from utils.checkpoints import RecordProgress, sponsor_key
+
+KEY = "Sponsor_Key__c"
+
+
+def enriched(index, **fields):
+    return {"organization": f"Sponsor {index} Ltd", "route": "Skilled Worker", "email": f"hr@sponsor{index}.example",
+            "town_city": "Leeds", "county": "West Yorkshire", **fields}
+
+
+@pytest.fixture
+def sync_state(tmp_path):
+    with SyncState(str(tmp_path / "sync_state.sqlite3")) as state:
+        yield state
+
+
+@pytest.fixture
+def salesforce():
+    """
+    Local stand-in for the Salesforce REST API, upserting Organization_Contracts__c records on
+    their external ID. sObject Collections upserts take at most 200 records and answer per
+    record; the first request gets a 401 (expired token) and one chunk a 503 once. Bulk API 2.0
+    ingest jobs go through Open -> UploadComplete -> InProgress -> JobComplete, taking a few
+    polls to finish. Records inserted before external IDs existed sit in "legacy" until a
+    query finds them (two per page) and an update by Id gives them one; updates by Id can
+    also change a record's external ID.
+    """
+    state = {"records": {}, "inserts": 0, "sent": [], "chunk_sizes": [], "connections": set(), "tokens": [],
+             "fail_once": {"503"}, "token": "Bearer fresh-token", "rotate_on_upload": None, "jobs": {},
+             "legacy": [], "lock": threading.Lock()}
+
+    def upsert(fields):
+        """Returns (id, created), or None when the record is invalid."""
+        current = {**state["records"].get(fields[KEY], {}), **fields}
+        if "@" not in (current.get("Email__c") or ""):
+            return None
+        created = fields[KEY] not in state["records"]
+        if created:
+            state["inserts"] += 1
+            current["Id"] = f"a0{state['inserts']:06d}"
+        state["records"][fields[KEY]] = current
+        return current["Id"], created
+
+    def process(job):
+        job["results"] = {"successfulResults": [], "failedResults": [], "unprocessedrecords": []}
+        for row in csv.DictReader(io.StringIO(job["csv"])):
+            # Empty cells leave a field untouched, #N/A clears it
+            fields = {k: (None if v == "#N/A" else v) for k, v in row.items() if v != ""}
+            state["sent"].append(fields)
+            written = upsert(fields)
+            if written is None:
+                job["results"]["failedResults"].append({"sf__Id": "", "sf__Error": "INVALID_EMAIL_ADDRESS", **row})
+            else:
+                job["results"]["successfulResults"].append(
+                    {"sf__Id": written[0], "sf__Created": str(written[1]).lower(), **row})
+        job.update(state="JobComplete", numberRecordsFailed=len(job["results"]["failedResults"]),
+                   numberRecordsProcessed=sum(map(len, job["results"].values())))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status, body, content_type="application/json"):
+            payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def handle_request(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with state["lock"]:
+                state["connections"].add(self.client_address)
+                state["tokens"].append(self.headers["Authorization"])
+                if self.command == "PUT" and state["rotate_on_upload"]:
+                    state["token"], state["rotate_on_upload"] = state["rotate_on_upload"], None
+                if self.headers["Authorization"] != state["token"]:
+                    return self.reply(401, [{"errorCode": "INVALID_SESSION_ID"}])
+                if "/composite/sobjects/Organization_Contracts__c/Sponsor_Key__c" in self.path:
+                    return self.collection(json.loads(body))
+                if self.path.endswith("/composite/sobjects"):
+                    return self.update_by_id(json.loads(body))
+                if "/query" in self.path:
+                    return self.query(int(self.path.rpartition("-")[2]) if "/query/" in self.path else 0)
+                job_id, _, result_set = self.path.split("/jobs/ingest/")[1].strip("/").partition("/")
+                return self.ingest(job_id, result_set, body)
+
+        do_GET = do_POST = do_PUT = do_PATCH = handle_request
+
+        def collection(self, body):
+            records = body["records"]
+            state["chunk_sizes"].append(len(records))
+            if len(records) > 200 or body["allOrNone"] is not False:
+                return self.reply(400, [{"errorCode": "INVALID_BATCH"}])
+            if any(r.get("Email__c") == "hr@sponsor503.example" for r in records) and "503" in state["fail_once"]:
+                state["fail_once"].discard("503")
+                return self.reply(503, [{"errorCode": "SERVER_UNAVAILABLE"}])
+            results = []
+            for record in records:
+                fields = {k: v for k, v in record.items() if k != "attributes"}
+                state["sent"].append(fields)
+                written = upsert(fields)
+                results.append({"success": False, "errors": [{"statusCode": "INVALID_EMAIL_ADDRESS"}]}
+                               if written is None else {"id": written[0], "success": True, "created": written[1]})
+            self.reply(200, results)
+
+        def query(self, offset):
+            unkeyed = [record for record in state["legacy"] if KEY not in record]
+            done = offset + 2 >= len(unkeyed)
+            page = {"records": unkeyed[offset:offset + 2], "done": done}
+            if not done:
+                page["nextRecordsUrl"] = f"/services/data/v63.0/query/01gCURSOR-{offset + 2}"
+            self.reply(200, page)
+
+        def update_by_id(self, body):
+            results = []
+            for update in body["records"]:
+                record = next(r for r in [*state["records"].values(), *state["legacy"]] if r["Id"] == update["id"])
+                if update[KEY] in state["records"]:
+                    results.append({"id": update["id"], "success": False,
+                                    "errors": [{"statusCode": "DUPLICATE_VALUE"}]})
+                    continue
+                state["records"].pop(record.get(KEY), None)
+                record.update({k: v for k, v in update.items() if k not in ("attributes", "id")})
+                state["records"][update[KEY]] = record
+                results.append({"id": update["id"], "success": True})
+            self.reply(200, results)
+
+        def ingest(self, job_id, result_set, body):
+            if self.command == "POST":
+                job_id = f"750{len(state['jobs']):06d}"
+                state["jobs"][job_id] = {**json.loads(body), "id": job_id, "state": "Open", "polls": 0}
+                return self.reply(200, state["jobs"][job_id])
+            job = state["jobs"][job_id]
+            if self.command == "PUT":
+                if job["state"] != "Open" or self.headers["Content-Type"] != "text/csv":
+                    return self.reply(400, [{"errorCode": "INVALIDJOBSTATE"}])
+                job["csv"] = body.decode()
+                return self.reply(201, "", "text/plain")
+            if self.command == "PATCH":
+                job["state"] = json.loads(body)["state"]
+                return self.reply(200, job)
+            if not result_set:
+                job["polls"] += 1
+                if job["state"] in ("UploadComplete", "InProgress"):
+                    process(job) if job["polls"] >= 3 else job.update(state="InProgress")
+                return self.reply(200, {k: v for k, v in job.items() if k not in ("csv", "results")})
+            rows = job["results"][result_set]
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=list(rows[0]) if rows else [KEY], lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(rows)
+            self.reply(200, out.getvalue(), "text/csv")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/services", state
+    server.shutdown()
+
+
+def test_sync_uploads_chunks_concurrently_and_retries_only_failed_records(salesforce, sync_state, tmp_path,
+                                                                          monkeypatch):
+    monkeypatch.setattr(sync_crm, "SALESFORCE_RETRY_BASE_S", 0.01)
+    url, state = salesforce
+    sponsors = [enriched(i) for i in range(778)]
+    sponsors[42]["email"] = "not-an-email"
+    sponsors[503]["email"] = "hr@sponsor503.example"
+    progress = RecordProgress(str(tmp_path / "sync.jsonl"))
+    refreshes = []
+
+    def refresh():
+        refreshes.append(1)
+        return "fresh-token"
+
+    with SalesforceSession(url, token="expired-token", refresh=refresh, pool_size=4) as session:
+        stats = sync_crm.sync_with_salesforce(sponsors, progress=progress, session=session, state=sync_state)
+
+    assert stats == {"synced": 777, "unchanged": 0, "failed": 1}
+    assert max(state["chunk_sizes"]) <= 200
+    # Every valid sponsor exactly once, despite the 503
+    assert sorted(r["Organization__c"] for r in state["records"].values()) == sorted(
+        s["organization"] for i, s in enumerate(sponsors) if i != 42)
+    assert not progress.is_done(sponsor_key(sponsors[42])) and len(progress) == 777
+    assert progress.result(sponsor_key(sponsors[0])) == state["records"][sync_crm.external_id(sponsors[0])]["Id"]
+    # Chunks that hit the expired token together share one refresh, and all of them went over
+    # the pool's keep-alive connections
+    assert len(refreshes) == 1 and state["tokens"].count("Bearer expired-token") <= 4
+    assert len(state["connections"]) <= 4
+
+    # A rerun with the same progress log only sends the rejected sponsor again
+    with SalesforceSession(url, token="fresh-token", refresh=lambda: "fresh-token") as session:
+        assert sync_crm.sync_with_salesforce(sponsors[:100], progress=progress, session=session,
+                                             state=sync_state) == {"synced": 0, "unchanged": 0, "failed": 1}
+    assert state["chunk_sizes"][-1] == 1
+
+
+def test_resync_sends_only_changed_fields_and_archives_removed_sponsors(salesforce, sync_state):
+    url, state = salesforce
+    sponsors = [enriched(i) for i in range(300)]
+
+    with SalesforceSession(url, token="fresh-token") as session:
+        sync_crm.sync_with_salesforce(sponsors, session=session, state=sync_state)
+        requests_before, sent_before = len(state["chunk_sizes"]), len(state["sent"])
+
+        # Same register with two sponsors changed, plus a row listing a spelling variant of a
+        # third: only the changed fields go out, and the variant (a separate register row) gets
+        # its own record rather than overwriting the other one
+        sponsors[5]["type_rating"] = "Worker (A rating)"
+        sponsors[9]["email"] = "jobs@sponsor9.example"
+        variant = enriched(12, organization="SPONSOR 12 LIMITED")
+        stats = sync_crm.sync_with_salesforce(sponsors + [variant], session=session, state=sync_state)
+
+        assert stats == {"synced": 3, "unchanged": 298, "failed": 0}
+        assert len(state["records"]) == 301 and state["inserts"] == 301
+        assert len(state["chunk_sizes"]) == requests_before + 1
+        assert sorted(state["sent"][sent_before:sent_before + 2], key=lambda fields: fields[KEY]) == sorted([
+            {KEY: sync_crm.external_id(sponsors[5]), "Type_Rating__c": "Worker (A rating)"},
+            {KEY: sync_crm.external_id(sponsors[9]), "Email__c": "jobs@sponsor9.example"},
+        ], key=lambda fields: fields[KEY])
+        assert state["sent"][-1][KEY] == sync_crm.external_id(variant) != sync_crm.external_id(sponsors[12])
+
+        # Sponsors that left the register (raw register rows) are archived in one request, once;
+        # the variant's removal leaves the still-listed row active
+        removed = [{"Organisation Name": f"Sponsor {i} Ltd", "Route": "Skilled Worker"} for i in range(250, 300)]
+        removed.append({"Organisation Name": "SPONSOR 12 LIMITED", "Route": "Skilled Worker"})
+        removed.append({"Organisation Name": "Never Synced Ltd", "Route": "Skilled Worker"})
+        assert sync_crm.archive_removed_sponsors(removed, session=session, state=sync_state) == {
+            "archived": 51, "unchanged": 0, "failed": 0, "unknown": 1}
+        assert all(set(fields) == {KEY, "Status__c"} for fields in state["sent"][-51:])
+        assert sync_crm.archive_removed_sponsors(removed, session=session, state=sync_state)["unchanged"] == 51
+        assert len(state["chunk_sizes"]) == requests_before + 2
+        assert state["records"][sync_crm.external_id(sponsors[260])]["Status__c"] == "Archived"
+        assert state["records"][sync_crm.external_id(variant)]["Status__c"] == "Archived"
+        assert state["records"][sync_crm.external_id(sponsors[12])]["Status__c"] == "Active"
+        assert state["records"][sync_crm.external_id(sponsors[0])]["Status__c"] == "Active"
+
+        # A re-listed sponsor is reactivated by sending its status alone
+        assert sync_crm.sync_with_salesforce(sponsors[260:261], session=session, state=sync_state)["synced"] == 1
+    assert state["sent"][-1] == {KEY: sync_crm.external_id(sponsors[260]), "Status__c": "Active"}
+
+
+def test_renamed_sponsors_keep_their_record_under_the_new_external_id(salesforce, sync_state):
+    url, state = salesforce
+    sponsors = [enriched(i) for i in range(3)]
+
+    with SalesforceSession(url, token="fresh-token") as session:
+        sync_crm.sync_with_salesforce(sponsors, session=session, state=sync_state)
+        record_id = state["records"][sync_crm.external_id(sponsors[1])]["Id"]
+
+        renamed = [{"Organisation Name": "Sponsor 1 Services Limited", "Route": "Skilled Worker",
+                    "Previous Organisation Name": "Sponsor 1 Ltd"},
+                   {"Organisation Name": "Never Synced Limited", "Route": "Skilled Worker",
+                    "Previous Organisation Name": "Never Synced Ltd"}]
+        assert sync_crm.rename_sponsors(renamed, session=session, state=sync_state) == {
+            "renamed": 1, "failed": 0, "unknown": 1}
+
+        new_key = sync_crm.external_id(renamed[0])
+        assert sync_crm.external_id(sponsors[1]) not in state["records"]
+        assert state["records"][new_key]["Id"] == record_id
+        assert state["records"][new_key]["Organization__c"] == "Sponsor 1 Services Limited"
+        # The sync state followed: the new name is already in sync, and the old name is gone
+        sponsors[1]["organization"] = "Sponsor 1 Services Limited"
+        assert sync_crm.sync_with_salesforce(sponsors, session=session, state=sync_state)["unchanged"] == 3
+        removed = [{"Organisation Name": "Sponsor 1 Ltd", "Route": "Skilled Worker"}]
+        assert sync_crm.archive_removed_sponsors(removed, session=session, state=sync_state)["unknown"] == 1
+    assert state["inserts"] == 3
+
+
+def test_backfill_keys_records_synced_before_external_ids(salesforce, sync_state):
+    from crm.backfill_external_ids import backfill_external_ids
+
+    url, state = salesforce
+    sponsors = [enriched(i, enriched=True) for i in range(5)]
+    # The old sync inserted records without an external ID or status, and inserted Sponsor 0 twice
+    for position, sponsor in enumerate(sponsors + sponsors[:1]):
+        fields = sync_crm.record_fields(sync_crm.build_salesforce_records([sponsor])[0])
+        del fields[KEY], fields["Status__c"]
+        state["legacy"].append({"Id": f"a0L{position:06d}", **fields})
+
+    with SalesforceSession(url, token="fresh-token") as session:
+        assert backfill_external_ids(session=session, state=sync_state) == {
+            "backfilled": 5, "duplicates": 1, "failed": 0}
+        assert state["records"][sync_crm.external_id(sponsors[0])]["Id"] == "a0L000000"
+        assert KEY not in state["legacy"][5]
+
+        # The next sync updates the keyed records in place, sending only what changed
+        sponsors[1]["email"] = "jobs@sponsor1.example"
+        sent_before = len(state["sent"])
+        assert sync_crm.sync_with_salesforce(sponsors, session=session, state=sync_state)["synced"] == 5
+        assert state["inserts"] == 0
+        assert state["sent"][sent_before:] == [
+            {KEY: sync_crm.external_id(sponsor), "Status__c": "Active",
+             **({"Email__c": "jobs@sponsor1.example"} if position == 1 else {})}
+            for position, sponsor in enumerate(sponsors)]
+
+        # ... and archiving finds them
+        removed = [{"Organisation Name": "Sponsor 3 Ltd", "Route": "Skilled Worker"}]
+        assert sync_crm.archive_removed_sponsors(removed, session=session, state=sync_state)["archived"] == 1
+        assert state["records"][sync_crm.external_id(sponsors[3])]["Status__c"] == "Archived"
+
+        # Running it again finds only the duplicate, which stays unkeyed
+        assert backfill_external_ids(session=session, state=sync_state) == {
+            "backfilled": 0, "duplicates": 1, "failed": 0}
+
+
+def test_large_syncs_go_through_bulk_api_jobs(salesforce, sync_state, monkeypatch):
+    from crm.bulk_api import bulk_ingest
+
+    monkeypatch.setattr("crm.bulk_api.SALESFORCE_BULK_POLL_S", 0.01)
+    monkeypatch.delenv("SALESFORCE_BULK_THRESHOLD", raising=False)
+    url, state = salesforce
+    sponsors = [enriched(i, enriched=True) for i in range(2500)]
+    sponsors[7]["email"] = None
+    # The token expires mid-upload: the CSV must be sent again from the start
+    state["rotate_on_upload"] = "Bearer rotated-token"
+
+    with SalesforceSession(url, token="fresh-token", refresh=lambda: "rotated-token") as session:
+        stats = sync_crm.sync_with_salesforce(sponsors, session=session, state=sync_state)
+        assert stats == {"synced": 2499, "unchanged": 0, "failed": 1}
+        assert state["chunk_sizes"] == [] and len(state["jobs"]) == 1
+        job = next(iter(state["jobs"].values()))
+        assert (job["object"], job["operation"], job["externalIdFieldName"], job["state"]) == (
+            "Organization_Contracts__c", "upsert", KEY, "JobComplete")
+        assert job["polls"] == 3 and len(job["csv"].splitlines()) == 2501
+        assert state["tokens"].count("Bearer fresh-token") == 2
+        assert state["records"][sync_crm.external_id(sponsors[0])]["Enriched__c"] == "true"
+        assert state["sent"][7]["Email__c"] is None
+
+        # A sync larger than one job's upload limit is split across jobs
+        records = [sync_crm.record_fields(r) for r in sync_crm.build_salesforce_records(sponsors[:1000])]
+        results = bulk_ingest(session, records, operation="upsert", external_id_field=KEY, max_job_bytes=40_000)
+    split = list(state["jobs"].values())[1:]
+    assert len(split) > 2 and all(len(j["csv"]) <= 40_000 for j in split)
+    assert len(results["successful"]) == 999 and results["failed"][0]["sf__Error"] == "INVALID_EMAIL_ADDRESS"
+    assert len(state["records"]) == 2499
+
+
+def test_bulk_ingest_keeps_other_jobs_when_one_cannot_be_polled(salesforce, monkeypatch):
+    import requests
+    from crm.bulk_api import BulkIngestJob, bulk_ingest
+
+    monkeypatch.setattr("crm.bulk_api.SALESFORCE_BULK_POLL_S", 0.01)
+    url, state = salesforce
+    poll = BulkIngestJob.poll
+
+    def poll_dropping_first_job(job):
+        if job.id == "750000000":
+            raise requests.ConnectionError("Connection reset by peer")
+        return poll(job)
+
+    monkeypatch.setattr(BulkIngestJob, "poll", poll_dropping_first_job)
+    records = [sync_crm.record_fields(r) for r in sync_crm.build_salesforce_records([enriched(i) for i in range(1000)])]
+    with SalesforceSession(url, token="fresh-token") as session:
+        results = bulk_ingest(session, records, operation="upsert", external_id_field=KEY, max_job_bytes=40_000)
+
+    jobs = list(state["jobs"].values())
+    assert len(jobs) > 2 and jobs[0]["state"] != "JobComplete"
+    assert len(results["successful"]) == 1000 - (len(jobs[0]["csv"].splitlines()) - 1) and not results["failed"]
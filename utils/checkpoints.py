@@ -0,0 +1,162 @@
+# utils/checkpoints.py
+
+"""
+Checkpoints for resumable pipeline runs.
+Each stage's output is saved under data/temp/checkpoints/<run_id>/ together with a hash
+of the stage's input; a rerun with the same input picks the output up instead of
+recomputing it. Long record-by-record stages (enrich, outreach, sync) also keep an
+append-only progress log, so a crash at record 600 of 778 resumes at record 601.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from config.constants import CHECKPOINT_DIR, CHECKPOINT_KEEP_RUNS, ORGANIZATION_NAME
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+
+def sponsor_key(record: Dict) -> str:
+    """
+    Stable key of a sponsor record, for both raw register rows and enriched dicts.
+    """
+    organization = record.get(ORGANIZATION_NAME, record.get("organization", ""))
+    route = record.get("Route", record.get("route", ""))
+    return f"{organization}|{route}"
+
+
+def hash_records(records: Iterable[Dict]) -> str:
+    """
+    Order-insensitive hash of a list of sponsor records, used as a stage input hash.
+    """
+    sha256 = hashlib.sha256()
+    for key in sorted(sponsor_key(record) for record in records):
+        sha256.update(key.encode("utf-8"))
+        sha256.update(b"\n")
+    return sha256.hexdigest()
+
+
+class RecordProgress:
+    """
+    Append-only log of records a stage has finished, with their results.
+    Each completed record is flushed to disk immediately.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.results: Dict[str, Any] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write; everything before it is valid
+                        continue
+                    self.results[entry["key"]] = entry.get("result")
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def is_done(self, key: str) -> bool:
+        return key in self.results
+
+    def result(self, key: str) -> Any:
+        return self.results.get(key)
+
+    def mark_done(self, key: str, result: Any = None):
+        self.results[key] = result
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "result": result}, default=str) + "\n")
+            f.flush()
+
+
+class CheckpointStore:
+    """
+    Stage outputs of one pipeline run, keyed by stage name and input hash.
+    """
+
+    def __init__(self, run_id: str, base_dir: Optional[str] = None):
+        self.run_id = run_id
+        self.base_dir = base_dir or CHECKPOINT_DIR
+        self.run_dir = os.path.join(self.base_dir, run_id)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.run_dir, "manifest.json")
+        self.manifest = self._read_json(self.manifest_path) or {}
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Any]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, path: str, data: Any):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+
+    def is_complete(self, stage: str, input_hash: str) -> bool:
+        entry = self.manifest.get(stage)
+        return bool(entry) and entry.get("input_hash") == input_hash
+
+    def load(self, stage: str, input_hash: str) -> Optional[Any]:
+        """
+        Return the saved output of a stage, or None if it's missing or was produced from a different input.
+        """
+        if not self.is_complete(stage, input_hash):
+            return None
+        logger.info(f"♻️ Resuming stage '{stage}' from checkpoint ({self.run_id})")
+        return self._read_json(os.path.join(self.run_dir, f"{stage}.json"))
+
+    def save(self, stage: str, input_hash: str, output: Any):
+        """
+        Save a stage's JSON-serialisable output, then mark the stage complete.
+        """
+        self._write_json(os.path.join(self.run_dir, f"{stage}.json"), output)
+        self.manifest[stage] = {"input_hash": input_hash, "completed_at": datetime.now().isoformat(timespec="seconds")}
+        self._write_json(self.manifest_path, self.manifest)
+
+    def load_frames(self, stage: str, input_hash: str) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Load a dict of DataFrames saved with save_frames().
+        """
+        output = self.load(stage, input_hash)
+        if output is None:
+            return None
+        return {name: pd.DataFrame(records, columns=columns) for name, (columns, records) in output.items()}
+
+    def save_frames(self, stage: str, input_hash: str, frames: Dict[str, pd.DataFrame]):
+        """
+        Save a dict of (small) DataFrames, such as the register diff, as a stage output.
+        """
+        self.save(stage, input_hash, {
+            name: (list(frame.columns), frame.to_dict(orient="records")) for name, frame in frames.items()
+        })
+
+    def progress(self, stage: str) -> RecordProgress:
+        """
+        Record-level progress log for a stage of this run.
+        """
+        return RecordProgress(os.path.join(self.run_dir, f"{stage}.progress.jsonl"))
+
+    def prune(self, keep: Optional[int] = None) -> List[str]:
+        """
+        Delete checkpoint directories of all but the `keep` most recently written runs.
+        Returns the removed run ids.
+        """
+        keep = keep if keep is not None else CHECKPOINT_KEEP_RUNS
+        runs = sorted((d for d in os.listdir(self.base_dir) if os.path.isdir(os.path.join(self.base_dir, d))),
+                      key=lambda d: os.path.getmtime(os.path.join(self.base_dir, d)))
+        removed = [run for run in runs[:-keep] if run != self.run_id] if keep else []
+        for run in removed:
+            shutil.rmtree(os.path.join(self.base_dir, run), ignore_errors=True)
+        return removed
@@ -0,0 +1,68 @@
+# utils/rate_limit.py
+
+"""
+Rate limiting and retry helpers shared by the enrichment, outreach and CRM clients.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Optional
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """
+    "Full jitter" exponential backoff: a random delay in [0, min(cap, base * 2**attempt)].
+    Spreading retries out stops clients that failed together from retrying together.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` operations per second with bursts of up to `capacity`.
+
+    Callers reserve tokens and are told how long to wait for them, so the same bucket
+    can be shared by threads (acquire) and coroutines (acquire_async).
+    A rate of 0 or None means unlimited.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        self.rate = rate or 0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take `tokens` from the bucket and return the seconds to wait before using them.
+        """
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for `seconds`, e.g. after the server answered 429 with Retry-After.
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
@@ -0,0 +1,211 @@
+# utils/tracing.py
+
+"""
+Per-stage tracing and resource instrumentation for pipeline runs.
+Each stage records wall time, CPU time, peak RSS, rows in/out and throughput; the run
+is written as a structured JSON report under data/logs/runs. Any stage can optionally be
+profiled with pyinstrument (if installed) or cProfile.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.constants import RUN_REPORT_DIR, PROFILE_DIR
+
+logger = logging.getLogger("uk_sponsor_pipeline")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the kernel's peak-RSS watermark (Linux only) so the next reading covers one stage.
+    Returns False when the platform doesn't support it.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size in MB: VmHWM from /proc when available (resettable per stage),
+    otherwise the process-lifetime maximum from getrusage. None on platforms with neither.
+    """
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+class StageTrace:
+    """
+    Measurements for one pipeline stage. rows_in / rows_out can be set inside the stage.
+    """
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.status = "running"
+        self.error = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.peak_rss_scope = None
+        self.profile_path = None
+
+    @property
+    def rows_per_s(self) -> Optional[float]:
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if rows is None or not self.wall_s:
+            return None
+        return round(rows / self.wall_s, 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.name,
+            "status": self.status,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_scope": self.peak_rss_scope,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": self.rows_per_s,
+            "profile": self.profile_path,
+            "error": self.error,
+        }
+
+
+class RunTracer:
+    """
+    Collects StageTrace records for one pipeline run and writes the JSON run report.
+
+    Stages listed in `profile_stages` (default: the comma-separated PIPELINE_PROFILE_STAGES
+    environment variable, "*" for all) are profiled; the profile is written to PROFILE_DIR.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, report_dir: str = RUN_REPORT_DIR,
+                 profile_stages: Optional[List[str]] = None):
+        self.run_id = run_id or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.report_dir = report_dir
+        if profile_stages is None:
+            profile_stages = [s.strip() for s in os.getenv("PIPELINE_PROFILE_STAGES", "").split(",") if s.strip()]
+        self.profile_stages = set(profile_stages)
+        self.stages: List[StageTrace] = []
+        self.started_at = datetime.now()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def should_profile(self, name: str) -> bool:
+        return "*" in self.profile_stages or name in self.profile_stages
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        """
+        Context manager measuring one stage. Yields the StageTrace so the caller can set rows_out.
+        """
+        trace = StageTrace(name, rows_in)
+        self.stages.append(trace)
+        profiler = self.start_profiler(name)
+        resettable = reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        try:
+            yield trace
+            trace.status = "ok"
+        except Exception as e:
+            trace.status = "failed"
+            trace.error = str(e)
+            raise
+        finally:
+            trace.wall_s = round(time.perf_counter() - wall_start, 4)
+            trace.cpu_s = round(time.process_time() - cpu_start, 4)
+            trace.peak_rss_mb = peak_rss_mb()
+            # Without a resettable watermark the reading is the process-lifetime peak
+            trace.peak_rss_scope = "stage" if resettable else "process"
+            trace.profile_path = self.stop_profiler(profiler, name)
+            logger.info(
+                f"⏱️ Stage '{name}' {trace.status} in {trace.wall_s:.2f}s "
+                f"(cpu {trace.cpu_s:.2f}s, peak RSS {trace.peak_rss_mb} MB, "
+                f"rows {trace.rows_in} → {trace.rows_out})"
+            )
+
+    def start_profiler(self, name: str):
+        if not self.should_profile(name):
+            return None
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, name: str) -> Optional[str]:
+        if profiler is None:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if Profiler is not None and isinstance(profiler, Profiler):
+            profiler.stop()
+            path = os.path.join(PROFILE_DIR, f"{self.run_id}-{name}.html")
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            path = os.path.join(PROFILE_DIR, f"{self.run_id}-{name}.prof")
+            profiler.dump_stats(path)
+        logger.info(f"🔬 Profile for stage '{name}' written to {path}")
+        return path
+
+    def report(self, status: str) -> Dict:
+        return {
+            "run_id": self.run_id,
+            "status": status,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self.start_wall, 4),
+            "cpu_s": round(time.process_time() - self.start_cpu, 4),
+            "peak_rss_mb": max((s.peak_rss_mb for s in self.stages if s.peak_rss_mb is not None), default=None),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def write_report(self, status: str) -> str:
+        """
+        Write the run report as JSON and return its path.
+        """
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"run_report_{self.run_id}.json")
+        with open(path, "w") as f:
+            json.dump(self.report(status), f, indent=2, default=str)
+        logger.info(f"📝 Run report written to {path}")
+        return path